@@ -0,0 +1,180 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Space taken by hosted-engine on its storage domain."""
+
+
+import gettext
+
+
+from otopi import base
+from otopi import util
+
+
+from . import constants as ohostedcons
+from . import domains as ohosteddomains
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-hosted-engine-setup')
+
+
+MiB = pow(2, 20)
+GiB = pow(2, 30)
+
+# VDSM allocates the logical volumes of block storage domains in extents
+# of this size
+BLOCK_EXTENT_SIZE = 128 * MiB
+
+DEFAULT_BLOCKSIZE = 512
+
+
+@util.export
+def lockspace_size(blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Return the size of the sanlock lockspace volume, 1MB is good for 2000
+    clients when the block size is 512B.
+    """
+    return MiB * blocksize // DEFAULT_BLOCKSIZE
+
+
+@util.export
+def metadata_size():
+    """
+    Return the size needed to store metadata for all hosts and for the
+    global cluster state.
+    """
+    return ohostedcons.Const.METADATA_CHUNK_SIZE * (
+        ohostedcons.Const.MAX_HOST_ID + 1
+    )
+
+
+@util.export
+class Plan(base.Base):
+    """
+    The volumes hosted-engine creates on its storage domain and the
+    space they take there.
+    Volumes whose size is still unknown are left out of the plan, the VM
+    image takes space upfront only on block domains where it is
+    preallocated: on file domains it is sparse.
+    """
+
+    def __init__(
+        self,
+        domain_type,
+        image_size_gb=None,
+        conf_image_size_gb=None,
+        blocksize=DEFAULT_BLOCKSIZE,
+    ):
+        super(Plan, self).__init__()
+        self.block = domain_type in (
+            ohostedcons.DomainTypes.ISCSI,
+            ohostedcons.DomainTypes.FC,
+        )
+        self.image_size = (
+            int(image_size_gb) * GiB if image_size_gb is not None
+            else None
+        )
+        self.volumes = [
+            (_('sanlock lockspace'), lockspace_size(blocksize)),
+            (_('hosted-engine metadata'), metadata_size()),
+        ]
+        if conf_image_size_gb is not None:
+            self.volumes.append(
+                (
+                    _('configuration image'),
+                    int(conf_image_size_gb) * GiB,
+                )
+            )
+
+    def footprint(self, size):
+        """
+        Return the space a volume of size bytes takes on the domain.
+        """
+        if self.block:
+            size = -(-size // BLOCK_EXTENT_SIZE) * BLOCK_EXTENT_SIZE
+        return size
+
+    def _reserved(self, new_domain):
+        reserved = sum(self.footprint(size) for name, size in self.volumes)
+        if new_domain and self.block:
+            # the metadata volumes of the storage domain itself
+            reserved += ohostedcons.Const.STORAGE_DOMAIN_OVERHEAD_GIB * GiB
+        return reserved
+
+    def required(self, new_domain=True):
+        """
+        Return the bytes needed by all the volumes of the plan, including
+        the storage domain overhead and minimum size if the domain has
+        still to be created.
+        """
+        required = self._reserved(new_domain)
+        if self.block and self.image_size is not None:
+            required += self.footprint(self.image_size)
+        if new_domain:
+            required = max(
+                required,
+                ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB * MiB,
+            )
+        return required
+
+    def max_image_size_gb(self, available, new_domain=True):
+        """
+        Return the largest VM disk size in GiB fitting in available bytes
+        along with the other volumes, None if the VM image is sparse.
+        """
+        if not self.block:
+            return None
+        return max(
+            int(available - self._reserved(new_domain)) // GiB,
+            0
+        )
+
+    def check(self, available, where, new_domain=True):
+        """
+        Raise InsufficientSpaceError unless all the volumes of the plan
+        fit in available bytes of where.
+        """
+        for name, size in self.volumes + [
+            (_('VM image'), self.image_size if self.block else None),
+        ]:
+            if size is not None:
+                self.logger.debug(
+                    '{name}: {size} bytes, {footprint} bytes allocated'.format(
+                        name=name,
+                        size=size,
+                        footprint=self.footprint(size),
+                    )
+                )
+        required = self.required(new_domain)
+        if int(available) < required:
+            raise ohosteddomains.InsufficientSpaceError(
+                _(
+                    'Error: {where} has only {available}MiB of available '
+                    'space while {required}MiB are required'
+                ).format(
+                    where=where,
+                    available=int(available) // MiB,
+                    required=-(-required // MiB),
+                )
+            )
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,137 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""cloud-init user-data model and YAML emitter."""
+
+
+import collections
+import re
+
+
+from otopi import util
+
+
+# strings that can be emitted as YAML plain scalars as they are
+_PLAIN_RE = re.compile(r'^[A-Za-z0-9_./][^\n:#\'"]*(?<! )$')
+_RESERVED_RE = re.compile(
+    r'^(~|null|true|false|yes|no|on|off|y|n|[-+]?[0-9][0-9_.:eE+-]*)$',
+    re.IGNORECASE,
+)
+
+
+def _scalar(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if not isinstance(value, basestring):
+        return '%s' % value
+    if _PLAIN_RE.match(value) and not _RESERVED_RE.match(value):
+        return value
+    return "'%s'" % value.replace("'", "''")
+
+
+def _node(prefix, value, indent):
+    """
+    Return the lines of value following prefix, a mapping key or a
+    sequence dash; nested nodes are indented by indent.
+    """
+    if isinstance(value, (dict, list)):
+        if not value:
+            return [
+                '%s %s' % (prefix, '{}' if isinstance(value, dict) else '[]')
+            ]
+        lines = _emit(value, indent)
+        if prefix.endswith('-'):
+            # compact form: the first entry on the dash line
+            return ['%s %s' % (prefix, lines[0].lstrip())] + lines[1:]
+        return [prefix] + lines
+    if isinstance(value, basestring) and '\n' in value:
+        body = value[:-1] if value.endswith('\n') else value
+        header = '|' if value.endswith('\n') else '|-'
+        if body.startswith(' '):
+            header += '2'
+        return ['%s %s' % (prefix, header)] + [
+            ' ' * indent + line if line else ''
+            for line in body.split('\n')
+        ]
+    return ['%s %s' % (prefix, _scalar(value))]
+
+
+def _emit(value, indent):
+    lines = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            lines.extend(
+                _node(
+                    '%s%s:' % (' ' * indent, key),
+                    item,
+                    indent + 2,
+                )
+            )
+    else:
+        for item in value:
+            lines.extend(_node('%s-' % (' ' * indent), item, indent + 2))
+    return lines
+
+
+@util.export
+class CloudConfig(object):
+    """
+    cloud-init #cloud-config user-data document.
+    Modules are emitted in the order they are first set.
+    """
+
+    HEADER = (
+        '#cloud-config\n'
+        '# vim: syntax=yaml\n'
+    )
+
+    def __init__(self):
+        super(CloudConfig, self).__init__()
+        self._modules = collections.OrderedDict()
+
+    def set(self, module, value):
+        self._modules[module] = value
+
+    def _append(self, module, value):
+        self._modules.setdefault(module, []).append(value)
+
+    def bootcmd(self, command):
+        self._append('bootcmd', command)
+
+    def runcmd(self, command):
+        self._append('runcmd', command)
+
+    def write_file(self, path, content, owner=None, permissions=None):
+        entry = collections.OrderedDict()
+        entry['content'] = content
+        entry['path'] = path
+        if owner is not None:
+            entry['owner'] = owner
+        if permissions is not None:
+            entry['permissions'] = permissions
+        self._append('write_files', entry)
+
+    def render(self):
+        if not self._modules:
+            return self.HEADER
+        return self.HEADER + '\n'.join(_emit(self._modules, 0)) + '\n'
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
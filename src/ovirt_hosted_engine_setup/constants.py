@@ -160,6 +160,7 @@ class FileLocations(object):
         'glusterfs',
         'glusterd.vol'
     )
+    GLUSTERD_GROUPS_DIR = '/var/lib/glusterd/groups'
     OVIRT_APPLIANCES_DESC_DIR = os.path.join(
         config.SYSCONFDIR,
         OVIRT_HOSTED_ENGINE,
@@ -369,6 +370,9 @@ class CoreEnv(object):
     ADDITIONAL_HOST_ENABLED = 'OVEHOSTED_CORE/additionalHostEnabled'
     IS_ADDITIONAL_HOST = 'OVEHOSTED_CORE/isAdditionalHost'
     TEMPDIR = 'OVEHOSTED_CORE/tempDir'
+    PROFILE = 'OVEHOSTED_CORE/profile'
+    PRE_VALIDATIONS = 'OVEHOSTED_CORE/preValidations'
+    VALIDATED = 'OVEHOSTED_CORE/validated'
 
     @ohostedattrs(
         answerfile=True,
@@ -448,6 +452,8 @@ class NetworkEnv(object):
         return 'OVEHOSTED_NETWORK/sshdPort'
 
     PROMPT_REQUIRED_NETWORKS = 'OVEHOSTED_NETWORK/promptRequiredNetworks'
+    NETWORK_SNAPSHOT = 'OVEHOSTED_NETWORK/networkSnapshot'
+    BRIDGE_SETUP_TASKS = 'OVEHOSTED_NETWORK/bridgeSetupTasks'
 
 
 @util.export
@@ -526,6 +532,8 @@ class StorageEnv(object):
 
     FAKE_MASTER_SD_UUID = 'OVEHOSTED_STORAGE/fakeMasterSdUUID'
     FAKE_MASTER_SD_CONNECTION_UUID = 'OVEHOSTED_STORAGE/fakeMasterSdConnUUID'
+    SERVER_CONNECTIONS = 'OVEHOSTED_STORAGE/serverConnections'
+    ISCSI_PORTALS = 'OVEHOSTED_STORAGE/iSCSIPortals'
 
     @ohostedattrs(
         answerfile=True,
@@ -660,6 +668,7 @@ class StorageEnv(object):
     ISCSI_PASSWORD = 'OVEHOSTED_STORAGE/iSCSIPortalPassword'
 
     BDEVICE_SIZE_GB = 'OVEHOSTED_STORAGE/blockDeviceSizeGB'
+    AVAILABLE_SPACE_MB = 'OVEHOSTED_STORAGE/availableSpaceMB'
 
     @ohostedattrs(
         answerfile=True,
@@ -870,6 +879,7 @@ class VDSMEnv(object):
     VDSM_UID = 'OVEHOSTED_VDSM/vdsmUid'
     KVM_GID = 'OVEHOSTED_VDSM/kvmGid'
     VDS_CLI = 'OVEHOSTED_VDSM/vdscli'
+    CAPABILITIES_SNAPSHOT = 'OVEHOSTED_VDSM/capabilitiesSnapshot'
     GLUSTER_MINIMUM_VERSION = 'OVEHOSTED_VDSM/glusterMinimumVersion'
 
     @ohostedattrs(
@@ -958,6 +968,7 @@ class Stages(object):
     CONFIG_CLOUD_INIT_VM_NETWORKING = \
         'ohosted.boot.configuration.cloud_init_vm_networking'
     REQUIRE_ANSWER_FILE = 'ohosted.core.require.answerfile'
+    PRE_VALIDATION = 'ohosted.core.answers.prevalidated'
     CONFIG_OVF_IMPORT = 'ohosted.configuration.ovf'
     VDSMD_START = 'ohosted.vdsm.started'
     VDSMD_PKI = 'ohosted.vdsm.pki.available'
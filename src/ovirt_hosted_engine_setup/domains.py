@@ -101,9 +101,9 @@ class DomainChecker(base.Base):
                 )
             )
 
-    def check_available_space(self, path, minimum):
+    def get_available_space(self, path):
         """
-        Ensure it is large enough for containing an image
+        Return the space available on path in Mb
         """
         base_path = self.get_base_path(path)
         self.logger.debug(
@@ -117,6 +117,14 @@ class DomainChecker(base.Base):
                 space=available_space_mb
             )
         )
+        return available_space_mb
+
+    def check_available_space(self, path, minimum):
+        """
+        Ensure it is large enough for containing an image
+        """
+        base_path = self.get_base_path(path)
+        available_space_mb = self.get_available_space(base_path)
         if available_space_mb < minimum:
             raise InsufficientSpaceError(
                 _(
@@ -0,0 +1,161 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Engine REST API session."""
+
+
+import contextlib
+import time
+
+
+from otopi import base
+from otopi import util
+
+
+@util.export
+class EngineSession(base.Base):
+    """
+    A single authenticated session against the engine REST API.
+    The session cookie is kept (persistent_auth) so every request after the
+    first one reuses the same authenticated, keep-alive connection.
+    Clusters are cached since they are looked up several times while
+    adding a host; every request done through the session is timed.
+    """
+
+    def __init__(
+        self,
+        fqdn,
+        password,
+        ca_file=None,
+        insecure=False,
+        username='admin@internal',
+    ):
+        super(EngineSession, self).__init__()
+        self._url = 'https://{fqdn}/ovirt-engine/api'.format(fqdn=fqdn)
+        self._username = username
+        self._password = password
+        self._ca_file = ca_file
+        self._insecure = insecure
+        self._api = None
+        self._clusters = None
+        self._timings = []
+
+    @property
+    def api(self):
+        if self._api is None:
+            raise RuntimeError('Engine session is not connected')
+        return self._api
+
+    @contextlib.contextmanager
+    def timed(self, request):
+        """
+        Time a request done against the engine.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            self._timings.append((request, elapsed))
+            self.logger.debug(
+                'Engine request {request} took {elapsed:.3f}s'.format(
+                    request=request,
+                    elapsed=elapsed,
+                )
+            )
+
+    def timings(self):
+        """
+        Return a list of (request, seconds) tuples in request order.
+        """
+        return list(self._timings)
+
+    def connect(self):
+        """
+        Authenticate against the engine.
+        Building the API object already fetches the API entry point, so
+        wrong credentials are reported here by a RequestError.
+        The cluster list is fetched once and cached.
+        """
+        import ovirtsdk.api
+
+        with self.timed('login'):
+            self._api = ovirtsdk.api.API(
+                url=self._url,
+                username=self._username,
+                password=self._password,
+                ca_file=self._ca_file,
+                insecure=self._insecure,
+                persistent_auth=True,
+            )
+        self.clusters(refresh=True)
+
+    def clusters(self, refresh=False):
+        """
+        Return the cached list of clusters.
+        """
+        if self._clusters is None or refresh:
+            with self.timed('clusters.list'):
+                clusters = self.api.clusters.list()
+            self._clusters = dict(
+                (c.get_name(), c) for c in clusters
+            )
+        return list(self._clusters.values())
+
+    def cluster_names(self):
+        return [c.get_name() for c in self.clusters()]
+
+    def cluster(self, name, refresh=False):
+        """
+        Return a cluster by name, fetching it from the engine only when it
+        is not cached yet or when refresh is requested.
+        """
+        self.clusters()
+        if refresh or name not in self._clusters:
+            with self.timed('clusters.get'):
+                cluster = self.api.clusters.get(name)
+            if cluster is None:
+                self._clusters.pop(name, None)
+            else:
+                self._clusters[name] = cluster
+        return self._clusters.get(name)
+
+    def host(self, name):
+        with self.timed('hosts.get'):
+            return self.api.hosts.get(name)
+
+    def disconnect(self):
+        if self._api is not None:
+            try:
+                with self.timed('logout'):
+                    self._api.disconnect()
+            finally:
+                self._api = None
+                self._clusters = None
+        if self._timings:
+            self.logger.debug(
+                '{count} engine requests took {total:.3f}s'.format(
+                    count=len(self._timings),
+                    total=sum(t for r, t in self._timings),
+                )
+            )
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
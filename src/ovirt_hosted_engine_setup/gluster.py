@@ -0,0 +1,220 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""GlusterFS volume topology."""
+
+
+import threading
+import xml.etree.ElementTree
+
+
+from otopi import util
+
+
+STATUS_STARTED = 1
+
+
+@util.export
+class GlusterError(RuntimeError):
+    """
+    Raised when gluster reports a failure, code is its errno.
+    """
+
+    def __init__(self, code, message):
+        super(GlusterError, self).__init__(message)
+        self.code = code
+
+
+@util.export
+class Brick(object):
+
+    def __init__(self, name=None, host_uuid=None):
+        super(Brick, self).__init__()
+        self.name = name
+        self.host_uuid = host_uuid
+
+
+@util.export
+class Volume(object):
+
+    def __init__(self):
+        super(Volume, self).__init__()
+        self.name = None
+        self.status = None
+        self.status_str = None
+        self.replica_count = None
+        self.bricks = []
+        self.options = {}
+
+    @property
+    def host_uuids(self):
+        return set(brick.host_uuid for brick in self.bricks)
+
+    @property
+    def started(self):
+        return self.status == STATUS_STARTED
+
+
+class _VolumeInfoTarget(object):
+    """
+    ElementTree parser target building the Volume list of a
+    'gluster --xml volume info' output as its elements are closed,
+    without keeping the document tree.
+    """
+
+    _VOLUME = ('cliOutput', 'volInfo', 'volumes', 'volume')
+    _BRICK = _VOLUME + ('bricks', 'brick')
+    _OPTION = _VOLUME + ('options', 'option')
+
+    def __init__(self):
+        self._path = []
+        self._text = []
+        self._option = {}
+        self.op_ret = None
+        self.op_errno = None
+        self.op_errstr = ''
+        self.volumes = []
+
+    def start(self, tag, attrib):
+        self._path.append(tag)
+        self._text = []
+        path = tuple(self._path)
+        if path == self._VOLUME:
+            self.volumes.append(Volume())
+        elif path == self._BRICK:
+            self.volumes[-1].bricks.append(Brick())
+        elif path == self._OPTION:
+            self._option = {}
+
+    def data(self, data):
+        self._text.append(data)
+
+    def end(self, tag):
+        path = tuple(self._path)
+        parent = path[:-1]
+        text = ''.join(self._text).strip()
+        self._text = []
+        if parent == ('cliOutput',):
+            if tag == 'opRet':
+                self.op_ret = int(text)
+            elif tag == 'opErrno':
+                self.op_errno = int(text) if text else 0
+            elif tag == 'opErrstr':
+                self.op_errstr = text
+        elif parent == self._VOLUME:
+            volume = self.volumes[-1]
+            if tag == 'name':
+                volume.name = text
+            elif tag == 'status':
+                volume.status = int(text)
+            elif tag == 'statusStr':
+                volume.status_str = text
+            elif tag == 'replicaCount':
+                volume.replica_count = int(text)
+        elif parent == self._BRICK:
+            brick = self.volumes[-1].bricks[-1]
+            if tag == 'name':
+                brick.name = text
+            elif tag == 'hostUuid':
+                brick.host_uuid = text
+        elif parent == self._OPTION:
+            self._option[tag] = text
+        elif path == self._OPTION:
+            self.volumes[-1].options[
+                self._option.get('name')
+            ] = self._option.get('value')
+        self._path.pop()
+
+    def close(self):
+        return self.volumes
+
+
+@util.export
+def parse_volume_info(chunks):
+    """
+    Return the Volume list out of the chunks of a
+    'gluster --xml volume info' output, parsed as they come.
+    Raise GlusterError if gluster reported a failure.
+    """
+    target = _VolumeInfoTarget()
+    parser = xml.etree.ElementTree.XMLParser(target=target)
+    for chunk in chunks:
+        parser.feed(chunk)
+    volumes = parser.close()
+    if target.op_ret != 0:
+        raise GlusterError(target.op_errno, target.op_errstr)
+    return volumes
+
+
+@util.export
+class Topology(object):
+    """
+    Gluster volumes as seen by a gluster server, queried through the
+    gluster CLI of base once per volume.
+    """
+
+    def __init__(self, base):
+        super(Topology, self).__init__()
+        self._base = base
+        self._volumes = {}
+        self._lock = threading.Lock()
+
+    def volume(self, server, name, refresh=False):
+        """
+        Return the Volume name served by server, None if it does not
+        exist.
+        """
+        key = (server, name)
+        with self._lock:
+            if not refresh and key in self._volumes:
+                return self._volumes[key]
+        rc, stdout, stderr = self._base.execute(
+            args=(
+                self._base.command.get('gluster'),
+                '--mode=script',
+                '--xml',
+                'volume',
+                'info',
+                name,
+                '--remote-host=%s' % server,
+            ),
+            raiseOnError=True
+        )
+        volumes = [
+            volume for volume in parse_volume_info(stdout)
+            if volume.name == name
+        ]
+        volume = volumes[0] if volumes else None
+        if volume is not None:
+            # a missing volume may be created meanwhile
+            with self._lock:
+                self._volumes[key] = volume
+        return volume
+
+    def forget(self, server, name):
+        """
+        Drop the cached Volume name, to be called when it did not pass
+        validation so that it is queried again once fixed.
+        """
+        with self._lock:
+            self._volumes.pop((server, name), None)
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,182 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""In-process ICMP echo prober."""
+
+
+import os
+import select
+import socket
+import struct
+import time
+
+
+from otopi import base
+from otopi import util
+
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _packet(ident, seq, payload):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return struct.pack(
+        '!BBHHH',
+        ICMP_ECHO_REQUEST,
+        0,
+        _checksum(header + payload),
+        ident,
+        seq,
+    ) + payload
+
+
+@util.export
+class ICMPProber(base.Base):
+    """
+    Send ICMP echo requests to many IPv4 targets at once from a single
+    socket and collect the replies, without forking ping.
+    A raw socket is used when allowed, otherwise an unprivileged ICMP
+    datagram socket (see net.ipv4.ping_group_range).
+    """
+
+    PAYLOAD = b'ovirt-hosted-engine-setup'
+
+    def __init__(self):
+        super(ICMPProber, self).__init__()
+
+    def _open_socket(self):
+        """
+        Return a (socket, raw) tuple.
+        Raise EnvironmentError if ICMP sockets are not allowed.
+        """
+        try:
+            return socket.socket(
+                socket.AF_INET,
+                socket.SOCK_RAW,
+                socket.IPPROTO_ICMP,
+            ), True
+        except EnvironmentError:
+            self.logger.debug('Raw ICMP socket not allowed', exc_info=True)
+        return socket.socket(
+            socket.AF_INET,
+            socket.SOCK_DGRAM,
+            socket.IPPROTO_ICMP,
+        ), False
+
+    def _resolve(self, address):
+        try:
+            return socket.getaddrinfo(
+                str(address),
+                None,
+                socket.AF_INET,
+            )[0][4][0]
+        except socket.error:
+            return None
+
+    def probe(self, addresses, timeout=1.0, attempts=1):
+        """
+        Probe every address, waiting at most timeout seconds for each
+        attempt.
+        Return a dictionary mapping each address to True if it replied,
+        False if it did not, None if it cannot be probed in-process (not
+        an IPv4 address).
+        Raise EnvironmentError if ICMP sockets are not allowed.
+        """
+        results = dict((address, None) for address in addresses)
+        targets = {}
+        for address in addresses:
+            resolved = self._resolve(address)
+            if resolved is not None:
+                targets.setdefault(resolved, []).append(address)
+                results[address] = False
+        if not targets:
+            return results
+
+        sock, raw = self._open_socket()
+        try:
+            sock.setblocking(0)
+            ident = os.getpid() & 0xffff
+            pending = set(targets.keys())
+            for attempt in range(attempts):
+                for seq, target in enumerate(sorted(pending)):
+                    try:
+                        sock.sendto(
+                            _packet(ident, seq & 0xffff, self.PAYLOAD),
+                            (target, 0),
+                        )
+                    except socket.error as e:
+                        self.logger.debug(
+                            'Cannot send ICMP echo to {target}: {e}'.format(
+                                target=target,
+                                e=e,
+                            )
+                        )
+                deadline = time.time() + timeout
+                while pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    readable, __, __ = select.select(
+                        [sock], [], [], remaining
+                    )
+                    if not readable:
+                        break
+                    try:
+                        data, (source, __) = sock.recvfrom(2048)
+                    except socket.error:
+                        continue
+                    if raw:
+                        data = data[(ord(data[0:1]) & 0x0f) * 4:]
+                    if len(data) < 8:
+                        continue
+                    icmp_type, __, __, reply_ident, __ = struct.unpack(
+                        '!BBHHH',
+                        data[:8],
+                    )
+                    if (
+                        icmp_type == ICMP_ECHO_REPLY and
+                        # the kernel rewrites the id on datagram sockets
+                        (not raw or reply_ident == ident) and
+                        source in pending
+                    ):
+                        pending.discard(source)
+                if not pending:
+                    break
+        finally:
+            sock.close()
+
+        for target, names in targets.items():
+            if target not in pending:
+                for address in names:
+                    results[address] = True
+        return results
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,260 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""
+ISO9660 image writer with Joliet names, enough for cloud-init NoCloud
+seed images: a single root directory holding a few small files.
+"""
+
+
+import os
+import re
+import struct
+import time
+
+
+from otopi import util
+
+
+SECTOR_SIZE = 2048
+
+# system area, primary and supplementary volume descriptors, terminator
+_DESCRIPTORS_START = 16
+# L and M path tables for the primary and the Joliet hierarchies
+_PATH_TABLES_START = _DESCRIPTORS_START + 3
+_PRIMARY_ROOT = _PATH_TABLES_START + 4
+_JOLIET_ROOT = _PRIMARY_ROOT + 1
+_DATA_START = _JOLIET_ROOT + 1
+
+_FLAG_DIRECTORY = 0x02
+_JOLIET_ESCAPE = b'%/E'
+
+
+def _bytes(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return value
+
+
+def _ucs2(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return value.encode('utf-16-be')
+
+
+def _both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def _both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def _padded(value, length, pad=b' '):
+    value = value[:length]
+    value += pad * ((length - len(value)) // len(pad))
+    return value + b'\0' * (length - len(value))
+
+
+def _sectors(length):
+    return (length + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+
+def _primary_name(name, used):
+    """
+    Return the ISO9660 level 1 (8.3, upper case d-characters) identifier
+    of name; the original one is available through Joliet.
+    """
+    base, ext = os.path.splitext(name)
+    base = re.sub('[^A-Z0-9_]', '_', base.upper())[:8]
+    ext = re.sub('[^A-Z0-9_]', '_', ext[1:].upper())[:3]
+    identifier = '%s.%s;1' % (base, ext)
+    if identifier in used:
+        raise ValueError('Duplicate ISO9660 file name for %s' % name)
+    used.add(identifier)
+    return identifier.encode('ascii')
+
+
+def _record_date(now):
+    return struct.pack(
+        '7B',
+        now.tm_year - 1900,
+        now.tm_mon,
+        now.tm_mday,
+        now.tm_hour,
+        now.tm_min,
+        now.tm_sec,
+        0,
+    )
+
+
+def _volume_date(now):
+    if now is None:
+        return b'0' * 16 + b'\0'
+    return time.strftime('%Y%m%d%H%M%S00', now).encode('ascii') + b'\0'
+
+
+def _directory_record(identifier, extent, length, flags, now):
+    record = (
+        b'\0' +
+        _both32(extent) +
+        _both32(length) +
+        _record_date(now) +
+        struct.pack('BBB', flags, 0, 0) +
+        _both16(1) +
+        struct.pack('B', len(identifier)) +
+        identifier
+    )
+    if len(identifier) % 2 == 0:
+        record += b'\0'
+    return struct.pack('B', len(record) + 1) + record
+
+
+def _directory(root, entries, now):
+    """
+    Return the root directory sector: the '.' and '..' entries and one
+    record per (identifier, extent, length) entry.
+    """
+    data = (
+        _directory_record(b'\0', root, SECTOR_SIZE, _FLAG_DIRECTORY, now) +
+        _directory_record(b'\1', root, SECTOR_SIZE, _FLAG_DIRECTORY, now)
+    )
+    for identifier, extent, length in sorted(entries):
+        data += _directory_record(identifier, extent, length, 0, now)
+    if len(data) > SECTOR_SIZE:
+        raise ValueError('Too many files for the ISO9660 root directory')
+    return _padded(data, SECTOR_SIZE, b'\0')
+
+
+def _path_table(root, fmt):
+    # only the root directory: identifier length, extended attributes
+    # length, extent, parent directory number, identifier and padding
+    return _padded(
+        struct.pack('BB', 1, 0) +
+        struct.pack(fmt + 'I', root) +
+        struct.pack(fmt + 'H', 1) +
+        b'\0\0',
+        SECTOR_SIZE,
+        b'\0',
+    )
+
+
+def _volume_descriptor(
+    kind,
+    volume_id,
+    total,
+    root,
+    path_table,
+    now,
+    text,
+    escape,
+):
+    descriptor = (
+        struct.pack('B', kind) +
+        b'CD001\1\0' +
+        _padded(text(''), 32, text(' ')) +
+        _padded(text(volume_id), 32, text(' ')) +
+        b'\0' * 8 +
+        _both32(total) +
+        _padded(escape, 32, b'\0') +
+        _both16(1) +
+        _both16(1) +
+        _both16(SECTOR_SIZE) +
+        # the path table is a single 10 bytes record
+        _both32(10) +
+        struct.pack('<I', path_table) +
+        b'\0' * 4 +
+        struct.pack('>I', path_table + 1) +
+        b'\0' * 4 +
+        _directory_record(b'\0', root, SECTOR_SIZE, _FLAG_DIRECTORY, now)
+    )
+    for length in (128, 128, 128, 128, 37, 37, 37):
+        descriptor += _padded(text(''), length, text(' '))
+    descriptor += (
+        _volume_date(now) +
+        _volume_date(now) +
+        _volume_date(None) +
+        _volume_date(now) +
+        b'\1\0'
+    )
+    return _padded(descriptor, SECTOR_SIZE, b'\0')
+
+
+@util.export
+def build(files, volume_id):
+    """
+    Return an ISO9660 image with Joliet extensions holding the files,
+    a dictionary mapping each file name to its content, in the root
+    directory.
+    """
+    now = time.gmtime()
+    names = sorted(files.keys())
+    used = set()
+    primary = []
+    joliet = []
+    extent = _DATA_START
+    data = []
+    for name in names:
+        content = _bytes(files[name])
+        primary.append((_primary_name(name, used), extent, len(content)))
+        joliet.append((_ucs2(name + ';1'), extent, len(content)))
+        data.append(
+            _padded(
+                content,
+                _sectors(len(content)) * SECTOR_SIZE,
+                b'\0',
+            )
+        )
+        extent += _sectors(len(content))
+
+    return b''.join(
+        [
+            b'\0' * SECTOR_SIZE * _DESCRIPTORS_START,
+            _volume_descriptor(
+                1,
+                volume_id,
+                extent,
+                _PRIMARY_ROOT,
+                _PATH_TABLES_START,
+                now,
+                _bytes,
+                b'',
+            ),
+            _volume_descriptor(
+                2,
+                volume_id,
+                extent,
+                _JOLIET_ROOT,
+                _PATH_TABLES_START + 2,
+                now,
+                _ucs2,
+                _JOLIET_ESCAPE,
+            ),
+            _padded(b'\xffCD001\1', SECTOR_SIZE, b'\0'),
+            _path_table(_PRIMARY_ROOT, '<'),
+            _path_table(_PRIMARY_ROOT, '>'),
+            _path_table(_JOLIET_ROOT, '<'),
+            _path_table(_JOLIET_ROOT, '>'),
+            _directory(_PRIMARY_ROOT, primary, now),
+            _directory(_JOLIET_ROOT, joliet, now),
+        ] + data
+    )
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,82 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Loop devices setup through the kernel ioctls, without losetup."""
+
+
+import errno
+import fcntl
+import os
+
+
+from otopi import util
+
+
+LOOP_CONTROL = '/dev/loop-control'
+LOOP_DEVICE_TEMPLATE = '/dev/loop%d'
+
+# linux/loop.h
+_LOOP_SET_FD = 0x4C00
+_LOOP_CLR_FD = 0x4C01
+_LOOP_CTL_GET_FREE = 0x4C82
+
+_ATTACH_TRIES = 5
+
+
+@util.export
+def attach(path):
+    """
+    Bind path to the first free loop device and return the device path.
+    """
+    control = os.open(LOOP_CONTROL, os.O_RDWR)
+    try:
+        backing = os.open(path, os.O_RDWR)
+        try:
+            for i in range(_ATTACH_TRIES):
+                device = LOOP_DEVICE_TEMPLATE % fcntl.ioctl(
+                    control,
+                    _LOOP_CTL_GET_FREE,
+                )
+                loop = os.open(device, os.O_RDWR)
+                try:
+                    fcntl.ioctl(loop, _LOOP_SET_FD, backing)
+                    return device
+                except IOError as e:
+                    # somebody else took it in the meanwhile
+                    if e.errno != errno.EBUSY or i == _ATTACH_TRIES - 1:
+                        raise
+                finally:
+                    os.close(loop)
+        finally:
+            os.close(backing)
+    finally:
+        os.close(control)
+
+
+@util.export
+def detach(device):
+    loop = os.open(device, os.O_RDWR)
+    try:
+        fcntl.ioctl(loop, _LOOP_CLR_FD)
+    finally:
+        os.close(loop)
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,146 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Block devices inventory."""
+
+
+from otopi import util
+
+
+@util.export
+class LunInventory(object):
+    """
+    The devices reported by VDSM getDeviceList, indexed by GUID, by
+    iSCSI target name and by volume group UUID.
+    """
+
+    def __init__(self, devices):
+        super(LunInventory, self).__init__()
+        self.devices = []
+        self._by_guid = {}
+        self._by_iqn = {}
+        self._by_vg = {}
+        for device in devices:
+            guid = device['GUID']
+            if guid in self._by_guid:
+                continue
+            self._by_guid[guid] = device
+            self.devices.append(device)
+            for iqn in set(
+                path.get('iqn') for path in device.get('pathlist', [])
+            ):
+                if iqn:
+                    self._by_iqn.setdefault(iqn, []).append(device)
+            if device.get('vgUUID'):
+                self._by_vg.setdefault(device['vgUUID'], []).append(device)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, guid, iqn=None):
+        """
+        Return the device with GUID guid, None if missing or if it is not
+        reachable through the iSCSI target iqn when given.
+        """
+        device = self._by_guid.get(guid)
+        if device is not None and iqn is not None:
+            if guid not in [d['GUID'] for d in self.for_target(iqn)]:
+                return None
+        return device
+
+    def for_target(self, iqn):
+        return list(self._by_iqn.get(iqn, []))
+
+    def for_vg(self, vg_uuid):
+        return list(self._by_vg.get(vg_uuid, []))
+
+    def portals(self, guid, iqn, address=None):
+        """
+        Return the portals of the paths of device guid to target iqn,
+        the ones through address first when given.
+        """
+        device = self._by_guid.get(guid)
+        if device is None:
+            return []
+        paths = [
+            path for path in device.get('pathlist', [])
+            if path.get('iqn') == iqn and 'portal' in path
+        ]
+        return sorted(
+            set(path['portal'] for path in paths),
+            key=lambda portal: (
+                portal not in [
+                    path['portal'] for path in paths
+                    if path.get('connection') == address
+                ],
+                portal,
+            ),
+        )
+
+
+@util.export
+def select(devices, min_size=0, vendor=None, free_only=False):
+    """
+    Return the devices of at least min_size bytes, whose vendor contains
+    vendor when given and without a volume group when free_only, the
+    largest first.
+    """
+    if vendor:
+        vendor = vendor.strip().lower()
+    return sorted(
+        [
+            device for device in devices
+            if int(device['capacity']) >= min_size and
+            (not vendor or vendor in device['vendorID'].lower()) and
+            not (free_only and device.get('vgUUID'))
+        ],
+        key=lambda device: (-int(device['capacity']), device['GUID']),
+    )
+
+
+@util.export
+def match_guid(devices, prefix):
+    """
+    Return the devices whose GUID starts with prefix, ignoring case.
+    """
+    prefix = prefix.strip().lower()
+    return [
+        device for device in devices
+        if device['GUID'].lower().startswith(prefix)
+    ]
+
+
+@util.export
+def fetch(cli, domain_type, guids=None):
+    """
+    Return the LunInventory of the devices VDSM sees for domain_type,
+    only of the ones in guids when given: VDSM then describes just those
+    instead of every multipath device on the host.
+    """
+    if guids:
+        devices = cli.getDeviceList(domain_type, list(guids))
+    else:
+        devices = cli.getDeviceList(domain_type)
+    if devices['status']['code'] != 0:
+        raise RuntimeError(devices['status']['message'])
+    return LunInventory(devices['devList'])
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
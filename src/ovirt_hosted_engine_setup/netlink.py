@@ -0,0 +1,418 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Network introspection over rtnetlink."""
+
+
+import os
+import socket
+import struct
+
+
+from otopi import base
+from otopi import util
+
+
+from . import constants as ohostedcons
+
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_MASTER = 10
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+
+NDA_DST = 1
+NDA_LLADDR = 2
+
+IFF_UP = 0x01
+IFF_LOOPBACK = 0x08
+
+RT_SCOPE_UNIVERSE = 0
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+
+_NLMSGHDR = struct.Struct('=LHHLL')
+_RTATTR = struct.Struct('=HH')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBI')
+_RTMSG = struct.Struct('=BBBBBBBBI')
+_NDMSG = struct.Struct('=BxxxiHBB')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attributes(data, offset):
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, kind = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[kind] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _ntop(family, data):
+    return socket.inet_ntop(family, data)
+
+
+def _lladdr(data):
+    return ':'.join('%02x' % c for c in bytearray(data))
+
+
+def _string(data):
+    return data.split(b'\0', 1)[0].decode('utf-8')
+
+
+@util.export
+class Netlink(base.Base):
+    """
+    Read links, addresses, routes and neighbours from the kernel over a
+    single rtnetlink socket, without executing ip or parsing /proc.
+    Every method returns a fresh dump; see snapshot() for a cached view.
+    """
+
+    BUFFER_SIZE = 65536
+
+    def __init__(self):
+        super(Netlink, self).__init__()
+        self._socket = None
+        self._seq = 0
+
+    def _open(self):
+        if self._socket is None:
+            self._socket = socket.socket(
+                socket.AF_NETLINK,
+                socket.SOCK_RAW,
+                NETLINK_ROUTE,
+            )
+            self._socket.bind((0, 0))
+        return self._socket
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _dump(self, request, payload, reply):
+        """
+        Send a dump request and return the payload of every reply message
+        of type reply.
+        """
+        sock = self._open()
+        self._seq += 1
+        sock.send(
+            _NLMSGHDR.pack(
+                _NLMSGHDR.size + len(payload),
+                request,
+                NLM_F_REQUEST | NLM_F_DUMP,
+                self._seq,
+                0,
+            ) + payload
+        )
+        messages = []
+        while True:
+            data = sock.recv(self.BUFFER_SIZE)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, kind, flags, seq, pid = _NLMSGHDR.unpack_from(
+                    data,
+                    offset,
+                )
+                if length < _NLMSGHDR.size:
+                    return messages
+                body = data[offset + _NLMSGHDR.size:offset + length]
+                offset += _align(length)
+                if seq != self._seq:
+                    continue
+                if kind == NLMSG_DONE:
+                    return messages
+                if kind == NLMSG_ERROR:
+                    error = -struct.unpack_from('=i', body)[0]
+                    if error:
+                        raise EnvironmentError(error, os.strerror(error))
+                    return messages
+                if kind == reply:
+                    messages.append(body)
+
+    def links(self):
+        """
+        Return a dictionary mapping link names to dictionaries with their
+        index, mac address, mtu, flags and the index of their master.
+        """
+        links = {}
+        for body in self._dump(
+            RTM_GETLINK,
+            _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0),
+            RTM_NEWLINK,
+        ):
+            family, kind, index, flags, change = _IFINFOMSG.unpack_from(body)
+            attrs = _attributes(body, _IFINFOMSG.size)
+            if IFLA_IFNAME not in attrs:
+                continue
+            links[_string(attrs[IFLA_IFNAME])] = {
+                'index': index,
+                'mac': _lladdr(attrs.get(IFLA_ADDRESS, b'')),
+                'mtu': (
+                    struct.unpack('=I', attrs[IFLA_MTU])[0]
+                    if IFLA_MTU in attrs else None
+                ),
+                'flags': flags,
+                'up': bool(flags & IFF_UP),
+                'loopback': bool(flags & IFF_LOOPBACK),
+                'master': (
+                    struct.unpack('=i', attrs[IFLA_MASTER])[0]
+                    if IFLA_MASTER in attrs else None
+                ),
+            }
+        return links
+
+    def addresses(self, family=socket.AF_UNSPEC):
+        """
+        Return a list of dictionaries describing the addresses of the
+        given family (both IPv4 and IPv6 by default), with the address,
+        prefix length, family, scope and link index.
+        """
+        addresses = []
+        for body in self._dump(
+            RTM_GETADDR,
+            _IFADDRMSG.pack(family, 0, 0, 0, 0),
+            RTM_NEWADDR,
+        ):
+            (
+                addr_family,
+                prefixlen,
+                flags,
+                scope,
+                index,
+            ) = _IFADDRMSG.unpack_from(body)
+            if addr_family not in (socket.AF_INET, socket.AF_INET6):
+                continue
+            attrs = _attributes(body, _IFADDRMSG.size)
+            # IFA_LOCAL is the local address on point to point links,
+            # IFA_ADDRESS the peer one
+            address = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+            if address is None:
+                continue
+            addresses.append({
+                'address': _ntop(addr_family, address),
+                'prefixlen': prefixlen,
+                'family': addr_family,
+                'scope': scope,
+                'index': index,
+                'label': (
+                    _string(attrs[IFA_LABEL])
+                    if IFA_LABEL in attrs else None
+                ),
+            })
+        return addresses
+
+    def routes(self, family=socket.AF_INET):
+        """
+        Return a list of dictionaries describing the unicast routes of the
+        main table, with destination, prefix length, gateway, output link
+        index and metric.
+        """
+        routes = []
+        for body in self._dump(
+            RTM_GETROUTE,
+            _RTMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0),
+            RTM_NEWROUTE,
+        ):
+            (
+                route_family,
+                dst_len,
+                src_len,
+                tos,
+                table,
+                protocol,
+                scope,
+                kind,
+                flags,
+            ) = _RTMSG.unpack_from(body)
+            attrs = _attributes(body, _RTMSG.size)
+            if RTA_TABLE in attrs:
+                table = struct.unpack('=I', attrs[RTA_TABLE])[0]
+            if table != RT_TABLE_MAIN or kind != RTN_UNICAST:
+                continue
+            routes.append({
+                'destination': (
+                    _ntop(route_family, attrs[RTA_DST])
+                    if RTA_DST in attrs else None
+                ),
+                'prefixlen': dst_len,
+                'gateway': (
+                    _ntop(route_family, attrs[RTA_GATEWAY])
+                    if RTA_GATEWAY in attrs else None
+                ),
+                'index': (
+                    struct.unpack('=i', attrs[RTA_OIF])[0]
+                    if RTA_OIF in attrs else None
+                ),
+                'metric': (
+                    struct.unpack('=I', attrs[RTA_PRIORITY])[0]
+                    if RTA_PRIORITY in attrs else 0
+                ),
+                'family': route_family,
+            })
+        return routes
+
+    def neighbours(self, family=socket.AF_INET):
+        """
+        Return a dictionary mapping the addresses in the kernel neighbour
+        table to True if their link address is resolved, False if the
+        resolution is pending or failed.
+        """
+        neighbours = {}
+        for body in self._dump(
+            RTM_GETNEIGH,
+            _NDMSG.pack(family, 0, 0, 0, 0),
+            RTM_NEWNEIGH,
+        ):
+            ndm_family, index, state, flags, kind = _NDMSG.unpack_from(body)
+            attrs = _attributes(body, _NDMSG.size)
+            if NDA_DST not in attrs:
+                continue
+            neighbours[_ntop(ndm_family, attrs[NDA_DST])] = not (
+                state & (NUD_INCOMPLETE | NUD_FAILED)
+            )
+        return neighbours
+
+
+@util.export
+class NetworkSnapshot(object):
+    """
+    Links, addresses and routes read once and reused.
+    """
+
+    def __init__(self, stage):
+        super(NetworkSnapshot, self).__init__()
+        self.stage = stage
+        self._netlink = Netlink()
+        try:
+            self.links = self._netlink.links()
+            self.addresses = self._netlink.addresses()
+            self.routes = (
+                self._netlink.routes(socket.AF_INET) +
+                self._netlink.routes(socket.AF_INET6)
+            )
+        finally:
+            self._netlink.close()
+        self._names = dict(
+            (link['index'], name) for name, link in self.links.items()
+        )
+
+    def devices(self):
+        return list(self.links.keys())
+
+    def device_addresses(self, device, family=socket.AF_UNSPEC):
+        """
+        Return the global addresses of device as address/prefixlen
+        strings, IPv4 ones first.
+        """
+        link = self.links.get(device)
+        if link is None:
+            return []
+        return [
+            '{address}/{prefixlen}'.format(**address)
+            for address in sorted(
+                self.addresses,
+                key=lambda a: a['family'] != socket.AF_INET,
+            )
+            if (
+                address['index'] == link['index'] and
+                address['scope'] == RT_SCOPE_UNIVERSE and
+                family in (socket.AF_UNSPEC, address['family'])
+            )
+        ]
+
+    def default_route(self, family=socket.AF_INET):
+        """
+        Return the default route with the lowest metric or None, with the
+        name of its output device added.
+        """
+        defaults = sorted(
+            [
+                route for route in self.routes
+                if (
+                    route['family'] == family and
+                    route['prefixlen'] == 0 and
+                    route['gateway'] is not None
+                )
+            ],
+            key=lambda r: r['metric'],
+        )
+        if not defaults:
+            return None
+        route = dict(defaults[0])
+        route['device'] = self._names.get(route['index'])
+        return route
+
+    def default_gateway(self, family=socket.AF_INET):
+        route = self.default_route(family)
+        return route['gateway'] if route is not None else None
+
+
+@util.export
+def snapshot(plugin):
+    """
+    Return a NetworkSnapshot cached in the environment for the duration
+    of the current stage.
+    """
+    stage = getattr(plugin.context, 'currentStage', None)
+    cached = plugin.environment.get(ohostedcons.NetworkEnv.NETWORK_SNAPSHOT)
+    if cached is None or stage is None or cached.stage != stage:
+        cached = NetworkSnapshot(stage)
+        plugin.environment[ohostedcons.NetworkEnv.NETWORK_SNAPSHOT] = cached
+    return cached
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -29,7 +29,6 @@ import urllib2
 
 
 from . import ohttpshandler
-from M2Crypto import X509
 
 
 from otopi import base
@@ -102,6 +101,7 @@ class PKIHelper(base.Base):
             )
         if not content:
             raise RuntimeError(_('Unable to acquire CA cert'))
+        from M2Crypto import X509
         try:
             cert = X509.load_cert_string(str(content))
             self.logger.info(_(
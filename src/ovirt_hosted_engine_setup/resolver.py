@@ -0,0 +1,363 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Name resolution checks: system resolver, DNS and /etc/hosts."""
+
+
+import random
+import select
+import socket
+import struct
+import threading
+import time
+
+
+from otopi import base
+from otopi import util
+
+
+from . import util as ohostedutil
+
+
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_PTR = 12
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RECORD = struct.Struct('!HHIH')
+_FLAG_RD = 0x0100
+_RCODE_MASK = 0x000f
+_RCODE_NXDOMAIN = 3
+
+
+def _encode_name(name):
+    encoded = b''
+    for label in name.rstrip('.').split('.'):
+        label = label.encode('idna')
+        encoded += struct.pack('B', len(label)) + label
+    return encoded + b'\0'
+
+
+def _decode_name(data, offset):
+    """
+    Return the possibly compressed name at offset and the offset right
+    after it.
+    """
+    labels = []
+    end = None
+    for __ in range(128):
+        if offset >= len(data):
+            raise ValueError('Truncated DNS name')
+        length = ord(data[offset:offset + 1])
+        if length & 0xc0 == 0xc0:
+            if offset + 2 > len(data):
+                raise ValueError('Truncated DNS name')
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3fff
+        elif length == 0:
+            return '.'.join(labels), end if end is not None else offset + 1
+        else:
+            if offset + 1 + length > len(data):
+                raise ValueError('Truncated DNS name')
+            labels.append(
+                data[offset + 1:offset + 1 + length].decode('ascii')
+            )
+            offset += 1 + length
+    raise ValueError('DNS name compression loop')
+
+
+def _reverse_name(address):
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, address)
+        return '.'.join(
+            reversed(''.join('%02x' % c for c in bytearray(packed)))
+        ) + '.ip6.arpa'
+    except socket.error:
+        return '.'.join(reversed(address.split('.'))) + '.in-addr.arpa'
+
+
+def _parse_response(data, qid):
+    """
+    Return the rcode and the (type, value) answer records of a response.
+    """
+    rid, flags, qdcount, ancount, __, __ = _HEADER.unpack_from(data)
+    if rid != qid:
+        raise ValueError('Unexpected DNS response id')
+    offset = _HEADER.size
+    for __ in range(qdcount):
+        __, offset = _decode_name(data, offset)
+        offset += _QUESTION.size
+    answers = []
+    for __ in range(ancount):
+        __, offset = _decode_name(data, offset)
+        kind, __, __, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        rdata = data[offset:offset + length]
+        if kind == TYPE_A:
+            answers.append((kind, socket.inet_ntop(socket.AF_INET, rdata)))
+        elif kind == TYPE_AAAA:
+            answers.append((kind, socket.inet_ntop(socket.AF_INET6, rdata)))
+        elif kind in (TYPE_CNAME, TYPE_PTR):
+            answers.append((kind, _decode_name(data, offset)[0]))
+        offset += length
+    return flags & _RCODE_MASK, answers
+
+
+@util.export
+class Resolution(object):
+    """
+    Outcome of the resolution checks of a name.
+
+    addresses: addresses returned by the system resolver.
+    dns: (type, value) records answered by the DNS servers.
+    hosts: addresses of the name in /etc/hosts.
+    reverse: address -> set of names its PTR records point to.
+    """
+
+    def __init__(self, name):
+        super(Resolution, self).__init__()
+        self.name = name
+        self.addresses = set()
+        self.dns = []
+        self.hosts = set()
+        self.reverse = {}
+
+    @property
+    def resolved_by_dns(self):
+        return bool(self.dns)
+
+    def reverse_resolved(self):
+        """
+        Return the addresses whose reverse resolution gives back name.
+        """
+        return set(
+            address for address, names in self.reverse.items()
+            if self.name.lower().rstrip('.') in [
+                n.lower().rstrip('.') for n in names
+            ]
+        )
+
+
+@util.export
+class Resolver(base.Base):
+    """
+    Run the forward, reverse and /etc/hosts checks of a name concurrently
+    with a short shared timeout, caching the answers for the whole run.
+    Empty answers are not cached, so a name fixed meanwhile in DNS or in
+    /etc/hosts is looked up again.
+    """
+
+    RESOLV_CONF = '/etc/resolv.conf'
+    HOSTS = '/etc/hosts'
+    DNS_PORT = 53
+
+    def __init__(self, timeout=2.0):
+        super(Resolver, self).__init__()
+        self._timeout = timeout
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, function):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        value = function()
+        if value:
+            with self._lock:
+                self._cache[key] = value
+        return value
+
+    def forget(self, name):
+        """
+        Drop the cached answers about name and its addresses, to be
+        called when they did not pass validation.
+        """
+        with self._lock:
+            addresses = set()
+            for key, value in list(self._cache.items()):
+                if key[0] == 'system' and key[1] == name:
+                    addresses |= value
+                elif key[0] == 'dns' and key[1] == name:
+                    addresses |= set(
+                        v for kind, v in value
+                        if kind in (TYPE_A, TYPE_AAAA)
+                    )
+            for key in list(self._cache):
+                if (
+                    key[1] == name or
+                    (key[0] == 'ptr' and key[1] in addresses)
+                ):
+                    del self._cache[key]
+
+    def _nameservers(self):
+        nameservers = []
+        try:
+            with open(self.RESOLV_CONF, 'r') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 2 and fields[0] == 'nameserver':
+                        nameservers.append(fields[1])
+        except EnvironmentError:
+            pass
+        return nameservers or ['127.0.0.1']
+
+    def _query(self, name, qtype):
+        """
+        Return the answer records of name and qtype from the first
+        nameserver answering within the timeout, [] if none did.
+        """
+        deadline = time.time() + self._timeout
+        qid = random.randint(0, 0xffff)
+        packet = (
+            _HEADER.pack(qid, _FLAG_RD, 1, 0, 0, 0) +
+            _encode_name(name) +
+            _QUESTION.pack(qtype, CLASS_IN)
+        )
+        for nameserver in self._nameservers():
+            family = (
+                socket.AF_INET6 if ':' in nameserver else socket.AF_INET
+            )
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            try:
+                sock.setblocking(0)
+                sock.sendto(packet, (nameserver, self.DNS_PORT))
+                while True:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return []
+                    readable, __, __ = select.select(
+                        [sock], [], [], remaining
+                    )
+                    if not readable:
+                        return []
+                    try:
+                        rcode, answers = _parse_response(
+                            sock.recv(65535),
+                            qid,
+                        )
+                    except ValueError:
+                        continue
+                    if rcode in (0, _RCODE_NXDOMAIN):
+                        return answers
+                    break
+            except (socket.error, struct.error) as e:
+                self.logger.debug(
+                    'DNS query {name} to {nameserver} failed: {e}'.format(
+                        name=name,
+                        nameserver=nameserver,
+                        e=e,
+                    )
+                )
+            finally:
+                sock.close()
+        return []
+
+    def _system(self, name):
+        try:
+            return set(
+                address[0] for __, __, __, __, address in
+                socket.getaddrinfo(name, None)
+            )
+        except socket.error:
+            return set()
+
+    def _hosts(self, name):
+        addresses = set()
+        try:
+            with open(self.HOSTS, 'r') as f:
+                for line in f:
+                    fields = line.split('#', 1)[0].split()
+                    if name.lower() in [n.lower() for n in fields[1:]]:
+                        addresses.add(fields[0])
+        except EnvironmentError:
+            pass
+        return addresses
+
+    def system(self, name):
+        return self._cached(('system', name), lambda: self._system(name))
+
+    def dns(self, name, qtype):
+        return self._cached(
+            ('dns', name, qtype),
+            lambda: self._query(name, qtype),
+        )
+
+    def hosts(self, name):
+        return self._cached(('hosts', name), lambda: self._hosts(name))
+
+    def ptr(self, address):
+        return self._cached(
+            ('ptr', address),
+            lambda: set(
+                value for kind, value in self._query(
+                    _reverse_name(address),
+                    TYPE_PTR,
+                )
+                if kind == TYPE_PTR
+            ),
+        )
+
+    def resolve(self, name, reverse=False):
+        """
+        Return the Resolution of name. The system resolver, DNS A and
+        AAAA and /etc/hosts checks run together, then the PTR records of
+        every address found are looked up together if reverse is set.
+        """
+        result = Resolution(name)
+        (
+            (result.addresses, __),
+            (a, __),
+            (aaaa, __),
+            (result.hosts, __),
+        ) = ohostedutil.run_concurrently([
+            lambda: self.system(name),
+            lambda: self.dns(name, TYPE_A),
+            lambda: self.dns(name, TYPE_AAAA),
+            lambda: self.hosts(name),
+        ])
+        result.addresses = result.addresses or set()
+        result.hosts = result.hosts or set()
+        result.dns = (a or []) + (aaaa or [])
+        if reverse:
+            addresses = sorted(
+                result.addresses |
+                set(
+                    value for kind, value in result.dns
+                    if kind in (TYPE_A, TYPE_AAAA)
+                )
+            )
+            result.reverse = dict(
+                (address, names or set())
+                for address, (names, __) in zip(
+                    addresses,
+                    ohostedutil.run_concurrently([
+                        (lambda address=address: self.ptr(address))
+                        for address in addresses
+                    ]),
+                )
+            )
+        return result
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
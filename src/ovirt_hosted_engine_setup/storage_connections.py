@@ -0,0 +1,208 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Storage server connections shared by the storage plugins."""
+
+
+import gettext
+import threading
+
+
+from otopi import base
+from otopi import util
+
+
+from . import constants as ohostedcons
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-hosted-engine-setup')
+
+
+@util.export
+class ConnectionManager(base.Base):
+    """
+    Reference counted VDSM storage server connections.
+    A connection is sent to VDSM only when it is acquired for the first
+    time, or again through a new VDSM client since VDSM forgets them on
+    restart; connections nobody holds anymore are disconnected by
+    disconnect_unused().
+    Connections differing only by their id are the same connection.
+    """
+
+    def __init__(self):
+        super(ConnectionManager, self).__init__()
+        # key -> {'refs', 'storage_type', 'con', 'cli'}
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    # VDSM takes them either as numbers or as strings
+    _STRING_FIELDS = ('port', 'portal')
+
+    @classmethod
+    def _key(cls, storage_type, con):
+        return (
+            storage_type,
+            tuple(sorted(
+                (k, str(v) if k in cls._STRING_FIELDS else v)
+                for k, v in con.items() if k != 'id'
+            )),
+        )
+
+    def acquire(self, cli, storage_type, cons, client=None):
+        """
+        Connect the connections in cons not yet connected through cli and
+        take a reference to all of them.
+        client, if given, is the VDSM client sending them instead of cli,
+        e.g. one opened by a worker thread; they are still tracked as
+        connected through cli.
+        Raise RuntimeError if VDSM fails to connect any of them.
+        """
+        with self._lock:
+            missing = [
+                con for con in cons
+                if self._connections.get(
+                    self._key(storage_type, con), {}
+                ).get('cli') is not cli
+            ]
+        if missing:
+            self.logger.debug('connectStorageServer')
+            status = (client or cli).connectStorageServer(
+                storage_type,
+                ohostedcons.Const.BLANK_UUID,
+                missing
+            )
+            self.logger.debug(status)
+            if status['status']['code'] != 0:
+                raise RuntimeError(status['status']['message'])
+            for con in status['statuslist']:
+                if con['status'] != 0:
+                    raise RuntimeError(
+                        _('Connection to storage server failed')
+                    )
+        else:
+            self.logger.debug(
+                'Storage server connections already active, reused'
+            )
+        with self._lock:
+            for con in cons:
+                entry = self._connections.setdefault(
+                    self._key(storage_type, con),
+                    {
+                        'refs': 0,
+                        'storage_type': storage_type,
+                        'con': con,
+                    },
+                )
+                entry['refs'] += 1
+                entry['cli'] = cli
+
+    def release(self, storage_type, cons):
+        """
+        Drop a reference to the connections in cons, leaving them
+        connected until disconnect_unused().
+        """
+        with self._lock:
+            for con in cons:
+                entry = self._connections.get(self._key(storage_type, con))
+                if entry is not None and entry['refs'] > 0:
+                    entry['refs'] -= 1
+
+    def disconnect_unused(self, cli):
+        """
+        Disconnect through cli the connections nobody holds.
+        Failures are only logged, this is meant for cleaning up.
+        """
+        with self._lock:
+            unused = {}
+            for key, entry in list(self._connections.items()):
+                if entry['refs'] == 0:
+                    unused.setdefault(
+                        entry['storage_type'],
+                        [],
+                    ).append(entry['con'])
+                    del self._connections[key]
+        for storage_type, cons in unused.items():
+            self.logger.debug('disconnectStorageServer')
+            try:
+                status = cli.disconnectStorageServer(
+                    storage_type,
+                    ohostedcons.Const.BLANK_UUID,
+                    cons
+                )
+                self.logger.debug(status)
+                if status['status']['code'] != 0:
+                    raise RuntimeError(status['status']['message'])
+            except Exception as e:
+                self.logger.debug('exception', exc_info=True)
+                self.logger.warning(
+                    _(
+                        'Cannot disconnect from the storage server: {error}'
+                    ).format(
+                        error=e,
+                    )
+                )
+
+
+@util.export
+def iscsi_connection(
+    iqn,
+    portal,
+    user,
+    password,
+    id=ohostedcons.Const.BLANK_UUID,
+):
+    """
+    Return the VDSM connection to target iqn through portal, an
+    (address, port, tpgt) tuple, built the same way by all the storage
+    plugins so that the same session is the same connection.
+    """
+    address, port, tpgt = portal
+    return {
+        'connection': address,
+        'iqn': iqn,
+        'portal': str(tpgt),
+        'user': user,
+        'password': password,
+        'port': str(port),
+        'id': id,
+    }
+
+
+@util.export
+def iscsi_portals(environment):
+    """
+    Return the (address, port, tpgt) portals of the hosted-engine iSCSI
+    target the setup logged in to, falling back to the first configured
+    portal.
+    """
+    portals = environment.get(ohostedcons.StorageEnv.ISCSI_PORTALS)
+    if portals:
+        return portals
+    return [
+        (
+            environment[ohostedcons.StorageEnv.ISCSI_IP_ADDR].split(',')[0],
+            environment[ohostedcons.StorageEnv.ISCSI_PORT],
+            environment[ohostedcons.StorageEnv.ISCSI_PORTAL],
+        ),
+    ]
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,103 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""@PLACEHOLDER@ templates."""
+
+
+import os
+import re
+import threading
+
+
+from otopi import util
+
+
+_PLACEHOLDER_RE = re.compile(r'(@[A-Za-z0-9_]+@)')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+@util.export
+class UnresolvedPlaceholdersError(RuntimeError):
+    """
+    Raised when a template is rendered without values for some of its
+    placeholders.
+    """
+
+    def __init__(self, name, placeholders):
+        super(UnresolvedPlaceholdersError, self).__init__(
+            'Unresolved placeholders in {name}: {placeholders}'.format(
+                name=name,
+                placeholders=', '.join(sorted(placeholders)),
+            )
+        )
+        self.placeholders = placeholders
+
+
+@util.export
+class Template(object):
+    """
+    Template split once into literal text and placeholders, rendered in a
+    single pass.
+    """
+
+    def __init__(self, content, name='<string>'):
+        super(Template, self).__init__()
+        self.name = name
+        # literal chunks at even indexes, placeholders at odd ones
+        self._tokens = _PLACEHOLDER_RE.split(content)
+        self.placeholders = frozenset(self._tokens[1::2])
+
+    def render(self, subst):
+        """
+        Return the content with every placeholder replaced by str() of
+        its value in subst.
+        Raise UnresolvedPlaceholdersError if subst misses some of them.
+        """
+        missing = self.placeholders.difference(subst)
+        if missing:
+            raise UnresolvedPlaceholdersError(self.name, missing)
+        tokens = self._tokens[:]
+        for i in range(1, len(tokens), 2):
+            tokens[i] = str(subst[tokens[i]])
+        return ''.join(tokens)
+
+
+@util.export
+def load(path):
+    """
+    Return the Template in path, read and split again only if the file
+    changed since the last call.
+    """
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'r') as f:
+        compiled = Template(f.read(), name=path)
+    with _cache_lock:
+        _cache[path] = (key, compiled)
+    return compiled
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -25,12 +25,15 @@ import gettext
 import os
 import random
 import re
+import threading
 
 
 from otopi import util
 
 
 from . import constants as ohostedcons
+from . import icmp
+from . import template as ohostedtemplate
 
 UNICAST_MAC_ADDR = re.compile("[a-fA-F0-9][02468aAcCeE](:[a-fA-F0-9]{2}){5}")
 
@@ -41,12 +44,12 @@ def _(m):
 
 @util.export
 def processTemplate(template, subst):
-    content = ''
-    with open(template, 'r') as f:
-        content = f.read()
-    for k, v in subst.items():
-        content = content.replace(str(k), str(v))
-    return content
+    """
+    Return the content of the template file with its @PLACEHOLDER@s
+    replaced by the values in subst.
+    Raise RuntimeError if subst misses some of them.
+    """
+    return ohostedtemplate.load(template).render(subst)
 
 
 def randomMAC():
@@ -73,22 +76,141 @@ def validMAC(mac):
     return (UNICAST_MAC_ADDR.match(mac) is not None)
 
 
-def check_is_pingable(base, address):
-    """
-    Ensure that an address is pingable
-    """
+def _ping(base, address, timeout):
     rc, stdout, stderr = base.execute(
         (
             base.command.get('ping'),
             '-c',
             '1',
+            '-W',
+            str(max(int(round(timeout)), 1)),
             str(address),
         ),
         raiseOnError=False,
     )
-    if rc == 0:
-        return True
-    return False
+    return rc == 0
+
+
+def check_are_pingable(base, addresses, timeout=1.0):
+    """
+    Check which addresses are pingable, sending all the ICMP echo
+    requests at once and waiting at most timeout seconds.
+    The ping command is used only for the addresses that cannot be
+    probed in-process or if ICMP sockets are not allowed.
+    Return a dictionary mapping each address to True if pingable.
+    """
+    try:
+        results = icmp.ICMPProber().probe(addresses, timeout=timeout)
+    except EnvironmentError:
+        base.logger.debug(
+            'ICMP sockets not allowed, using ping',
+            exc_info=True,
+        )
+        results = dict((address, None) for address in addresses)
+    fallback = [
+        address for address, result in results.items()
+        if result is None
+    ]
+    for address, (result, error) in zip(
+        fallback,
+        run_concurrently(
+            [
+                (lambda address=address: _ping(base, address, timeout))
+                for address in fallback
+            ]
+        ),
+    ):
+        results[address] = bool(result)
+    return results
+
+
+def check_is_pingable(base, address, timeout=1.0):
+    """
+    Ensure that an address is pingable
+    """
+    return check_are_pingable(base, [address], timeout)[address]
+
+
+def process_uptime():
+    """
+    Return the number of seconds elapsed since this process started,
+    None if it cannot be computed.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # the command name can contain spaces, skip it
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        # starttime is the 22nd field, 20th after the command name
+        start = float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (EnvironmentError, IndexError, ValueError):
+        return None
+    return uptime - start
+
+
+def run_concurrently(functions, max_workers=None, logger=None):
+    """
+    Call every function of the list from a pool of at most max_workers
+    threads and wait for all of them.
+    Return a list of (result, exception) tuples in the same order of
+    functions; exception is None when the function succeeded.
+    The traceback of a failure is lost once out of its thread, it is
+    logged to logger when given.
+    """
+    results = [(None, None)] * len(functions)
+    pending = enumerate(functions)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                try:
+                    index, function = next(pending)
+                except StopIteration:
+                    return
+            try:
+                results[index] = (function(), None)
+            except Exception as e:
+                if logger is not None:
+                    logger.debug('exception', exc_info=True)
+                results[index] = (None, e)
+
+    workers = [
+        threading.Thread(target=worker)
+        for i in range(min(max_workers or len(functions), len(functions)))
+    ]
+    for t in workers:
+        t.daemon = True
+        t.start()
+    for t in workers:
+        t.join()
+    return results
+
+
+def register_validation(environment, name, value, validate):
+    """
+    Register the validation of an answer that is already known before
+    customization, to be run together with the other ones.
+    validate must raise RuntimeError if value is not valid.
+    """
+    environment[ohostedcons.CoreEnv.PRE_VALIDATIONS].append(
+        {
+            'name': name,
+            'value': value,
+            'validate': validate,
+        }
+    )
+
+
+def is_validated(environment, name, value):
+    """
+    Return True if value has already been successfully validated as name.
+    """
+    return (name, value) in environment.get(
+        ohostedcons.CoreEnv.VALIDATED,
+        set(),
+    )
 
 
 def persist(path):
@@ -26,6 +26,9 @@ vds utilities
 from vdsm import netinfo
 
 
+from . import constants as ohostedcons
+
+
 def capabilities(conn):
     """Returns a dictionary with the host capabilities"""
     result = conn.getVdsCapabilities()
@@ -56,9 +59,7 @@ def _evaluateDefaultRoute(attrs, cfg):
     return False
 
 
-def network(caps, device):
-    """Returns a dictionary that describes the network of the device"""
-    info = netinfo.NetInfo(caps)
+def _network(info, device):
     attrs = {}
     if device in info.vlans:
         port_info = info.vlans[device]
@@ -96,4 +97,83 @@ def network(caps, device):
     return attrs
 
 
+def _networks(info, devices):
+    result = {}
+    for device in devices:
+        try:
+            result[device] = _network(info, device)
+        except (RuntimeError, KeyError):
+            # not a bridge port, or one VDSM does not fully describe
+            pass
+    return result
+
+
+def network(caps, device):
+    """Returns a dictionary that describes the network of the device"""
+    return _network(netinfo.NetInfo(caps), device)
+
+
+def networks(caps, devices):
+    """
+    Returns a dictionary mapping each of the devices that is a supported
+    bridge port to the description of its network
+    """
+    return _networks(netinfo.NetInfo(caps), devices)
+
+
+class CapabilitiesSnapshot(object):
+    """
+    Host capabilities read once, with their NetInfo view built on the
+    first use.
+    """
+
+    def __init__(self, stage, conn):
+        super(CapabilitiesSnapshot, self).__init__()
+        self.stage = stage
+        self.caps = capabilities(conn)
+        self._net_info = None
+
+    def net_info(self):
+        """Returns the NetInfo view of the capabilities"""
+        if self._net_info is None:
+            self._net_info = netinfo.NetInfo(self.caps)
+        return self._net_info
+
+    def network(self, device):
+        """Returns a dictionary that describes the network of the device"""
+        return _network(self.net_info(), device)
+
+    def networks(self, devices):
+        """
+        Returns a dictionary mapping each of the devices that is a
+        supported bridge port to the description of its network
+        """
+        return _networks(self.net_info(), devices)
+
+
+def snapshot(plugin):
+    """
+    Returns the CapabilitiesSnapshot of the host, cached in the
+    environment for the duration of the current stage
+    """
+    stage = getattr(plugin.context, 'currentStage', None)
+    cached = plugin.environment.get(
+        ohostedcons.VDSMEnv.CAPABILITIES_SNAPSHOT
+    )
+    if cached is None or stage is None or cached.stage != stage:
+        cached = CapabilitiesSnapshot(
+            stage,
+            plugin.environment[ohostedcons.VDSMEnv.VDS_CLI],
+        )
+        plugin.environment[
+            ohostedcons.VDSMEnv.CAPABILITIES_SNAPSHOT
+        ] = cached
+    return cached
+
+
+def forget(plugin):
+    """Drops the cached snapshot, after changing the host networks"""
+    plugin.environment[ohostedcons.VDSMEnv.CAPABILITIES_SNAPSHOT] = None
+
+
 # vim: expandtab tabstop=4 shiftwidth=4
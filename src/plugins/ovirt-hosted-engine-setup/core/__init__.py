@@ -28,7 +28,9 @@ from . import misc
 from . import conf
 from . import answerfile
 from . import offlinepackager
+from . import prevalidation
 from . import preview
+from . import profiler
 from . import remote_answerfile
 from . import shell
 from . import titles
@@ -40,7 +42,9 @@ def createPlugins(context):
     conf.Plugin(context=context)
     answerfile.Plugin(context=context)
     offlinepackager.Plugin(context=context)
+    prevalidation.Plugin(context=context)
     preview.Plugin(context=context)
+    profiler.Plugin(context=context)
     remote_answerfile.Plugin(context=context)
     shell.Plugin(context=context)
     titles.Plugin(context=context)
@@ -126,9 +126,10 @@ class Plugin(plugin.PluginBase):
         ):
             # Defaults are ok for NFS and GlusterFS, need to change only
             # for iSCSI
+            # the first portal, the others are discovered from it
             subst['@SHARED_STORAGE@'] = self.environment[
                 ohostedcons.StorageEnv.ISCSI_IP_ADDR
-            ]
+            ].split(',')[0]
             subst['@IQN@'] = self.environment[
                 ohostedcons.StorageEnv.ISCSI_TARGET
             ]
@@ -77,6 +77,15 @@ class Plugin(plugin.PluginBase):
         priority=plugin.Stages.PRIORITY_FIRST,
     )
     def _setup(self):
+        # This is the first prompt: keep track of the time spent loading
+        # all the plugins to get here. Heavy SDKs (ovirtsdk, paramiko,
+        # M2Crypto, libxml2) are imported by the functions using them to
+        # keep it short, tests/startup_benchmark.py checks they stay so.
+        self.logger.debug(
+            'Time to first prompt: {uptime}s'.format(
+                uptime=ohostedutil.process_uptime(),
+            )
+        )
         interactive = self.environment[
             ohostedcons.CoreEnv.DEPLOY_PROCEED
         ] is None
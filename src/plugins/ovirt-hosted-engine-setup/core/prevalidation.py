@@ -0,0 +1,109 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Answers pre-validation plugin."""
+
+
+import gettext
+
+
+from otopi import plugin
+from otopi import util
+
+
+from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import util as ohostedutil
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-hosted-engine-setup')
+
+
+@util.export
+class Plugin(plugin.PluginBase):
+    """
+    Answers pre-validation plugin.
+    Plugins register at late setup the validations of the answers they
+    already received; they are run here concurrently before any dialog
+    and all the failures are reported at once.
+    Customization then skips the values already validated.
+    """
+
+    MAX_WORKERS = 8
+
+    def __init__(self, context):
+        super(Plugin, self).__init__(context=context)
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_INIT,
+    )
+    def _init(self):
+        self.environment[ohostedcons.CoreEnv.PRE_VALIDATIONS] = []
+        self.environment[ohostedcons.CoreEnv.VALIDATED] = set()
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_CUSTOMIZATION,
+        priority=plugin.Stages.PRIORITY_FIRST,
+        name=ohostedcons.Stages.PRE_VALIDATION,
+        before=(
+            ohostedcons.Stages.DIALOG_TITLES_S_STORAGE,
+        ),
+        condition=lambda self: self.environment[
+            ohostedcons.CoreEnv.PRE_VALIDATIONS
+        ],
+    )
+    def _customization(self):
+        validations = self.environment[ohostedcons.CoreEnv.PRE_VALIDATIONS]
+        self.logger.info(_('Validating the provided answers'))
+        results = ohostedutil.run_concurrently(
+            [v['validate'] for v in validations],
+            max_workers=self.MAX_WORKERS,
+        )
+        errors = []
+        for validation, (result, error) in zip(validations, results):
+            if error is None:
+                self.environment[ohostedcons.CoreEnv.VALIDATED].add(
+                    (validation['name'], validation['value'])
+                )
+            else:
+                self.logger.debug(
+                    'Validation of {name}={value} failed: {error}'.format(
+                        name=validation['name'],
+                        value=validation['value'],
+                        error=error,
+                    )
+                )
+                errors.append(
+                    '{name}: {error}'.format(
+                        name=validation['name'],
+                        error=error,
+                    )
+                )
+        if errors:
+            for error in errors:
+                self.logger.error(error)
+            raise RuntimeError(
+                _('The following answers are not valid: {errors}').format(
+                    errors=', '.join(errors),
+                )
+            )
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
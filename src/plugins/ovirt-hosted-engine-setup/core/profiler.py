@@ -0,0 +1,291 @@
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""Deploy flow profiler plugin."""
+
+
+import datetime
+import functools
+import gettext
+import json
+import os
+import time
+import types
+
+
+from otopi import constants as otopicons
+from otopi import plugin
+from otopi import util
+
+
+from ovirt_hosted_engine_setup import constants as ohostedcons
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-hosted-engine-setup')
+
+
+class _TimedProxy(object):
+    """
+    Forward every method call to the wrapped object, timing it.
+    """
+
+    def __init__(self, target, record):
+        self._target = target
+        self._record = record
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._record('rpc', name, start, time.time())
+        return timed
+
+
+@util.export
+class Plugin(plugin.PluginBase):
+    """
+    Deploy flow profiler plugin.
+    Times every event handler of the sequence, splitting the time spent
+    waiting for the user and waiting for VDSM from the rest.
+    Enabled by setting OVEHOSTED_CORE/profile on the command line, since
+    the handlers are wrapped at boot; a report sorted by elapsed time is
+    then logged and a trace loadable by chrome://tracing or flamegraph tools
+    is written in the log directory.
+    """
+
+    DIALOG_METHODS = (
+        'queryString',
+        'queryMultiString',
+        'queryValue',
+        'confirm',
+    )
+    REPORT_LINES = 30
+
+    def __init__(self, context):
+        super(Plugin, self).__init__(context=context)
+        self._stages = dict(
+            (getattr(plugin.Stages, name), name)
+            for name in dir(plugin.Stages)
+            if name.startswith('STAGE_')
+        )
+        self._origin = time.time()
+        self._handlers = []
+        self._trace = []
+        self._current = None
+        self._profiling = False
+
+    def _trace_event(self, category, name, start, end):
+        self._trace.append(
+            {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int((start - self._origin) * 1000000),
+                'dur': int((end - start) * 1000000),
+                'pid': os.getpid(),
+                'tid': 1,
+            }
+        )
+
+    def _record(self, category, name, start, end):
+        """
+        Record a user input or rpc wait inside the current event handler.
+        """
+        self._trace_event(category, name, start, end)
+        if self._current is not None:
+            self._current[category] += end - start
+
+    def _wrap_handler(self, stage, method):
+        """
+        Return method timed, still bound to its plugin.
+        """
+        name = '%s.%s' % (method.__module__, method.__name__)
+
+        @functools.wraps(method.__func__)
+        def timed(plugin_self):
+            entry = {
+                'stage': self._stages.get(stage, str(stage)),
+                'plugin': method.__module__,
+                'name': name,
+                'dialog': 0.0,
+                'rpc': 0.0,
+            }
+            self._current = entry
+            start = time.time()
+            try:
+                return method()
+            finally:
+                end = time.time()
+                self._current = None
+                entry['total'] = end - start
+                self._handlers.append(entry)
+                self._trace_event(entry['stage'], name, start, end)
+                self._wrap_vdscli()
+        return types.MethodType(timed, method.__self__)
+
+    def _wrap_dialog_method(self, name, method):
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._record('dialog', name, start, time.time())
+        return timed
+
+    def _wrap_dialog(self):
+        for name in self.DIALOG_METHODS:
+            method = getattr(self.dialog, name, None)
+            if method is not None:
+                setattr(
+                    self.dialog,
+                    name,
+                    self._wrap_dialog_method(name, method),
+                )
+
+    def _wrap_vdscli(self):
+        cli = self.environment.get(ohostedcons.VDSMEnv.VDS_CLI)
+        if (
+            self._profiling and
+            cli is not None and
+            not isinstance(cli, _TimedProxy)
+        ):
+            self.environment[ohostedcons.VDSMEnv.VDS_CLI] = _TimedProxy(
+                cli,
+                self._record,
+            )
+
+    def _report_by(self, key):
+        totals = {}
+        for entry in self._handlers:
+            totals[entry[key]] = totals.get(entry[key], 0) + entry['total']
+        self.logger.debug('Time by {key}:'.format(key=key))
+        for name, total in sorted(
+            totals.items(),
+            key=lambda x: x[1],
+            reverse=True,
+        ):
+            self.logger.debug('{total:10.3f}s {name}'.format(
+                total=total,
+                name=name,
+            ))
+
+    def _report(self):
+        self._report_by('stage')
+        self._report_by('plugin')
+        self.logger.debug(
+            'Slowest event handlers (total, user input, rpc, compute):'
+        )
+        for entry in sorted(
+            self._handlers,
+            key=lambda x: x['total'],
+            reverse=True,
+        )[:self.REPORT_LINES]:
+            self.logger.debug(
+                '{total:10.3f}s {dialog:10.3f}s {rpc:10.3f}s '
+                '{compute:10.3f}s {stage} {name}'.format(
+                    compute=max(
+                        entry['total'] - entry['dialog'] - entry['rpc'],
+                        0,
+                    ),
+                    **entry
+                )
+            )
+
+    def _write_trace(self):
+        path = os.path.join(
+            self.environment[otopicons.CoreEnv.LOG_DIR],
+            '%s-profile-%s.json' % (
+                ohostedcons.FileLocations.OVIRT_HOSTED_ENGINE_SETUP,
+                datetime.datetime.now().strftime('%Y%m%d%H%M%S'),
+            ),
+        )
+        try:
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': self._trace}, f)
+        except EnvironmentError as e:
+            self.logger.debug('exception', exc_info=True)
+            self.logger.warning(
+                _('Cannot write profiling data to {path}: {error}').format(
+                    path=path,
+                    error=e,
+                )
+            )
+        else:
+            self.logger.info(
+                _('Profiling data written to {path}').format(
+                    path=path,
+                )
+            )
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_BOOT,
+        priority=plugin.Stages.PRIORITY_FIRST,
+    )
+    def _boot(self):
+        # Only the environment given on the command line is known this
+        # early, which is where profiling is requested from.
+        if not self.environment.get(ohostedcons.CoreEnv.PROFILE):
+            return
+        # otopi does not offer hooks around event handlers, the sequence
+        # is already built at this point so wrap its methods in place.
+        sequence = getattr(self.context, '_sequence', None)
+        if sequence is None:
+            self.logger.debug('Event sequence not available, not profiling')
+            return
+        for stage, methodinfos in sequence.items():
+            for methodinfo in methodinfos:
+                method = methodinfo['method']
+                if getattr(method, '__self__', self) is not self:
+                    methodinfo['method'] = self._wrap_handler(stage, method)
+        self._profiling = True
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_INIT,
+        priority=plugin.Stages.PRIORITY_LAST,
+    )
+    def _init(self):
+        self.environment.setdefault(
+            ohostedcons.CoreEnv.PROFILE,
+            False
+        )
+        if self._profiling:
+            self._wrap_dialog()
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_TERMINATE,
+        priority=plugin.Stages.PRIORITY_LAST,
+        condition=lambda self: self._profiling,
+    )
+    def _terminate(self):
+        self._report()
+        self._write_trace()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
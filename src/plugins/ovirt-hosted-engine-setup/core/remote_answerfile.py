@@ -24,7 +24,6 @@
 import configparser
 import gettext
 import os
-import paramiko
 import socket
 import tempfile
 
@@ -53,6 +52,8 @@ class Plugin(plugin.PluginBase):
         self._tmp_ans = None
 
     def _get_fqdn(self):
+        import paramiko
+
         fqdn_interactive = self.environment[
             ohostedcons.FirstHostEnv.FQDN
         ] is None
@@ -104,6 +105,8 @@ class Plugin(plugin.PluginBase):
                     transport.close()
 
     def _fetch_answer_file(self):
+        import paramiko
+
         self.logger.debug('_fetch_answer_file')
         fqdn = self.environment[ohostedcons.FirstHostEnv.FQDN]
         interactive = (
@@ -26,16 +26,12 @@ Hosted Engine Disk adder plugin.
 import gettext
 
 
-import ovirtsdk.api
-import ovirtsdk.infrastructure.errors
-import ovirtsdk.xml
-
-
 from otopi import plugin
 from otopi import util
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import storage_connections
 
 
 def _(m):
@@ -108,19 +104,33 @@ class Plugin(plugin.PluginBase):
         ),
     )
     def _closeup(self):
+        import ovirtsdk.api
+        import ovirtsdk.infrastructure.errors
+        import ovirtsdk.xml
+
         if self.environment[
             ohostedcons.StorageEnv.DOMAIN_TYPE
         ] == ohostedcons.DomainTypes.ISCSI:
-            lun = ovirtsdk.xml.params.LogicalUnit(
-                id=self.environment[ohostedcons.StorageEnv.GUID],
-                address=self.environment[ohostedcons.StorageEnv.ISCSI_IP_ADDR],
-                port=int(self.environment[ohostedcons.StorageEnv.ISCSI_PORT]),
-                target=self.environment[ohostedcons.StorageEnv.ISCSI_TARGET],
-                username=self.environment[ohostedcons.StorageEnv.ISCSI_USER],
-                password=self.environment[
-                    ohostedcons.StorageEnv.ISCSI_PASSWORD
-                ],
-            )
+            # a logical unit per path, the engine connects to all of them
+            luns = [
+                ovirtsdk.xml.params.LogicalUnit(
+                    id=self.environment[ohostedcons.StorageEnv.GUID],
+                    address=address,
+                    port=int(port),
+                    target=self.environment[
+                        ohostedcons.StorageEnv.ISCSI_TARGET
+                    ],
+                    username=self.environment[
+                        ohostedcons.StorageEnv.ISCSI_USER
+                    ],
+                    password=self.environment[
+                        ohostedcons.StorageEnv.ISCSI_PASSWORD
+                    ],
+                )
+                for address, port, tpgt in storage_connections.iscsi_portals(
+                    self.environment
+                )
+            ]
             stype = 'iscsi'
         elif self.environment[
             ohostedcons.StorageEnv.DOMAIN_TYPE
@@ -128,12 +138,14 @@ class Plugin(plugin.PluginBase):
             # it's not really possible today to add a FC LUN as a direct LUN
             # but adding it as a fake iSCSI Direct LUN is enough to
             # prevent improper usage of the hosted engine LUN
-            lun = ovirtsdk.xml.params.LogicalUnit(
-                id=self.environment[ohostedcons.StorageEnv.GUID],
-                address='0.0.0.0',
-                port=int(ohostedcons.Defaults.DEFAULT_ISCSI_PORT),
-                target='none',
-            )
+            luns = [
+                ovirtsdk.xml.params.LogicalUnit(
+                    id=self.environment[ohostedcons.StorageEnv.GUID],
+                    address='0.0.0.0',
+                    port=int(ohostedcons.Defaults.DEFAULT_ISCSI_PORT),
+                    target='none',
+                ),
+            ]
             stype = 'iscsi'
 
         disk = ovirtsdk.xml.params.Disk(
@@ -144,9 +156,7 @@ class Plugin(plugin.PluginBase):
             format='raw',
             lun_storage=ovirtsdk.xml.params.Storage(
                 type_=stype,
-                logical_unit=[
-                    lun,
-                ],
+                logical_unit=luns,
             ),
         )
         try:
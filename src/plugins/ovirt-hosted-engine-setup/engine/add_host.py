@@ -30,11 +30,6 @@ import tempfile
 import time
 
 
-import ovirtsdk.api
-import ovirtsdk.infrastructure.errors
-import ovirtsdk.xml
-
-
 from otopi import constants as otopicons
 from otopi import filetransaction
 from otopi import plugin
@@ -42,11 +37,9 @@ from otopi import transaction
 from otopi import util
 
 
-from vdsm import netinfo
-
-
 from ovirt_hosted_engine_setup import check_liveliness
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import engine_session
 from ovirt_hosted_engine_setup import vds_info
 from ovirt_hosted_engine_setup import pkissh
 
@@ -63,25 +56,99 @@ class Plugin(plugin.PluginBase):
 
     VDSM_RETRIES = 600
     VDSM_DELAY = 1
+    VDSM_MAX_DELAY = 10
+    HOST_NOTICE_INTERVAL = 30
 
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
-        self._ovirtsdk_api = ovirtsdk.api
-        self._ovirtsdk_xml = ovirtsdk.xml
+        self._ovirtsdk_xml = None
         self._interactive_admin_pwd = True
 
-    def _wait_host_ready(self, engine_api, host):
+    def _get_last_event_id(self, session):
+        """
+        Return the id of the most recent event on the engine, None if the
+        events feed is not available.
+        """
+        try:
+            with session.timed('events.list'):
+                events = session.api.events.list(max=1)
+        except Exception as exc:
+            # Sadly all ovirtsdk errors inherit only from Exception
+            self.logger.debug(
+                'Error fetching the engine events: {error}'.format(
+                    error=str(exc),
+                )
+            )
+            return None
+        return max([int(e.get_id()) for e in events] or [0])
+
+    def _wait_host_event(self, session, host_id, last_event_id, delay):
+        """
+        Follow the engine events feed for up to delay seconds.
+        Return as soon as an event about host_id shows up, together with
+        the id of the last event seen.
+        Without an events feed this degrades to a plain sleep.
+        """
+        if last_event_id is None:
+            time.sleep(delay)
+            return False, None
+        deadline = time.time() + delay
+        while True:
+            try:
+                with session.timed('events.list'):
+                    events = session.api.events.list(
+                        from_event_id=last_event_id,
+                    )
+            except Exception as exc:
+                # Sadly all ovirtsdk errors inherit only from Exception
+                self.logger.debug(
+                    'Error following the engine events: {error}'.format(
+                        error=str(exc),
+                    )
+                )
+                events = []
+            found = False
+            for event in events:
+                last_event_id = max(last_event_id, int(event.get_id()))
+                event_host = event.get_host()
+                if event_host is not None and event_host.get_id() == host_id:
+                    self.logger.debug(
+                        'Engine event {code}: {description}'.format(
+                            code=event.get_code(),
+                            description=event.get_description(),
+                        )
+                    )
+                    found = True
+            remaining = deadline - time.time()
+            if found or remaining <= 0:
+                return found, last_event_id
+            time.sleep(min(self.VDSM_DELAY, remaining))
+
+    def _wait_host_ready(self, session, host):
+        """
+        Wait for the host to become operational in the engine.
+        The host entity is fetched again only when the events feed reports
+        something about it or when the current backoff delay expires, so
+        that the engine is not flooded while it is busy deploying the host.
+        """
         self.logger.info(_(
             'Waiting for the host to become operational in the engine. '
             'This may take several minutes...'
         ))
 
-        tries = self.VDSM_RETRIES
+        now = time.time()
+        deadline = now + self.VDSM_RETRIES * self.VDSM_DELAY
+        next_notice = now + self.HOST_NOTICE_INTERVAL
+        delay = self.VDSM_DELAY
+        last_event_id = self._get_last_event_id(session)
+        host_id = None
         isUp = False
-        while not isUp and tries > 0:
-            tries -= 1
+        failed = False
+        while not isUp and not failed and time.time() < deadline:
             try:
-                state = engine_api.hosts.get(host).status.state
+                h = session.host(host)
+                host_id = h.get_id()
+                state = h.status.state
             except Exception as exc:
                 # Sadly all ovirtsdk errors inherit only from Exception
                 self.logger.debug(
@@ -100,64 +167,76 @@ class Plugin(plugin.PluginBase):
                     'The VDSM host was found in a failed state. '
                     'Please check engine and bootstrap installation logs.'
                 ))
-                tries = -1  # Error state
+                failed = True
             elif state == 'up':
                 isUp = True
                 self.logger.info(_('The VDSM Host is now operational'))
             else:
                 if state == 'non_operational':
-                    if not self._retry_non_operational(
-                        engine_api,
-                        self.environment[ohostedcons.EngineEnv.APP_HOST_NAME],
-                    ):
+                    if not self._retry_non_operational(session, h):
                         # It's up, but non-operational and missing some
                         # required networks. _retry_non_operational
                         # already gave enough info, rest of code can assume
                         # it's up.
                         isUp = True
-                if tries % 30 == 0:
+                        continue
+                if time.time() >= next_notice:
+                    next_notice = time.time() + self.HOST_NOTICE_INTERVAL
                     self.logger.info(_(
                         'Still waiting for VDSM host to become operational...'
                     ))
-                time.sleep(self.VDSM_DELAY)
-        if not isUp and tries == 0:
+                notified, last_event_id = self._wait_host_event(
+                    session,
+                    host_id,
+                    last_event_id,
+                    min(delay, max(deadline - time.time(), 0)),
+                )
+                if notified:
+                    delay = self.VDSM_DELAY
+                else:
+                    delay = min(delay * 2, self.VDSM_MAX_DELAY)
+        if not isUp and not failed:
             self.logger.error(_(
                 'Timed out while waiting for host to start. '
                 'Please check the logs.'
             ))
         return isUp
 
-    def _retry_non_operational(self, engine_api, host):
+    def _retry_non_operational(self, session, h):
         """Return True if we should continue trying to add the host"""
         ret = True
+        host = h.get_name()
         try:
-            cluster = engine_api.clusters.get(
+            cluster = session.cluster(
                 self.environment[
                     ohostedcons.EngineEnv.HOST_CLUSTER_NAME
                 ]
             )
-            h = engine_api.hosts.get(host)
-            required_networks = set(
-                [
-                    rn.get_id()
-                    for rn in cluster.networks.list(required=True)
-                ]
-            )
-            configured_networks = set(
-                [
-                    nic.get_network().get_id()
-                    for nic in h.nics.list()
-                    if nic.get_network()
-                ]
-            )
+            with session.timed('networks.list'):
+                required_networks = set(
+                    [
+                        rn.get_id()
+                        for rn in cluster.networks.list(required=True)
+                    ]
+                )
+            with session.timed('nics.list'):
+                configured_networks = set(
+                    [
+                        nic.get_network().get_id()
+                        for nic in h.nics.list()
+                        if nic.get_network()
+                    ]
+                )
             if (
                 len(required_networks) > 1 and
                 required_networks > configured_networks
             ):
                 tbc = required_networks - configured_networks
-                rnet = [
-                    engine_api.networks.get(id=rn).get_name() for rn in tbc
-                ]
+                with session.timed('networks.get'):
+                    rnet = [
+                        session.api.networks.get(id=rn).get_name()
+                        for rn in tbc
+                    ]
                 self.dialog.note(
                     _(
                         '\nThe following required networks\n'
@@ -256,12 +335,12 @@ class Plugin(plugin.PluginBase):
             )
         return ret
 
-    def _wait_cluster_cpu_ready(self, engine_api, cluster_name):
+    def _wait_cluster_cpu_ready(self, session, cluster_name):
         tries = self.VDSM_RETRIES
         cpu = None
         while cpu is None and tries > 0:
             tries -= 1
-            cluster = engine_api.clusters.get(cluster_name)
+            cluster = session.cluster(cluster_name, refresh=True)
             cpu = cluster.get_cpu()
             if cpu is None:
                 self.logger.debug(
@@ -465,12 +544,6 @@ class Plugin(plugin.PluginBase):
         )
         self._selinux_enabled = False
 
-    @plugin.event(
-        stage=plugin.Stages.STAGE_SETUP,
-    )
-    def _setup(self):
-        self.command.detect('ip')
-
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
         after=(
@@ -563,6 +636,10 @@ class Plugin(plugin.PluginBase):
         name=ohostedcons.Stages.HOST_ADDED,
     )
     def _closeup(self):
+        import ovirtsdk.infrastructure.errors
+        import ovirtsdk.xml
+
+        self._ovirtsdk_xml = ovirtsdk.xml
         # TODO: refactor into shorter and simpler functions
         self._getCA()
         self._getSSH()
@@ -580,11 +657,8 @@ class Plugin(plugin.PluginBase):
                     ohostedcons.EngineEnv.INSECURE_SSL
                 ]:
                     insecure = True
-                engine_api = self._ovirtsdk_api.API(
-                    url='https://{fqdn}/ovirt-engine/api'.format(
-                        fqdn=fqdn,
-                    ),
-                    username='admin@internal',
+                session = engine_session.EngineSession(
+                    fqdn=fqdn,
                     password=self.environment[
                         ohostedcons.EngineEnv.ADMIN_PASSWORD
                     ],
@@ -593,7 +667,7 @@ class Plugin(plugin.PluginBase):
                     ],
                     insecure=insecure,
                 )
-                engine_api.clusters.list()
+                session.connect()
                 valid = True
             except ovirtsdk.infrastructure.errors.RequestError as e:
                 if e.status == 401:
@@ -652,10 +726,7 @@ class Plugin(plugin.PluginBase):
                     "Getting the list of available clusters via engine's APIs"
                 )
                 if cluster_name is not None:
-                    if cluster_name not in [
-                        c.get_name()
-                        for c in engine_api.clusters.list()
-                    ]:
+                    if cluster_name not in session.cluster_names():
                         raise RuntimeError(
                             _(
                                 'Specified cluster does not exist: {cluster}'
@@ -664,10 +735,7 @@ class Plugin(plugin.PluginBase):
                             )
                         )
                 else:
-                    cluster_l = [
-                        c.get_name()
-                        for c in engine_api.clusters.list()
-                    ]
+                    cluster_l = session.cluster_names()
                     cluster_name = (
                         default_cluster_name if default_cluster_name in
                         cluster_l else cluster_l[0]
@@ -686,13 +754,12 @@ class Plugin(plugin.PluginBase):
                     self.environment[
                         ohostedcons.EngineEnv.HOST_CLUSTER_NAME
                     ] = cluster_name
-                cluster = engine_api.clusters.get(cluster_name)
+                cluster = session.cluster(cluster_name)
 
-                conn = self.environment[ohostedcons.VDSMEnv.VDS_CLI]
-                net_info = netinfo.NetInfo(vds_info.capabilities(conn))
                 bridge_port = self.environment[
                     ohostedcons.NetworkEnv.BRIDGE_IF
                 ]
+                net_info = vds_info.snapshot(self).net_info()
                 if bridge_port in net_info.vlans:
                     self.logger.debug(
                         "Updating engine's management network to be vlanned"
@@ -701,14 +768,16 @@ class Plugin(plugin.PluginBase):
                     self.logger.debug(
                         "Getting engine's management network via engine's APIs"
                     )
-                    mgmt_network = cluster.networks.get(
-                        name=self.environment[
-                            ohostedcons.NetworkEnv.BRIDGE_NAME]
-                    )
+                    with session.timed('networks.get'):
+                        mgmt_network = cluster.networks.get(
+                            name=self.environment[
+                                ohostedcons.NetworkEnv.BRIDGE_NAME]
+                        )
                     mgmt_network.set_vlan(
                         self._ovirtsdk_xml.params.VLAN(id=vlan_id)
                     )
-                    mgmt_network.update()
+                    with session.timed('networks.update'):
+                        mgmt_network.update()
 
                 # Configuring the cluster for Hyper Converged support if
                 # enabled
@@ -716,33 +785,36 @@ class Plugin(plugin.PluginBase):
                     ohostedcons.StorageEnv.GLUSTER_PROVISIONING_ENABLED
                 ]:
                     cluster.set_gluster_service(True)
-                    cluster.update()
-                    cluster = engine_api.clusters.get(cluster_name)
+                    with session.timed('clusters.update'):
+                        cluster.update()
+                    cluster = session.cluster(cluster_name, refresh=True)
 
                 self.logger.debug('Adding the host to the cluster')
 
-                engine_api.hosts.add(
-                    self._ovirtsdk_xml.params.Host(
-                        name=self.environment[
-                            ohostedcons.EngineEnv.APP_HOST_NAME
-                        ],
-                        # Note that the below is required for compatibility
-                        # with vdsm-generated pki. See bz 1178535.
-                        # TODO: Make it configurable like engine fqdn.
-                        address=socket.gethostname(),
-                        reboot_after_installation=False,
-                        cluster=cluster,
-                        ssh=self._ovirtsdk_xml.params.SSH(
-                            authentication_method='publickey',
-                            port=self.environment[
-                                ohostedcons.NetworkEnv.SSHD_PORT
+                with session.timed('hosts.add'):
+                    session.api.hosts.add(
+                        self._ovirtsdk_xml.params.Host(
+                            name=self.environment[
+                                ohostedcons.EngineEnv.APP_HOST_NAME
                             ],
-                        ),
-                        override_iptables=self.environment[
-                            otopicons.NetEnv.IPTABLES_ENABLE
-                        ],
+                            # Note that the below is required for
+                            # compatibility with vdsm-generated pki.
+                            # See bz 1178535.
+                            # TODO: Make it configurable like engine fqdn.
+                            address=socket.gethostname(),
+                            reboot_after_installation=False,
+                            cluster=cluster,
+                            ssh=self._ovirtsdk_xml.params.SSH(
+                                authentication_method='publickey',
+                                port=self.environment[
+                                    ohostedcons.NetworkEnv.SSHD_PORT
+                                ],
+                            ),
+                            override_iptables=self.environment[
+                                otopicons.NetEnv.IPTABLES_ENABLE
+                            ],
+                        )
                     )
-                )
                 added_to_cluster = True
             except ovirtsdk.infrastructure.errors.RequestError as e:
                 self.logger.debug(
@@ -768,7 +840,7 @@ class Plugin(plugin.PluginBase):
                     pass
 
         up = self._wait_host_ready(
-            engine_api,
+            session,
             self.environment[ohostedcons.EngineEnv.APP_HOST_NAME]
         )
         # TODO: host-deploy restarted vdscli so we need to
@@ -788,7 +860,7 @@ class Plugin(plugin.PluginBase):
             self.logger.debug('Setting CPU for the cluster')
             try:
                 cluster, cpu = self._wait_cluster_cpu_ready(
-                    engine_api,
+                    session,
                     cluster_name
                 )
                 self.logger.debug(cpu.__dict__)
@@ -796,7 +868,8 @@ class Plugin(plugin.PluginBase):
                     self.environment[ohostedcons.VDSMEnv.ENGINE_CPU]
                 )
                 cluster.set_cpu(cpu)
-                cluster.update()
+                with session.timed('clusters.update'):
+                    cluster.update()
             except ovirtsdk.infrastructure.errors.RequestError as e:
                 self.logger.debug(
                     'Cannot set CPU level of cluster {cluster}'.format(
@@ -813,7 +886,7 @@ class Plugin(plugin.PluginBase):
                         details=e.detail
                     )
                 )
-        engine_api.disconnect()
+        session.disconnect()
 
     @plugin.event(
         stage=plugin.Stages.STAGE_CLEANUP,
@@ -31,6 +31,8 @@ from otopi import util
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import resolver
+from ovirt_hosted_engine_setup import util as ohostedutil
 
 
 def _(m):
@@ -53,42 +55,9 @@ class Plugin(plugin.PluginBase):
         """
     )
 
-    _DIG_LOOKUP_RE = re.compile(
-        flags=re.VERBOSE,
-        pattern=r"""
-            ^
-            [\w.-]+
-            \s+
-            \d+
-            \s+
-            IN
-            \s+
-            (A|CNAME)
-            \s+
-            [\w.-]+
-        """
-    )
-
-    _DIG_REVLOOKUP_RE = re.compile(
-        flags=re.VERBOSE,
-        pattern=r"""
-            ^
-            (?P<query>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}).in-addr.arpa.
-            \s+
-            \d+
-            \s+
-            IN
-            \s+
-            PTR
-            \s+
-            (?P<answer>[\w.-]+)
-            \.
-            $
-        """
-    )
-
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
+        self._resolver = resolver.Resolver()
 
     def _validateFQDN(self, fqdn):
         if self._IPADDR_RE.match(fqdn):
@@ -138,29 +107,37 @@ class Plugin(plugin.PluginBase):
 
     def _validateFQDNresolvability(self, fqdn):
         try:
-            resolvedAddresses = set([
-                address[0] for __, __, __, __, address in
-                socket.getaddrinfo(
-                    fqdn,
-                    None
-                )
-            ])
-            self.logger.debug(
-                '{fqdn} resolves to: {addresses}'.format(
-                    fqdn=fqdn,
-                    addresses=resolvedAddresses,
-                )
-            )
-            resolvedAddressesAsString = ' '.join(resolvedAddresses)
-        except socket.error:
+            self._checkFQDNresolvability(fqdn)
+        except RuntimeError:
+            # let the user fix DNS or /etc/hosts and try again
+            self._resolver.forget(fqdn)
+            raise
+
+    def _checkFQDNresolvability(self, fqdn):
+        result = self._resolver.resolve(
+            fqdn,
+            reverse=self.environment[
+                ohostedcons.NetworkEnv.FQDN_REVERSE_VALIDATION
+            ],
+        )
+        if not result.addresses:
             raise RuntimeError(
                 _('{fqdn} did not resolve into an IP address').format(
                     fqdn=fqdn,
                 )
             )
+        self.logger.debug(
+            '{fqdn} resolves to: {addresses}, DNS: {dns}, '
+            '/etc/hosts: {hosts}, reverse: {reverse}'.format(
+                fqdn=fqdn,
+                addresses=result.addresses,
+                dns=result.dns,
+                hosts=result.hosts,
+                reverse=result.reverse,
+            )
+        )
 
-        resolvedByDNS = self._resolvedByDNS(fqdn)
-        if not resolvedByDNS:
+        if not result.resolved_by_dns:
             self.logger.warning(
                 _(
                     'Failed to resolve {fqdn} using DNS, '
@@ -170,58 +147,31 @@ class Plugin(plugin.PluginBase):
                 )
             )
         elif self.environment[ohostedcons.NetworkEnv.FQDN_REVERSE_VALIDATION]:
-            revResolved = False
-            for address in resolvedAddresses:
-                for name in self._dig_reverse_lookup(address):
-                    revResolved = name.lower() == fqdn.lower()
-                    if revResolved:
-                        break
-                if revResolved:
-                    break
-            if not revResolved:
+            if not result.reverse_resolved():
                 raise RuntimeError(
                     _(
                         'The following addresses: {addresses} did not reverse'
                         'resolve into {fqdn}'
                     ).format(
-                        addresses=resolvedAddressesAsString,
+                        addresses=' '.join(sorted(result.reverse)),
                         fqdn=fqdn
                     )
                 )
 
-    def _resolvedByDNS(self, fqdn):
-        args = (
-            self.command.get('dig'),
-            fqdn,
-        )
-        rc, stdout, stderr = self.execute(
-            args=args,
-            raiseOnError=False
-        )
-        resolved = False
-        if rc == 0:
-            for line in stdout:
-                if self._DIG_LOOKUP_RE.search(line):
-                    resolved = True
-        return resolved
+    def _validate_engine_fqdn(self, fqdn):
+        try:
+            self._validateFQDN(fqdn)
+            self._validateFQDNresolvability(fqdn)
+        except RuntimeError as e:
+            raise RuntimeError(
+                _('Host name is not valid: {error}').format(
+                    error=e,
+                ),
+            )
 
-    def _dig_reverse_lookup(self, addr):
-        names = set()
-        args = (
-            self.command.get('dig'),
-            '-x',
-            addr,
-        )
-        rc, stdout, stderr = self.execute(
-            args=args,
-            raiseOnError=False
-        )
-        if rc == 0:
-            for line in stdout:
-                found = self._DIG_REVLOOKUP_RE.search(line)
-                if found:
-                    names.add(found.group('answer'))
-        return names
+    def _validate_host_fqdn(self, fqdn):
+        self._validateFQDN(fqdn)
+        self._validateFQDNresolvability(fqdn)
 
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
@@ -237,11 +187,29 @@ class Plugin(plugin.PluginBase):
         )
 
     @plugin.event(
-        stage=plugin.Stages.STAGE_SETUP,
+        stage=plugin.Stages.STAGE_LATE_SETUP,
     )
-    def _setup(self):
-        # Can't use python api here, it will call sys.exit
-        self.command.detect('dig')
+    def _late_setup(self):
+        fqdn = (
+            self.environment[
+                ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
+            ] or
+            self.environment[ohostedcons.CloudInit.INSTANCE_HOSTNAME]
+        )
+        if fqdn:
+            ohostedutil.register_validation(
+                self.environment,
+                'engine_fqdn',
+                fqdn,
+                lambda: self._validate_engine_fqdn(fqdn),
+            )
+        hostname = socket.gethostname()
+        ohostedutil.register_validation(
+            self.environment,
+            'host_fqdn',
+            hostname,
+            lambda: self._validate_host_fqdn(hostname),
+        )
 
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
@@ -290,38 +258,34 @@ class Plugin(plugin.PluginBase):
                     prompt=True,
                     caseSensitive=True,
                 )
+            fqdn = self.environment[
+                ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
+            ]
             try:
-                self._validateFQDN(
-                    self.environment[
-                        ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
-                    ]
-                )
-                self._validateFQDNresolvability(
-                    self.environment[
-                        ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
-                    ]
-                )
+                if not ohostedutil.is_validated(
+                    self.environment,
+                    'engine_fqdn',
+                    fqdn,
+                ):
+                    self._validate_engine_fqdn(fqdn)
                 valid = True
             except RuntimeError as e:
                 self.logger.debug('exception', exc_info=True)
                 if interactive:
-                    self.logger.error(
-                        _('Host name is not valid: {error}').format(
-                            error=e,
-                        ),
-                    )
+                    self.logger.error(e)
                 else:
-                    raise RuntimeError(
-                        _('Host name is not valid: {error}').format(
-                            error=e,
-                        ),
-                    )
+                    raise
 
     @plugin.event(
         stage=plugin.Stages.STAGE_VALIDATION,
     )
     def _validation(self):
-        self._validateFQDN(socket.gethostname())
-        self._validateFQDNresolvability(socket.gethostname())
+        hostname = socket.gethostname()
+        if not ohostedutil.is_validated(
+            self.environment,
+            'host_fqdn',
+            hostname,
+        ):
+            self._validate_host_fqdn(hostname)
 
 # vim: expandtab tabstop=4 shiftwidth=4
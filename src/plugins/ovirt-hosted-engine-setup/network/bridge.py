@@ -23,18 +23,17 @@ bridge configuration plugin.
 """
 
 
-import ethtool
 import gettext
+import time
 
 
 from otopi import util
 from otopi import plugin
 
 
-from vdsm import netinfo
-
-
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import netlink
+from ovirt_hosted_engine_setup import util as ohostedutil
 from ovirt_hosted_engine_setup import vds_info
 
 
@@ -46,12 +45,29 @@ def _(m):
 class Plugin(plugin.PluginBase):
     """
     bridge configuration plugin.
+    While VDSM configures the bridge the tasks in
+    OVEHOSTED_NETWORK/bridgeSetupTasks, which must not need the network,
+    run concurrently.
     """
 
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
         self._enabled = True
 
+    def _configure_bridge(self, conn, networks):
+        """
+        Set up and persist the networks, returning how long each step
+        took.
+        """
+        timings = {}
+        start = time.time()
+        _setupNetworks(conn, networks, {}, {'connectivityCheck': False})
+        timings['setupNetworks'] = time.time() - start
+        start = time.time()
+        _setSafeNetworkConfig(conn)
+        timings['setSafeNetworkConfig'] = time.time() - start
+        return timings
+
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
     )
@@ -64,6 +80,7 @@ class Plugin(plugin.PluginBase):
             ohostedcons.NetworkEnv.BRIDGE_NAME,
             ohostedcons.Defaults.DEFAULT_BRIDGE_NAME
         )
+        self.environment[ohostedcons.NetworkEnv.BRIDGE_SETUP_TASKS] = []
 
     @plugin.event(
         stage=plugin.Stages.STAGE_SETUP,
@@ -71,7 +88,7 @@ class Plugin(plugin.PluginBase):
     def _setup(self):
         if (
             self.environment[ohostedcons.NetworkEnv.BRIDGE_NAME] in
-            ethtool.get_devices()
+            netlink.snapshot(self).devices()
         ):
             self.logger.info(
                 _(
@@ -96,11 +113,8 @@ class Plugin(plugin.PluginBase):
         ),
     )
     def _customization(self):
-        info = netinfo.NetInfo(
-            vds_info.capabilities(
-                self.environment[ohostedcons.VDSMEnv.VDS_CLI]
-            )
-        )
+        capabilities = vds_info.snapshot(self)
+        info = capabilities.net_info()
         interfaces = set(
             info.nics.keys() +
             info.bondings.keys() +
@@ -122,7 +136,10 @@ class Plugin(plugin.PluginBase):
                 )
                 inv_bond.update(set([bond]))
 
-        validValues = list(interfaces - enslaved - inv_bond)
+        # only the supported bridge ports
+        validValues = list(
+            capabilities.networks(interfaces - enslaved - inv_bond).keys()
+        )
         self.logger.debug('Nics detected: %s' % ','.join(interfaces))
         self.logger.debug('Nics enslaved: %s' % ','.join(enslaved))
         self.logger.debug('Nics valid: %s' % ','.join(validValues))
@@ -178,15 +195,37 @@ class Plugin(plugin.PluginBase):
     def _misc(self):
         self.logger.info(_('Configuring the management bridge'))
         conn = self.environment[ohostedcons.VDSMEnv.VDS_CLI]
+        attrs = vds_info.snapshot(self).network(
+            self.environment[ohostedcons.NetworkEnv.BRIDGE_IF]
+        )
         networks = {
-            self.environment[ohostedcons.NetworkEnv.BRIDGE_NAME]:
-            vds_info.network(
-                vds_info.capabilities(conn),
-                self.environment[ohostedcons.NetworkEnv.BRIDGE_IF]
-            )
+            self.environment[ohostedcons.NetworkEnv.BRIDGE_NAME]: attrs,
         }
-        _setupNetworks(conn, networks, {}, {'connectivityCheck': False})
-        _setSafeNetworkConfig(conn)
+        tasks = self.environment[ohostedcons.NetworkEnv.BRIDGE_SETUP_TASKS]
+        results = ohostedutil.run_concurrently(
+            [lambda: self._configure_bridge(conn, networks)] + tasks,
+            logger=self.logger,
+        )
+        # the capabilities read before do not describe the bridge
+        vds_info.forget(self)
+        (timings, error) = results[0]
+        if error is None:
+            self.logger.debug(
+                'Bridge setup times: setupNetworks {setup:.3f}s{dhcp}, '
+                'setSafeNetworkConfig {safe:.3f}s, '
+                '{tasks} concurrent tasks'.format(
+                    setup=timings['setupNetworks'],
+                    dhcp=(
+                        ' (including DHCP)'
+                        if attrs.get('bootproto') == 'dhcp' else ''
+                    ),
+                    safe=timings['setSafeNetworkConfig'],
+                    tasks=len(tasks),
+                )
+            )
+        for result, error in results:
+            if error is not None:
+                raise error
 
     @plugin.event(
         stage=plugin.Stages.STAGE_CLOSEUP,
@@ -24,10 +24,12 @@ Firewall manager selection plugin.
 
 
 import gettext
-import libxml2
 import os
 
 
+from xml.etree import ElementTree
+
+
 from otopi import constants as otopicons
 from otopi import filetransaction
 from otopi import plugin
@@ -48,58 +50,78 @@ class Plugin(plugin.PluginBase):
     Firewall manager selection plugin.
     """
 
-    def _parseFirewalld(self, format):
-        ret = ''
-        for content in [
-            content
-            for key, content in self.environment.items()
-            if key.startswith(
-                otopicons.NetEnv.FIREWALLD_SERVICE_PREFIX
-            )
-        ]:
-            doc = None
-            ctx = None
-            try:
-                doc = libxml2.parseDoc(content)
-                ctx = doc.xpathNewContext()
-                nodes = ctx.xpathEval("/service/port")
-                for node in nodes:
-                    ret += format.format(
-                        protocol=node.prop('protocol'),
-                        port=node.prop('port'),
+    def _parseFirewalld(self):
+        """
+        Return a dictionary mapping the name of each firewalld service in
+        the environment to the set of (protocol, port) it opens.
+        Each service definition is parsed only once.
+        """
+        services = {}
+        for key, content in self.environment.items():
+            if key.startswith(otopicons.NetEnv.FIREWALLD_SERVICE_PREFIX):
+                name = key[len(otopicons.NetEnv.FIREWALLD_SERVICE_PREFIX):]
+                cached = self._services.get(name)
+                if cached is None or cached[0] != content:
+                    cached = (
+                        content,
+                        frozenset(
+                            (node.get('protocol'), node.get('port'))
+                            for node in ElementTree.fromstring(
+                                content
+                            ).findall('port')
+                        ),
                     )
-            finally:
-                if doc is not None:
-                    doc.freeDoc()
-                if ctx is not None:
-                    ctx.xpathFreeContext()
+                services[name] = cached
+        self._services = services
+        return dict(
+            (name, ports) for name, (content, ports) in services.items()
+        )
 
-        return ret
+    def _ports(self):
+        """
+        Return the sorted (protocol, port) opened by any firewalld service.
+        """
+        ports = set()
+        for service_ports in self._parseFirewalld().values():
+            ports.update(service_ports)
+        return sorted(ports)
 
     def _createIptablesConfig(self):
         return ohostedutil.processTemplate(
             ohostedcons.FileLocations.HOSTED_ENGINE_IPTABLES_TEMPLATE,
             subst={
-                '@CUSTOM_RULES@': self._parseFirewalld(
-                    format=(
+                '@CUSTOM_RULES@': ''.join(
+                    (
                         '-A INPUT -p {protocol} -m state --state NEW '
                         '-m {protocol} --dport {port} -j ACCEPT\n'
+                    ).format(
+                        protocol=protocol,
+                        port=port,
                     )
+                    for protocol, port in self._ports()
                 )
             }
         )
 
     def _createHumanConfig(self):
-        return '\n'.join(
-            sorted(
-                self._parseFirewalld(
-                    format='{protocol}:{port}\n',
-                ).splitlines()
+        return ''.join(
+            '{protocol}:{port}\n'.format(
+                protocol=protocol,
+                port=port,
             )
-        ) + '\n'
+            for protocol, port in self._ports()
+        )
+
+    def _createFirewalldCommands(self):
+        return [
+            'firewall-cmd -service %s' % service
+            for service in sorted(self._parseFirewalld())
+        ]
 
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
+        # service name: (definition, ports) already parsed
+        self._services = {}
 
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
@@ -286,15 +308,7 @@ class Plugin(plugin.PluginBase):
             )
         )
 
-        commands = []
-        for service in [
-            key[len(otopicons.NetEnv.FIREWALLD_SERVICE_PREFIX):]
-            for key in self.environment
-            if key.startswith(
-                otopicons.NetEnv.FIREWALLD_SERVICE_PREFIX
-            )
-        ]:
-            commands.append('firewall-cmd -service %s' % service)
+        commands = self._createFirewalldCommands()
         self.dialog.note(
             text=_(
                 'In order to configure firewalld, copy the '
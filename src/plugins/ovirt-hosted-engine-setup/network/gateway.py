@@ -25,7 +25,6 @@ gateway configuration plugin.
 
 import gettext
 import socket
-import struct
 
 
 from otopi import plugin
@@ -33,6 +32,7 @@ from otopi import util
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import netlink
 from ovirt_hosted_engine_setup import util as ohostedutil
 
 
@@ -45,28 +45,20 @@ class Plugin(plugin.PluginBase):
     """
     gateway configuration plugin.
     """
-    ROUTE_DESTINATION = 1
-    ROUTE_GW = 2
-
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
         self._enabled = True
 
     def _get_default_gw(self):
-        gateway = None
-        with open('/proc/net/route', 'r') as f:
-            lines = f.read().splitlines()
-            for line in lines:
-                data = line.split()
-                if data[self.ROUTE_DESTINATION] == '00000000':
-                    gateway = socket.inet_ntoa(
-                        struct.pack(
-                            'I',
-                            int(data[self.ROUTE_GW], 16)
-                        )
-                    )
-                    break
-        return gateway
+        info = netlink.snapshot(self)
+        return (
+            info.default_gateway(socket.AF_INET) or
+            info.default_gateway(socket.AF_INET6)
+        )
+
+    def _validate_gateway(self, gateway):
+        if not ohostedutil.check_is_pingable(self, gateway):
+            raise RuntimeError(_('Specified gateway is not pingable'))
 
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
@@ -83,6 +75,21 @@ class Plugin(plugin.PluginBase):
     def _setup(self):
         self.command.detect('ping')
 
+    @plugin.event(
+        stage=plugin.Stages.STAGE_LATE_SETUP,
+        condition=lambda self: self.environment[
+            ohostedcons.NetworkEnv.GATEWAY
+        ] is not None,
+    )
+    def _late_setup(self):
+        gateway = self.environment[ohostedcons.NetworkEnv.GATEWAY]
+        ohostedutil.register_validation(
+            self.environment,
+            'gateway',
+            gateway,
+            lambda: self._validate_gateway(gateway),
+        )
+
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
         after=(
@@ -113,17 +120,20 @@ class Plugin(plugin.PluginBase):
                     caseSensitive=True,
                     default=self._get_default_gw(),
                 )
-            valid = ohostedutil.check_is_pingable(
-                self,
-                self.environment[
-                    ohostedcons.NetworkEnv.GATEWAY
-                ]
-            )
-            if not valid:
+            gateway = self.environment[ohostedcons.NetworkEnv.GATEWAY]
+            try:
+                if not ohostedutil.is_validated(
+                    self.environment,
+                    'gateway',
+                    gateway,
+                ):
+                    self._validate_gateway(gateway)
+                valid = True
+            except RuntimeError as e:
                 if not interactive:
-                    raise RuntimeError(_('Specified gateway is not pingable'))
+                    raise
                 else:
-                    self.logger.error(_('Specified gateway is not pingable'))
+                    self.logger.error(e)
 
 
 # vim: expandtab tabstop=4 shiftwidth=4
@@ -35,6 +35,7 @@ from otopi import util
 from ovirt_hosted_engine_ha.lib import storage_backends
 
 
+from ovirt_hosted_engine_setup import capacity as ohostedcapacity
 from ovirt_hosted_engine_setup import constants as ohostedcons
 from ovirt_hosted_engine_setup import util as ohostedutil
 
@@ -51,6 +52,31 @@ class Plugin(plugin.PluginBase):
 
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
+        self._backend = None
+
+    def _get_backend(self):
+        """
+        Return the HA VdsmBackend of the metadata and lockspace volumes.
+        """
+        if self._backend is None:
+            lockspace = self.environment[
+                ohostedcons.SanlockEnv.LOCKSPACE_NAME
+            ]
+            # Prepare the Backend interface
+            # - this supports nfs, iSCSI and Gluster automatically
+            activate_devices = {
+                lockspace + '.lockspace': None,  # created by backend
+                lockspace + '.metadata': None,   # created by backend
+            }
+            self._backend = storage_backends.VdsmBackend(
+                sd_uuid=self.environment[ohostedcons.StorageEnv.SD_UUID],
+                sp_uuid=self.environment[ohostedcons.StorageEnv.SP_UUID],
+                dom_type=self.environment[
+                    ohostedcons.StorageEnv.DOMAIN_TYPE
+                ],
+                **activate_devices
+            )
+        return self._backend
 
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT
@@ -113,6 +139,48 @@ class Plugin(plugin.PluginBase):
                 )
             )
 
+    @plugin.event(
+        stage=plugin.Stages.STAGE_MISC,
+        after=(
+            ohostedcons.Stages.STORAGE_AVAILABLE,
+        ),
+        before=(
+            ohostedcons.Stages.CONF_VOLUME_AVAILABLE,
+            ohostedcons.Stages.SANLOCK_INITIALIZED,
+        ),
+        condition=lambda self: not self.environment[
+            ohostedcons.CoreEnv.IS_ADDITIONAL_HOST
+        ],
+    )
+    def _misc_check_space(self):
+        """
+        Check all the hosted-engine volumes at once against the real free
+        space of the new storage domain before creating any of them.
+        """
+        sdUUID = self.environment[ohostedcons.StorageEnv.SD_UUID]
+        stats = self.environment[
+            ohostedcons.VDSMEnv.VDS_CLI
+        ].getStorageDomainStats(sdUUID)
+        self.logger.debug(stats)
+        if stats['status']['code'] != 0:
+            raise RuntimeError(stats['status']['message'])
+        ohostedcapacity.Plan(
+            domain_type=self.environment[
+                ohostedcons.StorageEnv.DOMAIN_TYPE
+            ],
+            image_size_gb=self.environment[
+                ohostedcons.StorageEnv.IMAGE_SIZE_GB
+            ],
+            conf_image_size_gb=self.environment[
+                ohostedcons.StorageEnv.CONF_IMAGE_SIZE_GB
+            ],
+            blocksize=self._get_backend().blocksize,
+        ).check(
+            available=int(stats['stats']['diskfree']),
+            where=_('storage domain {sdUUID}').format(sdUUID=sdUUID),
+            new_domain=False,
+        )
+
     @plugin.event(
         stage=plugin.Stages.STAGE_MISC,
         name=ohostedcons.Stages.SANLOCK_INITIALIZED,
@@ -137,30 +205,9 @@ class Plugin(plugin.PluginBase):
             state=True,
         )
 
-        dom_type = self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE]
         lockspace = self.environment[ohostedcons.SanlockEnv.LOCKSPACE_NAME]
         host_id = self.environment[ohostedcons.StorageEnv.HOST_ID]
-
-        # Prepare the Backend interface
-        # - this supports nfs, iSCSI and Gluster automatically
-        activate_devices = {
-            lockspace + '.lockspace': None,  # created by backend
-            lockspace + '.metadata': None,   # created by backend
-        }
-        backend = storage_backends.VdsmBackend(
-            sd_uuid=self.environment[ohostedcons.StorageEnv.SD_UUID],
-            sp_uuid=self.environment[ohostedcons.StorageEnv.SP_UUID],
-            dom_type=dom_type,
-            **activate_devices
-        )
-
-        # Compute the size needed to store metadata for all hosts
-        # and for the global cluster state
-        md_size = (
-            ohostedcons.Const.METADATA_CHUNK_SIZE * (
-                ohostedcons.Const.MAX_HOST_ID + 1
-            )
-        )
+        backend = self._get_backend()
 
         with ohostedutil.VirtUserContext(
             self.environment,
@@ -168,10 +215,11 @@ class Plugin(plugin.PluginBase):
             umask=stat.S_IRWXO
         ):
             # Create storage for he metadata and sanlock lockspace
-            # 1MB is good for 2000 clients when the block size is 512B
             created = backend.create({
-                lockspace + '.lockspace': 1024*1024*backend.blocksize/512,
-                lockspace + '.metadata': md_size,
+                lockspace + '.lockspace': ohostedcapacity.lockspace_size(
+                    backend.blocksize
+                ),
+                lockspace + '.metadata': ohostedcapacity.metadata_size(),
             })
 
             # Get UUIDs of the storage
@@ -23,6 +23,7 @@ iSCSI storage domain plugin.
 """
 
 
+import collections
 import gettext
 import re
 import time
@@ -31,11 +32,15 @@ import time
 from otopi import constants as otopicons
 from otopi import plugin
 from otopi import util
+from vdsm import vdscli
 
 
 from ovirt_setup_lib import dialog
+from ovirt_hosted_engine_setup import capacity as ohostedcapacity
 from ovirt_hosted_engine_setup import constants as ohostedcons
-from ovirt_hosted_engine_setup import domains as ohosteddomains
+from ovirt_hosted_engine_setup import lun_inventory
+from ovirt_hosted_engine_setup import storage_connections
+from ovirt_hosted_engine_setup import util as ohostedutil
 
 
 def _(m):
@@ -48,8 +53,11 @@ class Plugin(plugin.PluginBase):
     Block devices (iSCSI, FC) storage domain plugin.
     """
 
-    _MAXRETRY = 2
+    _MAXRETRY = 3
     _RETRY_DELAY = 1
+    _LUN_PAGE_SIZE = 20
+    # shorter answers are row numbers: GUIDs often start with digits
+    _GUID_PREFIX_MIN = 4
     _IPADDR_RE = re.compile(r'(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})')
 
     def __init__(self, context):
@@ -57,6 +65,23 @@ class Plugin(plugin.PluginBase):
         self._interactive = False
         self.cli = None
         self.domainType = None
+        self._inventory = None
+        self._iscsi_portals = {}
+        # target name -> portals logged in to
+        self._iscsi_logged_in = {}
+        # target name -> connections acquired logging in to it
+        self._iscsi_connections = {}
+
+    def _valid_ip_address(self, address):
+        match = self._IPADDR_RE.match(address)
+        if not match:
+            return False
+        # TODO: figure out a better regexp avoiding this check
+        valid = True
+        for i in match.groups():
+            valid &= int(i) >= 0
+            valid &= int(i) < 255
+        return valid
 
     def _customize_ip_address(self):
         valid = False
@@ -68,20 +93,22 @@ class Plugin(plugin.PluginBase):
                 address = self.dialog.queryString(
                     name='OVEHOSTED_STORAGE_ISCSI_IP_ADDR',
                     note=_(
-                        'Please specify the iSCSI portal IP address: '
+                        'Please specify the iSCSI portal IP address '
+                        '(a comma separated list to discover through '
+                        'several portals): '
                     ),
                     prompt=True,
                     caseSensitive=True,
                 )
             try:
                 if address:
-                    match = self._IPADDR_RE.match(address)
-                    if match:
-                        # TODO: figure out a better regexp avoiding this check
-                        valid = True
-                        for i in match.groups():
-                            valid &= int(i) >= 0
-                            valid &= int(i) < 255
+                    addresses = [
+                        a.strip() for a in address.split(',') if a.strip()
+                    ]
+                    valid = bool(addresses) and all(
+                        self._valid_ip_address(a) for a in addresses
+                    )
+                    address = ','.join(addresses)
                 if not valid:
                     raise ValueError(_('Address must be a valid IP address'))
             except ValueError as e:
@@ -200,8 +227,6 @@ class Plugin(plugin.PluginBase):
     def _customize_lun(self, domainType, target):
         if domainType == ohostedcons.DomainTypes.ISCSI:
             available_luns = self._iscsi_get_lun_list(
-                ip=self.environment[ohostedcons.StorageEnv.ISCSI_IP_ADDR],
-                port=self.environment[ohostedcons.StorageEnv.ISCSI_PORT],
                 user=self.environment[ohostedcons.StorageEnv.ISCSI_USER],
                 password=self.environment[
                     ohostedcons.StorageEnv.ISCSI_PASSWORD
@@ -214,71 +239,174 @@ class Plugin(plugin.PluginBase):
             self.logger.error(_('Cannot find any LUN on the selected target'))
             return None
 
-        f_luns = []
-        lun_list = ''
-        for entry in available_luns:
-            activep = 0
-            failedp = 0
-            for pathstatus in entry['pathstatus']:
-                if pathstatus['state'] == 'active':
-                    activep += 1
-                else:
-                    failedp += 1
-            f_luns.append(
-                {
-                    'index': str(len(f_luns)+1),
-                    'GUID': entry['GUID'],
-                    'capacityGiB': int(entry['capacity']) / pow(2, 30),
-                    'vendorID': entry['vendorID'],
-                    'productID': entry['productID'],
-                    'status': entry['status'],
-                    'activep': activep,
-                    'failedp': failedp,
-                }
+        lunGUID = self.environment[ohostedcons.StorageEnv.LUN_ID]
+        if lunGUID is not None:
+            self.dialog.note(
+                _(
+                    'The following luns have been found on the requested '
+                    'target:\n{lun_list}'
+                ).format(
+                    lun_list=''.join(
+                        self._format_lun(i + 1, entry)
+                        for i, entry in enumerate(available_luns)
+                    ),
+                )
             )
-        for entry in f_luns:
-            lun_list += _(
-                '\t[{i}]\t{guid}\t{capacityGiB}GiB\t{vendorID}\t{productID}\n'
-                '\t\tstatus: {status}, paths: {ap} active'
-            ).format(
-                i=entry['index'],
-                guid=entry['GUID'],
-                capacityGiB=entry['capacityGiB'],
-                vendorID=entry['vendorID'],
-                productID=entry['productID'],
-                status=entry['status'],
-                ap=entry['activep'],
+            return lunGUID
+        self._interactive = True
+        return self._browse_luns(available_luns)
+
+    def _format_lun(self, index, entry):
+        activep = len([
+            pathstatus for pathstatus in entry['pathstatus']
+            if pathstatus['state'] == 'active'
+        ])
+        failedp = len(entry['pathstatus']) - activep
+        lun = _(
+            '\t[{i}]\t{guid}\t{capacityGiB}GiB\t{vendorID}\t{productID}\n'
+            '\t\tstatus: {status}, paths: {ap} active'
+        ).format(
+            i=index,
+            guid=entry['GUID'],
+            capacityGiB=int(entry['capacity']) / pow(2, 30),
+            vendorID=entry['vendorID'],
+            productID=entry['productID'],
+            status=entry['status'],
+            ap=activep,
+        )
+        if failedp > 0:
+            lun += _(', {fp} failed').format(
+                fp=failedp,
+            )
+        return lun + '\n\n'
+
+    def _customize_lun_filters(self, filters):
+        min_size = self.dialog.queryString(
+            name='OVEHOSTED_STORAGE_BLOCKD_LUN_MIN_SIZE',
+            note=_(
+                'Please specify the minimum LUN size in GiB [@DEFAULT@]: '
+            ),
+            prompt=True,
+            default=str(filters['min_size'] // pow(2, 30)),
+        )
+        try:
+            filters['min_size'] = int(min_size) * pow(2, 30)
+        except ValueError:
+            self.logger.error(_('Size must be an integer number of GiB'))
+        filters['vendor'] = self.dialog.queryString(
+            name='OVEHOSTED_STORAGE_BLOCKD_LUN_VENDOR',
+            note=_(
+                'Please specify the LUN vendor, empty for any '
+                '[@DEFAULT@]: '
+            ),
+            prompt=True,
+            caseSensitive=True,
+            default=filters['vendor'],
+        ).strip()
+        filters['free_only'] = self.dialog.queryString(
+            name='OVEHOSTED_STORAGE_BLOCKD_LUN_FREE',
+            note=_(
+                'List only the LUNs without a volume group '
+                '(@VALUES@)[@DEFAULT@]? '
+            ),
+            prompt=True,
+            validValues=(_('Yes'), _('No')),
+            caseSensitive=False,
+            default=_('Yes') if filters['free_only'] else _('No'),
+        ).lower() == _('Yes').lower()
+
+    def _browse_luns(self, available_luns):
+        """
+        Let the user pick a LUN out of available_luns, shown a page at a
+        time, the largest first, by index in the list or by a GUID prefix
+        of at least _GUID_PREFIX_MIN characters.
+        """
+        filters = {
+            'min_size': self._plan().required(),
+            'vendor': '',
+            'free_only': False,
+        }
+        page = 0
+        while True:
+            luns = lun_inventory.select(available_luns, **filters)
+            pages = max(1, -(-len(luns) // self._LUN_PAGE_SIZE))
+            page = max(0, min(page, pages - 1))
+            first = page * self._LUN_PAGE_SIZE
+            lun_list = ''.join(
+                self._format_lun(first + i + 1, entry)
+                for i, entry in enumerate(
+                    luns[first:first + self._LUN_PAGE_SIZE]
+                )
             )
-            if entry['failedp'] > 0:
-                lun_list += _(', {fp} failed').format(
-                    fp=entry['failedp'],
+            if pages > 1 or len(luns) < len(available_luns):
+                lun_list += _(
+                    '\tPage {page}/{pages}, {count} of {total} luns\n'
+                ).format(
+                    page=page + 1,
+                    pages=pages,
+                    count=len(luns),
+                    total=len(available_luns),
+                )
+            self.dialog.note(
+                _(
+                    'The following luns have been found on the requested '
+                    'target:\n{lun_list}'
+                ).format(
+                    lun_list=lun_list,
                 )
-            lun_list += '\n\n'
-
-        self.dialog.note(
-            _(
-                'The following luns have been found on the requested target:\n'
-                '{lun_list}'
-            ).format(
-                lun_list=lun_list,
             )
-        )
-        lunGUID = self.environment[ohostedcons.StorageEnv.LUN_ID]
-        if lunGUID is None:
-            self._interactive = True
-            slun = self.dialog.queryString(
+            answer = self.dialog.queryString(
                 name='OVEHOSTED_STORAGE_BLOCKD_LUN',
                 note=_(
-                    'Please select the destination LUN '
-                    '(@VALUES@) [@DEFAULT@]: '
+                    'Please select the destination LUN by number, or by '
+                    'the first {min} or more characters of its GUID, or '
+                    'type next, prev or filter [@DEFAULT@]: '
+                ).format(
+                    min=self._GUID_PREFIX_MIN,
                 ),
                 prompt=True,
                 caseSensitive=True,
-                default='1',
-                validValues=[i['index'] for i in f_luns],
-            )
-            lunGUID = f_luns[int(slun)-1]['GUID']
-        return lunGUID
+                default='1' if luns else 'filter',
+            ).strip()
+            if answer == 'next':
+                page += 1
+            elif answer == 'prev':
+                page -= 1
+            elif answer == 'filter':
+                self._customize_lun_filters(filters)
+                page = 0
+            elif len(answer) < self._GUID_PREFIX_MIN:
+                if answer.isdigit() and 0 < int(answer) <= len(luns):
+                    return luns[int(answer) - 1]['GUID']
+                self.logger.error(
+                    _(
+                        'Please type a number between 1 and {count}, or '
+                        'at least {min} characters of a GUID'
+                    ).format(
+                        count=len(luns),
+                        min=self._GUID_PREFIX_MIN,
+                    )
+                )
+            else:
+                matches = lun_inventory.match_guid(available_luns, answer)
+                if len(matches) == 1:
+                    return matches[0]['GUID']
+                elif not matches:
+                    self.logger.error(
+                        _('No LUN matches {answer}').format(
+                            answer=answer,
+                        )
+                    )
+                else:
+                    self.logger.error(
+                        _(
+                            '{count} luns match {answer}, please type more '
+                            'of the GUID'
+                        ).format(
+                            count=len(matches),
+                            answer=answer,
+                        )
+                    )
 
     def _customize_forcecreatevg(self):
         if self.environment[
@@ -311,8 +439,19 @@ class Plugin(plugin.PluginBase):
             forceVG,
         )
 
-    def _iscsi_discovery(self, address, port, user, password):
-        targets = self.cli.discoverSendTargets(
+    def _worker_cli(self):
+        """
+        Return a new VDSM client for a worker thread: the shared one holds
+        a single HTTP connection and cannot be used by several threads.
+        """
+        return vdscli.connect(timeout=ohostedcons.Const.VDSCLI_SSL_TIMEOUT)
+
+    def _iscsi_discovery(self, cli, address, port, user, password):
+        """
+        Return target name -> list of (address, port, tpgt) of the
+        portals advertised by the portal at address.
+        """
+        targets = cli.discoverSendTargets(
             {
                 'connection': address,
                 'port': port,
@@ -323,53 +462,179 @@ class Plugin(plugin.PluginBase):
         self.logger.debug(targets)
         if targets['status']['code'] != 0:
             raise RuntimeError(targets['status']['message'])
-        return targets['targets']
-
-    def _iscsi_get_lun_list(self, ip, port, user, password, iqn):
-        retry = self._MAXRETRY
-        iscsi_lun_list = []
-        for _try in range(0, retry):
-            devices = self.cli.getDeviceList(
-                ohostedcons.VDSMConstants.ISCSI_DOMAIN
+        portals = collections.OrderedDict()
+        if 'fullTargets' not in targets:
+            # only the target names: log in through the queried portal
+            for iqn in targets['targets']:
+                portals[iqn] = [(address, port, '0')]
+            return portals
+        for entry in targets['fullTargets']:
+            # 10.35.0.1:3260,1 iqn.2016-01.com.example:target
+            portal, iqn = entry.split(None, 1)
+            location, tpgt = portal.rsplit(',', 1)
+            portal_address, portal_port = location.rsplit(':', 1)
+            portals.setdefault(iqn, []).append(
+                (portal_address.strip('[]'), portal_port, tpgt)
             )
-            self.logger.debug(devices)
-            if devices['status']['code'] != 0:
-                raise RuntimeError(devices['status']['message'])
-            for device in devices['devList']:
-                for path in device['pathlist']:
-                    if path['iqn'] == iqn:
-                        if device not in iscsi_lun_list:
-                            iscsi_lun_list.append(device)
-            if iscsi_lun_list:
-                break
-
-            self.logger.info('Discovering iSCSI node')
-            self._iscsi_discovery(
-                ip,
-                port,
-                user,
-                password,
+        return portals
+
+    def _iscsi_discover_portals(self, addresses, port, user, password):
+        """
+        Run the discovery through every portal in addresses concurrently
+        and merge the targets they advertise.
+        Raise RuntimeError only if no portal answered.
+        """
+        results = ohostedutil.run_concurrently(
+            [
+                (
+                    lambda address=address: self._iscsi_discovery(
+                        self._worker_cli(),
+                        address,
+                        port,
+                        user,
+                        password,
+                    )
+                )
+                for address in addresses
+            ],
+            logger=self.logger,
+        )
+        portals = collections.OrderedDict()
+        errors = []
+        for address, (targets, error) in zip(addresses, results):
+            if error is not None:
+                self.logger.debug(
+                    'Discovery through {address} failed: {error}'.format(
+                        address=address,
+                        error=error,
+                    )
+                )
+                errors.append(error)
+                continue
+            for iqn, target_portals in targets.items():
+                known = portals.setdefault(iqn, [])
+                known.extend(p for p in target_portals if p not in known)
+        if not portals and errors:
+            raise errors[0]
+        return portals
+
+    def _iscsi_login_portal(self, iqn, portal, user, password):
+        con = storage_connections.iscsi_connection(
+            iqn,
+            portal,
+            user,
+            password,
+        )
+        start = time.time()
+        self.environment[
+            ohostedcons.StorageEnv.SERVER_CONNECTIONS
+        ].acquire(
+            self.cli,
+            ohostedcons.VDSMConstants.ISCSI_DOMAIN,
+            [con],
+            client=self._worker_cli(),
+        )
+        return con, time.time() - start
+
+    def _iscsi_login(self, iqn, user, password):
+        """
+        Log in to every portal of target iqn concurrently, so that each
+        of them becomes a path of the multipath devices.
+        Raise RuntimeError only if every login failed.
+        """
+        if iqn in self._iscsi_logged_in:
+            return
+        portals = self._iscsi_portals.get(iqn)
+        if not portals:
+            port = self.environment[ohostedcons.StorageEnv.ISCSI_PORT]
+            portals = [
+                (address, port, '0')
+                for address in self.environment[
+                    ohostedcons.StorageEnv.ISCSI_IP_ADDR
+                ].split(',')
+            ]
+        self.logger.info(
+            _('Connecting to the storage server ({count} portals)').format(
+                count=len(portals),
             )
-            self.logger.info('Connecting to the storage server')
-            res = self.cli.connectStorageServer(
-                ohostedcons.VDSMConstants.ISCSI_DOMAIN,
-                ohostedcons.Const.BLANK_UUID,
-                [
-                    {
-                        'connection': ip,
-                        'iqn': iqn,
-                        'portal': '0',
-                        'user': user,
-                        'password': password,
-                        'port': port,
-                        'id': ohostedcons.Const.BLANK_UUID,
-                    }
-                ]
+        )
+        results = ohostedutil.run_concurrently(
+            [
+                (
+                    lambda portal=portal: self._iscsi_login_portal(
+                        iqn,
+                        portal,
+                        user,
+                        password,
+                    )
+                )
+                for portal in portals
+            ],
+            logger=self.logger,
+        )
+        logged_in = []
+        errors = []
+        for portal, (result, error) in zip(portals, results):
+            address, port, tpgt = portal
+            if error is None:
+                con, elapsed = result
+                self._iscsi_connections.setdefault(iqn, []).append(con)
+                logged_in.append(portal)
+                self.logger.debug(
+                    'Login to {address}:{port},{tpgt}: {elapsed:.3f}s'.format(
+                        address=address,
+                        port=port,
+                        tpgt=tpgt,
+                        elapsed=elapsed,
+                    )
+                )
+            else:
+                errors.append(error)
+                self.logger.warning(
+                    _(
+                        'Cannot connect to portal {address}:{port}: {error}'
+                    ).format(
+                        address=address,
+                        port=port,
+                        error=error,
+                    )
+                )
+        if not logged_in:
+            raise errors[0]
+        self._iscsi_logged_in[iqn] = logged_in
+
+    def _get_inventory(self, refresh=False):
+        """
+        Return the LUN inventory of the current customization round,
+        querying VDSM only on the first call of the round or on refresh.
+        All the devices are listed only while the LUN has to be chosen,
+        once it is known only that one is queried.
+        """
+        if self._inventory is None or refresh:
+            lunGUID = self.environment[ohostedcons.StorageEnv.LUN_ID]
+            self._inventory = lun_inventory.fetch(
+                self.cli,
+                (
+                    ohostedcons.VDSMConstants.ISCSI_DOMAIN
+                    if self.domainType == ohostedcons.DomainTypes.ISCSI
+                    else ohostedcons.VDSMConstants.FC_DOMAIN
+                ),
+                guids=[lunGUID] if lunGUID is not None else None,
             )
-            if res['status']['code'] != 0:
-                raise RuntimeError(devices['status']['message'])
-            retry -= 1
-            time.sleep(self._RETRY_DELAY)
+            self.logger.debug(self._inventory.devices)
+        return self._inventory
+
+    def _iscsi_get_lun_list(self, user, password, iqn):
+        self._iscsi_login(iqn, user, password)
+        for _try in range(0, self._MAXRETRY):
+            if _try > 0:
+                # give udev and multipath some time to create the devices
+                time.sleep(self._RETRY_DELAY)
+            iscsi_lun_list = self._get_inventory(
+                refresh=_try > 0
+            ).for_target(iqn)
+            if iscsi_lun_list:
+                break
         else:
             raise RuntimeError("Unable to retrieve the list of LUN(s) please "
                                "check the SELinux log and settings on your "
@@ -377,71 +642,46 @@ class Plugin(plugin.PluginBase):
         return iscsi_lun_list
 
     def _fc_get_lun_list(self):
-        fc_lun_list = []
-        devices = self.cli.getDeviceList(
-            ohostedcons.VDSMConstants.FC_DOMAIN
-        )
-        self.logger.debug(devices)
-        if devices['status']['code'] != 0:
-            raise RuntimeError(devices['status']['message'])
-        for device in devices['devList']:
-            fc_lun_list.append(device)
-        return fc_lun_list
-
-    def _iscsi_get_device(self, ip, port, user, password, iqn, lunGUID):
-        available_luns = self._iscsi_get_lun_list(
-            ip, port, user, password, iqn
+        return self._get_inventory().devices
+
+    def _plan(self):
+        return ohostedcapacity.Plan(
+            domain_type=self.domainType,
+            image_size_gb=self.environment[
+                ohostedcons.StorageEnv.IMAGE_SIZE_GB
+            ],
+            conf_image_size_gb=self.environment[
+                ohostedcons.StorageEnv.CONF_IMAGE_SIZE_GB
+            ],
         )
-        for iscsi_device in available_luns:
-            if iscsi_device['GUID'] == lunGUID:
-                    return iscsi_device
-        return None
-
-    def _fc_get_device(self, lunGUID):
-        available_luns = self._fc_get_lun_list()
-        for fc_device in available_luns:
-            if fc_device['GUID'] == lunGUID:
-                    return fc_device
-        return None
 
     def _validate_domain(self, domainType, target, lunGUID):
-        if domainType == ohostedcons.DomainTypes.ISCSI:
-            device = self._iscsi_get_device(
-                ip=self.environment[ohostedcons.StorageEnv.ISCSI_IP_ADDR],
-                port=self.environment[ohostedcons.StorageEnv.ISCSI_PORT],
-                user=self.environment[ohostedcons.StorageEnv.ISCSI_USER],
-                password=self.environment[
-                    ohostedcons.StorageEnv.ISCSI_PASSWORD
-                ],
-                iqn=target,
-                lunGUID=lunGUID
-            )
-        elif domainType == ohostedcons.DomainTypes.FC:
-            device = self._fc_get_device(lunGUID)
+        device = self._get_inventory().get(
+            lunGUID,
+            iqn=(
+                target if domainType == ohostedcons.DomainTypes.ISCSI
+                else None
+            ),
+        )
         if device is None:
             raise RuntimeError(
                 _('The requested device is not listed by VDSM')
             )
         self.logger.debug(device)
-        size_mb = int(device['capacity']) / pow(2, 20)
+        size_mb = int(device['capacity']) // ohostedcapacity.MiB
         self.logger.debug(
             'Available space on {iqn} is {space}Mb'.format(
                 iqn=target,
                 space=size_mb
             )
         )
-        if size_mb < ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB:
-            raise ohosteddomains.InsufficientSpaceError(
-                _(
-                    'Error: device {lunGUID} has capacity of only '
-                    '{capacity}Mb while a minimum of '
-                    '{minimum}Mb is  required'
-                ).format(
-                    lunGUID=lunGUID,
-                    capacity=size_mb,
-                    minimum=ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB,
-                )
-            )
+        self._plan().check(
+            available=int(device['capacity']),
+            where=_('device {lunGUID}').format(lunGUID=lunGUID),
+        )
+        self.environment[
+            ohostedcons.StorageEnv.AVAILABLE_SPACE_MB
+        ] = size_mb
         self.environment[
             ohostedcons.StorageEnv.BDEVICE_SIZE_GB
         ] = size_mb / pow(2, 10)
@@ -473,6 +713,25 @@ class Plugin(plugin.PluginBase):
 
         self.environment[ohostedcons.StorageEnv.GUID] = device['GUID']
 
+    def _vg_portals(self, target):
+        vginfo = self.cli.getVGInfo(
+            self.environment[ohostedcons.StorageEnv.VG_UUID]
+        )
+        self.logger.debug(vginfo)
+        if vginfo['status']['code'] != 0:
+            raise RuntimeError(vginfo['status']['message'])
+        try:
+            return [
+                path['portal']
+                for pv in vginfo['info']['pvlist']
+                for path in pv['pathlist']
+                if path['iqn'] == target
+            ]
+        except (ValueError, KeyError) as e:
+            self.logger.debug('exception', exc_info=True)
+            self.logger.error(_('Cannot detect iSCSI portal'))
+            raise e
+
     @plugin.event(
         stage=plugin.Stages.STAGE_SETUP,
     )
@@ -563,12 +822,13 @@ class Plugin(plugin.PluginBase):
                 self.environment[otopicons.CoreEnv.LOG_FILTER].append(password)
                 # Validating access
                 try:
-                    valid_targets = self._iscsi_discovery(
-                        address,
+                    self._iscsi_portals = self._iscsi_discover_portals(
+                        address.split(','),
                         port,
                         user,
                         password,
                     )
+                    valid_targets = list(self._iscsi_portals.keys())
                     valid_access = True
                 except RuntimeError as e:
                     self.logger.debug('exception', exc_info=True)
@@ -581,6 +841,8 @@ class Plugin(plugin.PluginBase):
             self.environment[ohostedcons.StorageEnv.ISCSI_PASSWORD] = password
 
         while not valid_lun:
+            # a new round: the devices are listed again only once
+            self._inventory = None
             if self.domainType == ohostedcons.DomainTypes.ISCSI:
                 target = self._customize_target(
                     values=valid_targets,
@@ -604,6 +866,19 @@ class Plugin(plugin.PluginBase):
                 )
         if self.domainType == ohostedcons.DomainTypes.ISCSI:
             self.environment[ohostedcons.StorageEnv.ISCSI_TARGET] = target
+            # every path of the target, for the domain and the engine LUN
+            self.environment[
+                ohostedcons.StorageEnv.ISCSI_PORTALS
+            ] = self._iscsi_logged_in.get(target, [])
+            # the targets tried and not chosen are logged out at cleanup
+            for iqn, cons in self._iscsi_connections.items():
+                if iqn != target:
+                    self.environment[
+                        ohostedcons.StorageEnv.SERVER_CONNECTIONS
+                    ].release(
+                        ohostedcons.VDSMConstants.ISCSI_DOMAIN,
+                        cons,
+                    )
         self.environment[ohostedcons.StorageEnv.LUN_ID] = lunGUID
 
     @plugin.event(
@@ -668,30 +943,24 @@ class Plugin(plugin.PluginBase):
                 ohostedcons.StorageEnv.VG_UUID
             ] = dom['uuid']
 
-        vginfo = self.cli.getVGInfo(
-            self.environment[ohostedcons.StorageEnv.VG_UUID]
-        )
-        self.logger.debug(vginfo)
-        if vginfo['status']['code'] != 0:
-            raise RuntimeError(vginfo['status']['message'])
         if (
             self.domainType == ohostedcons.DomainTypes.ISCSI and
             self.environment[ohostedcons.StorageEnv.ISCSI_PORTAL] is None
         ):
-            try:
-                for pv in vginfo['info']['pvlist']:
-                    for path in pv['pathlist']:
-                        if path['iqn'] == self.environment[
-                            ohostedcons.StorageEnv.ISCSI_TARGET
-                        ]:
-                            self.environment[
-                                ohostedcons.StorageEnv.ISCSI_PORTAL
-                            ] = path['portal']
-                            break
-            except (ValueError, KeyError) as e:
-                self.logger.debug('exception', exc_info=True)
-                self.logger.error(_('Cannot detect iSCSI portal'))
-                raise e
+            target = self.environment[ohostedcons.StorageEnv.ISCSI_TARGET]
+            portals = self._get_inventory().portals(
+                self.environment[ohostedcons.StorageEnv.LUN_ID],
+                target,
+                address=self.environment[
+                    ohostedcons.StorageEnv.ISCSI_IP_ADDR
+                ].split(',')[0],
+            )
+            if not portals:
+                portals = self._vg_portals(target)
+            if portals:
+                self.environment[
+                    ohostedcons.StorageEnv.ISCSI_PORTAL
+                ] = portals[0]
 
 
 # vim: expandtab tabstop=4 shiftwidth=4
@@ -22,7 +22,9 @@
 GlusterFS storage provisioning plugin.
 """
 
+import collections
 import gettext
+import os
 import socket
 
 
@@ -48,6 +50,21 @@ class Plugin(plugin.PluginBase):
     GlusterFS storage provisioning plugin.
     """
 
+    # as suggested by Gluster Storage Domain Reference
+    # @see: http://www.ovirt.org/Gluster_Storage_Domain_Reference
+    # a group comes first so that the options after it override its ones
+    _VOLUME_OPTIONS = (
+        ('group', 'virt'),
+        ('cluster.quorum-type', 'auto'),
+        ('network.ping-timeout', '10'),
+        ('nfs.disable', 'on'),
+        ('user.cifs', 'disable'),
+        ('auth.allow', '*'),
+        ('storage.owner-uid', '36'),
+        ('storage.owner-gid', '36'),
+        ('server.allow-insecure', 'on'),
+    )
+
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
         self._checker = ohosteddomains.DomainChecker()
@@ -81,21 +98,62 @@ class Plugin(plugin.PluginBase):
                 ),
             )
 
-    def _provision_gluster_volume(self):
+    def _option_group(self, name):
         """
-        Set parameters as suggested by Gluster Storage Domain Reference
-        @see: http://www.ovirt.org/Gluster_Storage_Domain_Reference
+        Return the options gluster sets for group name, None if its
+        definition cannot be read.
         """
-        cli = vdscli.connect()
-        share = self.environment[ohostedcons.StorageEnv.GLUSTER_SHARE_NAME]
-        brick = self.environment[ohostedcons.StorageEnv.GLUSTER_BRICK]
+        path = os.path.join(
+            ohostedcons.FileLocations.GLUSTERD_GROUPS_DIR,
+            name,
+        )
+        try:
+            with open(path, 'r') as f:
+                lines = f.read().splitlines()
+        except EnvironmentError:
+            self.logger.debug('exception', exc_info=True)
+            return None
+        options = collections.OrderedDict()
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                option, value = line.split('=', 1)
+                options[option.strip()] = value.strip()
+        return options
+
+    def _desired_options(self):
+        """
+        Return the volume options to be set, groups expanded to their
+        options so that they can be compared with the volume ones.
+        """
+        options = collections.OrderedDict()
+        for option, value in self._VOLUME_OPTIONS:
+            group = self._option_group(value) if option == 'group' else None
+            if group is not None:
+                options.update(group)
+            else:
+                options[option] = value
+        return options
+
+    def _gluster_volumes(self, cli):
         self.logger.debug('glusterVolumesList')
         response = cli.glusterVolumesList()
         self.logger.debug(response)
         if response['status']['code'] != 0:
             self.logger.error(_('Failed to retrieve the Gluster Volume list'))
             raise RuntimeError(response['status']['message'])
-        volumes = response['volumes']
+        return response['volumes']
+
+    def _provision_gluster_volume(self):
+        """
+        Create the volume if missing and set only the options it does not
+        have yet, so provisioning an already tuned volume again is about a
+        no-op.
+        """
+        cli = vdscli.connect()
+        share = self.environment[ohostedcons.StorageEnv.GLUSTER_SHARE_NAME]
+        brick = self.environment[ohostedcons.StorageEnv.GLUSTER_BRICK]
+        volumes = self._gluster_volumes(cli)
         if share in volumes:
             self.logger.info(_('GlusterFS Volume already exists'))
             if set([brick]) != set(volumes[share]['bricks']):
@@ -107,6 +165,8 @@ class Plugin(plugin.PluginBase):
                         'bricks list'
                     )
                 )
+            current_options = volumes[share].get('options', {})
+            volume_status = volumes[share]['volumeStatus']
         else:
             self.logger.info(_('Creating GlusterFS Volume'))
             replica_count = ''
@@ -126,18 +186,21 @@ class Plugin(plugin.PluginBase):
             if response['status']['code'] != 0:
                 self.logger.error(_('Failed to create the Gluster Volume'))
                 raise RuntimeError(response['status']['message'])
+            # a new volume has no option set and is not started
+            current_options = {}
+            volume_status = 'OFFLINE'
 
-        for option, value in {
-            'cluster.quorum-type': 'auto',
-            'network.ping-timeout': '10',
-            'nfs.disable': 'on',
-            'user.cifs': 'disable',
-            'auth.allow': '*',
-            'group': 'virt',
-            'storage.owner-uid': '36',
-            'storage.owner-gid': '36',
-            'server.allow-insecure': 'on',
-        }.items():
+        changed = [
+            (option, value)
+            for option, value in self._desired_options().items()
+            if current_options.get(option) != value
+        ]
+        self.logger.debug(
+            'GlusterFS Volume options to be set: {changed}'.format(
+                changed=changed,
+            )
+        )
+        for option, value in changed:
             self.logger.debug('glusterVolumeSet %s' % option)
             response = cli.glusterVolumeSet(
                 share,
@@ -152,13 +215,6 @@ class Plugin(plugin.PluginBase):
                 )
                 raise RuntimeError(response['status']['message'])
 
-        self.logger.debug('glusterVolumesList')
-        response = cli.glusterVolumesList()
-        self.logger.debug(response)
-        if response['status']['code'] != 0:
-            self.logger.error(_('Failed to retrieve the Gluster Volume list'))
-            raise RuntimeError(response['status']['message'])
-        volume = response['volumes'][share]
         self.logger.debug('glusterTasksList')
         response = cli.glusterTasksList()
         self.logger.debug(response)
@@ -167,9 +223,9 @@ class Plugin(plugin.PluginBase):
             raise RuntimeError(response['status']['message'])
         # TODO: check if we need to do something about these tasks
 
-        if volume['volumeStatus'] == 'ONLINE':
+        if volume_status == 'ONLINE':
             self.logger.debug('GlusterFS Volume already started')
-        elif volume['volumeStatus'] == 'OFFLINE':
+        elif volume_status == 'OFFLINE':
             self.logger.debug('glusterVolumeStart')
             response = cli.glusterVolumeStart(share)
             if response['status']['code'] != 0:
@@ -180,17 +236,10 @@ class Plugin(plugin.PluginBase):
                 _(
                     'GlusterFS Volume found in an unknown state: {state}'
                 ).format(
-                    state=volume['volumeStatus'],
+                    state=volume_status,
                 )
             )
 
-        self.logger.debug('glusterVolumesList')
-        response = cli.glusterVolumesList()
-        self.logger.debug(response)
-        if response['status']['code'] != 0:
-            self.logger.error(_('Failed to retrieve the Gluster Volume list'))
-            raise RuntimeError(response['status']['message'])
-
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
     )
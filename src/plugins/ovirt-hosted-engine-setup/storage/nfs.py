@@ -25,16 +25,17 @@ NFS / GlusterFS storage plugin.
 import gettext
 import os
 import tempfile
-import time
-import xml.dom.minidom
 
 
 from otopi import plugin
 from otopi import util
 
 
+from ovirt_hosted_engine_setup import capacity as ohostedcapacity
 from ovirt_hosted_engine_setup import constants as ohostedcons
 from ovirt_hosted_engine_setup import domains as ohosteddomains
+from ovirt_hosted_engine_setup import gluster
+from ovirt_hosted_engine_setup import util as ohostedutil
 
 
 def _(m):
@@ -47,11 +48,13 @@ class Plugin(plugin.PluginBase):
     NFS / GlusterFS storage plugin.
     """
 
-    UMOUNT_TRIES = 10
-
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
         self._checker = ohosteddomains.DomainChecker()
+        self._gluster = gluster.Topology(self)
+        # (connection, domain_type, path) of the mount validating the
+        # storage, kept for the whole customization
+        self._validation_mount = None
 
     def _mount(self, path, connection, domain_type):
         fstype = ''
@@ -104,12 +107,35 @@ class Plugin(plugin.PluginBase):
             raise RuntimeError(error)
 
     def _umount(self, path):
-        rc = -1
-        tries = self.UMOUNT_TRIES
-        while tries > 0:
+        rc, _stdout, _stderr = self.execute(
+            (
+                self.command.get('umount'),
+                path
+            ),
+            raiseOnError=False,
+            env={
+                'LC_ALL': 'C',
+            },
+        )
+        if rc != 0:
+            # rc, stdout and stderr are automatically logged as debug
+            self.execute(
+                (
+                    self.command.get('lsof'),
+                    '+D%s' % path,
+                    '-xfl'
+                ),
+                raiseOnError=False,
+                env={
+                    'LC_ALL': 'C',
+                },
+            )
+            # nothing of ours uses it anymore: detach it now and let the
+            # kernel complete the unmount once it is no longer busy
             rc, _stdout, _stderr = self.execute(
                 (
                     self.command.get('umount'),
+                    '-l',
                     path
                 ),
                 raiseOnError=False,
@@ -117,25 +143,45 @@ class Plugin(plugin.PluginBase):
                     'LC_ALL': 'C',
                 },
             )
-            if rc == 0:
-                tries = -1
-            else:
-                tries -= 1
-                time.sleep(1)
-                # rc, stdout and stderr are automatically logged as debug
-                self.execute(
-                    (
-                        self.command.get('lsof'),
-                        '+D%s' % path,
-                        '-xfl'
-                    ),
-                    raiseOnError=False,
-                    env={
-                        'LC_ALL': 'C',
-                    },
-                )
         return rc
 
+    def _is_mounted(self, connection, domain_type):
+        return (
+            self._validation_mount is not None and
+            self._validation_mount[:2] == (connection, domain_type)
+        )
+
+    def _acquire_mount(self, connection, domain_type):
+        """
+        Return the path where connection is mounted for validation,
+        reusing the earlier mount of the same connection.
+        """
+        if self._is_mounted(connection, domain_type):
+            return self._validation_mount[2]
+        self._release_mount()
+        path = tempfile.mkdtemp()
+        try:
+            self._mount(path, connection, domain_type)
+        except Exception:
+            os.rmdir(path)
+            raise
+        self._validation_mount = (connection, domain_type, path)
+        return path
+
+    def _release_mount(self):
+        if self._validation_mount is None:
+            return
+        path = self._validation_mount[2]
+        self._validation_mount = None
+        if self._umount(path) == 0:
+            os.rmdir(path)
+        else:
+            self.logger.warning(
+                _('Cannot unmount {path}').format(
+                    path=path,
+                )
+            )
+
     def _check_domain_rights(self, path):
         rc, _stdout, _stderr = self.execute(
             (
@@ -165,99 +211,69 @@ class Plugin(plugin.PluginBase):
         server, volume = connection.split(':')
         if volume[0] == '/':
             volume = volume[1:]
-        glustercmd = self.command.get('gluster')
-        rc, stdout, stderr = self.execute(
-            args=(
-                glustercmd,
-                '--mode=script',
-                '--xml',
-                'volume',
-                'info',
-                volume,
-                '--remote-host=%s' % server,
-            ),
-            raiseOnError=True
-        )
-        if rc != 0:
-            self.logger.error(_('Failed to retrieve Gluster Volume info'))
-            raise RuntimeError(
-                'Failed to retrieve Gluster Volume info: ' + str(stdout)
-            )
-        self.logger.debug('Gluster Volume info XML output: ' + str(stdout))
-        dom = xml.dom.minidom.parseString(''.join(stdout))
-        cliOutput = dom.getElementsByTagName('cliOutput')[0]
-        opRet = (
-            cliOutput.getElementsByTagName('opRet')[0]
-        ).firstChild.nodeValue
-        opErrno = (
-            cliOutput.getElementsByTagName('opErrno')[0]
-        ).firstChild.nodeValue
-        opErrstrElement = cliOutput.getElementsByTagName('opErrstr')[0]
-        opErrstr = ' '.join(
-            t.nodeValue for t in opErrstrElement.childNodes
-            if t.nodeType == t.TEXT_NODE
-        )
+        try:
+            self._check_volume(server, volume)
+        except RuntimeError:
+            # the user may start or fix the volume and try again
+            self._gluster.forget(server, volume)
+            raise
 
-        if opRet != '0':
+    def _check_volume(self, server, volume):
+        try:
+            info = self._gluster.volume(server, volume)
+        except gluster.GlusterError as e:
             self.logger.error(_('Failed to retrieve Gluster Volume info'))
             raise RuntimeError(
                 'Failed to retrieve Gluster Volume info '
                 '[{code}]: {error}'.format(
-                    code=opErrno,
-                    error=opErrstr,
+                    code=e.code,
+                    error=e,
                 )
             )
-        volInfo = cliOutput.getElementsByTagName('volInfo')[0]
-        volumes = volInfo.getElementsByTagName('volumes')[0]
-        volCount = (
-            volumes.getElementsByTagName('count')[0]
-        ).firstChild.nodeValue
-        if volCount != '1':
+        if info is None:
             raise RuntimeError(
                 _('GlusterFS Volume {volume} does not exist!').format(
                     volume=volume,
                 )
             )
-        volume = volumes.getElementsByTagName('volume')[0]
-        replicaCount = (
-            volume.getElementsByTagName('replicaCount')[0]
-        ).firstChild.nodeValue
-        if replicaCount != '3':
+        if info.replica_count != 3:
             raise RuntimeError(
                 _(
                     'GlusterFS Volume is not using replica 3'
                 )
             )
         self.logger.info(_('GlusterFS replica 3 Volume detected'))
-        host_list = []
-        for brickE in volume.getElementsByTagName('brick'):
-            host_list.append(
-                (brickE.getElementsByTagName('hostUuid')[0])
-                .firstChild.nodeValue
-            )
-        if len(set(host_list)) < 3:
+        if len(info.host_uuids) < 3:
             self.logger.warning(_(
                 'Three distinct hosts are required for '
                 'safe and reliable operations'
             ))
-        status = (
-            volume.getElementsByTagName('status')[0]
-        ).firstChild.nodeValue
-        statusStr = (
-            volume.getElementsByTagName('statusStr')[0]
-        ).firstChild.nodeValue
-        if status != '1':
+        if not info.started:
             raise RuntimeError(
                 _(
                     "GlusterFS Volume is '{statusStr}', "
                     "please ensure that it's started"
                 ).format(
-                    statusStr=statusStr,
+                    statusStr=info.status_str,
                 )
             )
 
+    def _plan(self, domain_type):
+        return ohostedcapacity.Plan(
+            domain_type=domain_type,
+            image_size_gb=self.environment[
+                ohostedcons.StorageEnv.IMAGE_SIZE_GB
+            ],
+            conf_image_size_gb=self.environment[
+                ohostedcons.StorageEnv.CONF_IMAGE_SIZE_GB
+            ],
+        )
+
     def _validateDomain(self, connection, domain_type, check_space):
-        if self.environment[
+        # a mounted connection already passed the checks below, only the
+        # space may be still unchecked
+        validated = self._is_mounted(connection, domain_type)
+        if not validated and self.environment[
             ohostedcons.StorageEnv.DOMAIN_TYPE
         ] == ohostedcons.DomainTypes.GLUSTERFS:
             # FIXME: mount.glusterfs exit with code 0 also on failure
@@ -272,26 +288,24 @@ class Plugin(plugin.PluginBase):
                 )
             )
             self._check_volume_properties(connection)
-        path = tempfile.mkdtemp()
         try:
-            self._mount(path, connection, domain_type)
-            self._checker.check_valid_path(path)
-            self._check_domain_rights(path)
-            self._checker.check_base_writable(path)
+            path = self._acquire_mount(connection, domain_type)
+            if not validated:
+                self._checker.check_valid_path(path)
+                self._check_domain_rights(path)
+                self._checker.check_base_writable(path)
             if check_space:
-                self._checker.check_available_space(
-                    path,
-                    ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB
-                )
-        finally:
-            if self._umount(path) == 0:
-                os.rmdir(path)
-            else:
-                self.logger.warning(
-                    _('Cannot unmount {path}').format(
-                        path=path,
-                    )
+                available_mb = self._checker.get_available_space(path)
+                self.environment[
+                    ohostedcons.StorageEnv.AVAILABLE_SPACE_MB
+                ] = available_mb
+                self._plan(domain_type).check(
+                    available=available_mb * ohostedcapacity.MiB,
+                    where=path,
                 )
+        except Exception:
+            self._release_mount()
+            raise
 
     @plugin.event(
         stage=plugin.Stages.STAGE_SETUP,
@@ -303,6 +317,44 @@ class Plugin(plugin.PluginBase):
         self.command.detect('umount')
         self.command.detect('gluster')
 
+    @plugin.event(
+        stage=plugin.Stages.STAGE_LATE_SETUP,
+        condition=lambda self: (
+            self.environment[
+                ohostedcons.StorageEnv.STORAGE_DOMAIN_CONNECTION
+            ] is not None and
+            self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE] in (
+                ohostedcons.DomainTypes.GLUSTERFS,
+                ohostedcons.DomainTypes.NFS3,
+                ohostedcons.DomainTypes.NFS4,
+            )
+        ),
+    )
+    def _late_setup(self):
+        connection = self.environment[
+            ohostedcons.StorageEnv.STORAGE_DOMAIN_CONNECTION
+        ]
+        domain_type = self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE]
+        if (
+            domain_type == ohostedcons.DomainTypes.GLUSTERFS and
+            self.environment[
+                ohostedcons.StorageEnv.GLUSTER_PROVISIONING_ENABLED
+            ] is not False
+        ):
+            # the volume may still have to be provisioned
+            return
+        # the mount is kept for the customization
+        ohostedutil.register_validation(
+            self.environment,
+            'storage_connection',
+            (connection, domain_type),
+            lambda: self._validateDomain(
+                connection=connection,
+                domain_type=domain_type,
+                check_space=False,
+            ),
+        )
+
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
         name=ohostedcons.Stages.CONFIG_STORAGE_NFS,
@@ -350,16 +402,23 @@ class Plugin(plugin.PluginBase):
                     prompt=True,
                     caseSensitive=True,
                 )
+            connection = self.environment[
+                ohostedcons.StorageEnv.STORAGE_DOMAIN_CONNECTION
+            ]
+            domain_type = self.environment[
+                ohostedcons.StorageEnv.DOMAIN_TYPE
+            ]
             try:
-                self._validateDomain(
-                    connection=self.environment[
-                        ohostedcons.StorageEnv.STORAGE_DOMAIN_CONNECTION
-                    ],
-                    domain_type=self.environment[
-                        ohostedcons.StorageEnv.DOMAIN_TYPE
-                    ],
-                    check_space=False,
-                )
+                if not ohostedutil.is_validated(
+                    self.environment,
+                    'storage_connection',
+                    (connection, domain_type),
+                ):
+                    self._validateDomain(
+                        connection=connection,
+                        domain_type=domain_type,
+                        check_space=False,
+                    )
                 validDomain = True
             except (ValueError, RuntimeError) as e:
                 if interactive:
@@ -382,7 +441,9 @@ class Plugin(plugin.PluginBase):
                 self.logger.debug('exception', exc_info=True)
                 self.logger.debug(e)
                 min_requirement = '%0.2f' % (
-                    ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB / 1024.0
+                    self._plan(
+                        self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE]
+                    ).required() / float(ohostedcapacity.GiB)
                 )
                 if interactive:
                     self.logger.error(
@@ -414,9 +475,6 @@ class Plugin(plugin.PluginBase):
             ohostedcons.Stages.DIALOG_TITLES_E_STORAGE,
         ),
         condition=lambda self: (
-            not self.environment[
-                ohostedcons.CoreEnv.IS_ADDITIONAL_HOST
-            ] and
             self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE] in (
                 ohostedcons.DomainTypes.GLUSTERFS,
                 ohostedcons.DomainTypes.NFS3,
@@ -433,7 +491,11 @@ class Plugin(plugin.PluginBase):
         # already filled with the Hosted Engine VM image.
         # Sadly we can't go back to previous customization stage so here
         # we can only fail the setup.
+        # The validation mount is not needed anymore after this: VDSM
+        # mounts the storage on its own.
         try:
+            if self.environment[ohostedcons.CoreEnv.IS_ADDITIONAL_HOST]:
+                return
             self._validateDomain(
                 connection=self.environment[
                     ohostedcons.StorageEnv.STORAGE_DOMAIN_CONNECTION
@@ -447,7 +509,9 @@ class Plugin(plugin.PluginBase):
             self.logger.debug('exception', exc_info=True)
             self.logger.debug(e)
             min_requirement = '%0.2f' % (
-                ohostedcons.Const.MINIMUM_SPACE_STORAGEDOMAIN_MB / 1024.0
+                self._plan(
+                    self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE]
+                ).required() / float(ohostedcapacity.GiB)
             )
             raise RuntimeError(
                 _(
@@ -458,6 +522,14 @@ class Plugin(plugin.PluginBase):
                     )
                 )
             )
+        finally:
+            self._release_mount()
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_CLEANUP,
+    )
+    def _cleanup(self):
+        self._release_mount()
 
 
 # vim: expandtab tabstop=4 shiftwidth=4
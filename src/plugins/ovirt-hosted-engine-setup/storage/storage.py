@@ -43,6 +43,8 @@ from ovirt_hosted_engine_ha.lib import storage_backends
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import loop_device
+from ovirt_hosted_engine_setup import storage_connections
 from ovirt_hosted_engine_setup import tasks
 from ovirt_hosted_engine_setup import util as ohostedutil
 
@@ -65,7 +67,9 @@ class Plugin(plugin.PluginBase):
         'are not valid in the name.'
     )
     VFSTYPE = 'ext3'
-    SIZE = '2G'
+    SIZE = 2 * pow(2, 30)
+    INODES = 1024
+    JOURNAL_MB = 4
 
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
@@ -83,103 +87,89 @@ class Plugin(plugin.PluginBase):
 
     def _attach_loopback_device(self):
         if not self._fake_file:
-            self._fake_file = tempfile.mkstemp(
+            fd, self._fake_file = tempfile.mkstemp(
                 dir=ohostedcons.FileLocations.OVIRT_HOSTED_ENGINE_LB_DIR
-            )[1]
+            )
+        else:
+            fd = os.open(self._fake_file, os.O_RDWR)
+        try:
+            # sparse: no block is allocated until written
+            os.ftruncate(fd, self.SIZE)
+        finally:
+            os.close(fd)
         os.chown(
             self._fake_file,
             self.environment[ohostedcons.VDSMEnv.VDSM_UID],
             self.environment[ohostedcons.VDSMEnv.KVM_GID],
         )
-        self.execute(
-            args=(
-                self.command.get('truncate'),
-                '--size=%s' % self.SIZE,
-                self._fake_file
-            ),
-            raiseOnError=True
-        )
-        losetup = self.command.get('losetup')
-        rc, stdout, stderr = self.execute(
-            args=(
-                losetup,
-                '--find',
-                '--show',
-                '--sizelimit=%s' % self.SIZE,
-                self._fake_file,
-            ),
-            raiseOnError=True
-        )
-        if rc == 0:
-            for line in stdout:
-                self._fake_SD_path = line
-            if self._fake_SD_path[:9] != '/dev/loop':
-                raise RuntimeError(
-                    -("Invalid loopback device path name: '{path}'").format(
-                        path=self._fake_SD_path,
-                    )
-                )
-            self.logger.debug(
-                'Found a available loopback device on %s' % self._fake_SD_path
-            )
-        if not self._fake_SD_path:
+        try:
+            self._fake_SD_path = loop_device.attach(self._fake_file)
+        except EnvironmentError:
+            self.logger.debug('exception', exc_info=True)
             raise RuntimeError(
                 _('Unable to find an available loopback device path ')
             )
+        self.logger.debug(
+            'Found a available loopback device on %s' % self._fake_SD_path
+        )
+        # A tiny filesystem, the fake domain holds just its metadata:
+        # few inodes and the smallest journal keep mkfs from writing
+        # tens of MiB, the root is created already owned by vdsm.
         self.execute(
             args=(
                 self.command.get('mkfs'),
                 '-t',
                 self.VFSTYPE,
-                self._fake_SD_path,
-            ),
-            raiseOnError=True
-        )
-        mntpoint = tempfile.mkdtemp(
-            dir=ohostedcons.FileLocations.OVIRT_HOSTED_ENGINE_LB_DIR
-        )
-        self.execute(
-            args=(
-                self.command.get('mount'),
-                self._fake_SD_path,
-                mntpoint
-            ),
-            raiseOnError=True
-        )
-        self.execute(
-            args=(
-                self.command.get('chown'),
-                '-R',
-                '{u}:{g}'.format(
+                '-q',
+                '-m', '0',
+                '-N', str(self.INODES),
+                '-J', 'size=%d' % self.JOURNAL_MB,
+                '-E', 'root_owner={u}:{g}'.format(
                     u=self.environment[ohostedcons.VDSMEnv.VDSM_UID],
                     g=self.environment[ohostedcons.VDSMEnv.KVM_GID],
                 ),
-                mntpoint,
+                self._fake_SD_path,
             ),
             raiseOnError=True
         )
         if self._selinux_enabled:
-            con = "system_u:object_r:virt_var_lib_t:s0"
-            selinux.chcon(path=mntpoint, context=con, recursive=True)
-        self.execute(
-            args=(
-                self.command.get('umount'),
-                mntpoint,
-            ),
-            raiseOnError=True
-        )
-        os.rmdir(mntpoint)
-
-    def _remove_loopback_device(self):
-        if self._fake_SD_path:
+            # the label can only be set on the mounted filesystem
+            mntpoint = tempfile.mkdtemp(
+                dir=ohostedcons.FileLocations.OVIRT_HOSTED_ENGINE_LB_DIR
+            )
             self.execute(
                 args=(
-                    self.command.get('losetup'),
-                    '--detach',
+                    self.command.get('mount'),
                     self._fake_SD_path,
+                    mntpoint
                 ),
                 raiseOnError=True
             )
+            try:
+                con = "system_u:object_r:virt_var_lib_t:s0"
+                selinux.chcon(path=mntpoint, context=con, recursive=True)
+            finally:
+                self.execute(
+                    args=(
+                        self.command.get('umount'),
+                        mntpoint,
+                    ),
+                    raiseOnError=True
+                )
+                os.rmdir(mntpoint)
+
+    def _remove_loopback_device(self):
+        if self._fake_SD_path:
+            try:
+                loop_device.detach(self._fake_SD_path)
+            except EnvironmentError as e:
+                self.logger.debug('exception', exc_info=True)
+                raise RuntimeError(
+                    _('Cannot detach {device}: {error}').format(
+                        device=self._fake_SD_path,
+                        error=e,
+                    )
+                )
             self._fake_SD_path = None
         if self._fake_file:
             os.unlink(self._fake_file)
@@ -304,12 +294,9 @@ class Plugin(plugin.PluginBase):
         stage=plugin.Stages.STAGE_SETUP,
     )
     def _setup(self):
-        self.command.detect('truncate')
         self.command.detect('mkfs')
-        self.command.detect('losetup')
         self.command.detect('mount')
         self.command.detect('umount')
-        self.command.detect('chown')
 
     @plugin.event(
         stage=plugin.Stages.STAGE_VALIDATION,
@@ -628,14 +615,28 @@ class Plugin(plugin.PluginBase):
                 info[key] = response['info'][key]
         return info
 
+    def _fakeSDconList(self):
+        # We have to keep the loopback device mounted
+        # and use the real file path cause VDSM forcefully
+        # resolves it!
+        return [{
+            'connection': self._fake_file,
+            'spec': self._fake_file,
+            'vfsType': self.VFSTYPE,
+            'id': self.environment[
+                ohostedcons.StorageEnv.FAKE_MASTER_SD_CONNECTION_UUID
+            ],
+        }]
+
     def _storageServerConnection(self, disconnect=False):
-        method = self.cli.connectStorageServer
-        debug_msg = 'connectStorageServer'
-        if disconnect:
-            method = self.cli.disconnectStorageServer
-            debug_msg = 'disconnectStorageServer'
-        self.logger.debug(debug_msg)
-        spUUID = ohostedcons.Const.BLANK_UUID
+        """
+        Take, or drop on disconnect, a reference to the storage server
+        connections of the domain; the ones nobody holds anymore are
+        disconnected only at cleanup.
+        """
+        connections = self.environment[
+            ohostedcons.StorageEnv.SERVER_CONNECTIONS
+        ]
         conList = None
         if self.storageType in (
             ohostedcons.VDSMConstants.NFS_DOMAIN,
@@ -659,30 +660,26 @@ class Plugin(plugin.PluginBase):
         elif self.storageType in (
             ohostedcons.VDSMConstants.ISCSI_DOMAIN,
         ):
+            # one connection per path of the target, for multipath
             conList = [
-                {
-                    'connection': self.environment[
-                        ohostedcons.StorageEnv.ISCSI_IP_ADDR
-                    ],
-                    'iqn': self.environment[
+                storage_connections.iscsi_connection(
+                    iqn=self.environment[
                         ohostedcons.StorageEnv.ISCSI_TARGET
                     ],
-                    'portal': self.environment[
-                        ohostedcons.StorageEnv.ISCSI_PORTAL
-                    ],
-                    'user': self.environment[
+                    portal=portal,
+                    user=self.environment[
                         ohostedcons.StorageEnv.ISCSI_USER
                     ],
-                    'password': self.environment[
+                    password=self.environment[
                         ohostedcons.StorageEnv.ISCSI_PASSWORD
                     ],
-                    'id': self.environment[
+                    id=self.environment[
                         ohostedcons.StorageEnv.CONNECTION_UUID
                     ],
-                    'port': self.environment[
-                        ohostedcons.StorageEnv.ISCSI_PORT
-                    ],
-                }
+                )
+                for portal in storage_connections.iscsi_portals(
+                    self.environment
+                )
             ]
         elif self.storageType in (
                 ohostedcons.VDSMConstants.FC_DOMAIN,
@@ -692,47 +689,23 @@ class Plugin(plugin.PluginBase):
             raise RuntimeError(_('Invalid Storage Type'))
 
         if conList:
-            status = method(
-                self.storageType,
-                spUUID,
-                conList
-            )
-            self.logger.debug(status)
-            if status['status']['code'] != 0:
-                raise RuntimeError(status['status']['message'])
-            if not disconnect:
-                for con in status['statuslist']:
-                    if con['status'] != 0:
-                        raise RuntimeError(
-                            _('Connection to storage server failed')
-                        )
+            if disconnect:
+                connections.release(self.storageType, conList)
+            else:
+                connections.acquire(self.cli, self.storageType, conList)
 
         if self._fake_SD_path:
-            # We have to keep the loopback device mounted
-            # and use the real file path cause VDSM forcefully
-            # resolves it!
-            fakeSDconList = [{
-                'connection': self._fake_file,
-                'spec': self._fake_file,
-                'vfsType': self.VFSTYPE,
-                'id': self.environment[
-                    ohostedcons.StorageEnv.FAKE_MASTER_SD_CONNECTION_UUID
-                ],
-            }]
-            status = method(
-                ohostedcons.VDSMConstants.POSIXFS_DOMAIN,
-                spUUID,
-                fakeSDconList
-            )
-            self.logger.debug(status)
-            if status['status']['code'] != 0:
-                raise RuntimeError(status['status']['message'])
-            if not disconnect:
-                for con in status['statuslist']:
-                    if con['status'] != 0:
-                        raise RuntimeError(
-                            _('Connection to storage server failed')
-                        )
+            if disconnect:
+                connections.release(
+                    ohostedcons.VDSMConstants.POSIXFS_DOMAIN,
+                    self._fakeSDconList(),
+                )
+            else:
+                connections.acquire(
+                    self.cli,
+                    ohostedcons.VDSMConstants.POSIXFS_DOMAIN,
+                    self._fakeSDconList(),
+                )
 
     def _createStorageDomain(self):
         self.logger.debug('createStorageDomain')
@@ -1131,6 +1104,9 @@ class Plugin(plugin.PluginBase):
             ohostedcons.StorageEnv.FAKE_MASTER_SD_CONNECTION_UUID,
             str(uuid.uuid4())
         )
+        self.environment[
+            ohostedcons.StorageEnv.SERVER_CONNECTIONS
+        ] = storage_connections.ConnectionManager()
         self.environment.setdefault(
             ohostedcons.StorageEnv.SD_UUID,
             str(uuid.uuid4())
@@ -1165,6 +1141,10 @@ class Plugin(plugin.PluginBase):
             ohostedcons.StorageEnv.BDEVICE_SIZE_GB,
             None
         )
+        self.environment.setdefault(
+            ohostedcons.StorageEnv.AVAILABLE_SPACE_MB,
+            None
+        )
         self.environment.setdefault(
             ohostedcons.CoreEnv.ADDITIONAL_HOST_ENABLED,
             False
@@ -1314,6 +1294,12 @@ class Plugin(plugin.PluginBase):
         self.logger.info(_('Destroying Storage Pool'))
         self._destroyStoragePool()
         self._destroyFakeStorageDomain()
+        self.environment[
+            ohostedcons.StorageEnv.SERVER_CONNECTIONS
+        ].release(
+            ohostedcons.VDSMConstants.POSIXFS_DOMAIN,
+            self._fakeSDconList(),
+        )
         self._remove_loopback_device()
         self.logger.info(_('Start monitoring domain'))
         self._startMonitoringDomain()
@@ -1351,5 +1337,19 @@ class Plugin(plugin.PluginBase):
         if self._monitoring:
             self._stopMonitoringDomain()
 
+    @plugin.event(
+        stage=plugin.Stages.STAGE_CLEANUP,
+        priority=plugin.Stages.PRIORITY_LAST,
+        condition=lambda self: self.environment[
+            ohostedcons.VDSMEnv.VDS_CLI
+        ] is not None,
+    )
+    def _cleanup_connections(self):
+        self.environment[
+            ohostedcons.StorageEnv.SERVER_CONNECTIONS
+        ].disconnect_unused(
+            self.environment[ohostedcons.VDSMEnv.VDS_CLI]
+        )
+
 
 # vim: expandtab tabstop=4 shiftwidth=4
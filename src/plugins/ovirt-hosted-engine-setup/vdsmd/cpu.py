@@ -34,6 +34,7 @@ from ovirt_host_deploy import hardware
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import vds_info
 
 
 def _(m):
@@ -65,13 +66,10 @@ class Plugin(plugin.PluginBase):
         super(Plugin, self).__init__(context=context)
 
     def _getCompatibleCpuModels(self):
-        cli = self.environment[ohostedcons.VDSMEnv.VDS_CLI]
-        caps = cli.getVdsCapabilities()
-        if caps['status']['code'] != 0:
-            raise RuntimeError(caps['status']['message'])
-        cpuModel = caps['info']['cpuModel']
+        caps = vds_info.snapshot(self).caps
+        cpuModel = caps['cpuModel']
         cpuCompatibles = [
-            x for x in caps['info']['cpuFlags'].split(',')
+            x for x in caps['cpuFlags'].split(',')
             if x.startswith('model_')
         ]
         ret = (
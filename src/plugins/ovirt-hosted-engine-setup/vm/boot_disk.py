@@ -43,6 +43,7 @@ from otopi import util
 from ovirt_hosted_engine_ha.lib import heconflib
 from ovirt_hosted_engine_setup import constants as ohostedcons
 from ovirt_hosted_engine_setup import domains as ohosteddomains
+from ovirt_hosted_engine_setup import util as ohostedutil
 from ovirt_hosted_engine_setup.ovf import ovfenvelope
 
 
@@ -431,6 +432,37 @@ class Plugin(plugin.PluginBase):
         self.command.detect('sudo')
         self.command.detect('qemu-img')
 
+    def _validate_ovf(self, path):
+        if not self._check_ovf(path):
+            raise RuntimeError(
+                _(
+                    'The specified OVF archive is not '
+                    'readable. Please ensure that {filepath} '
+                    'could be read'
+                ).format(
+                    filepath=path,
+                )
+            )
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_LATE_SETUP,
+        condition=lambda self: (
+            self.environment[ohostedcons.VMEnv.OVF] is not None and
+            self.environment[ohostedcons.VMEnv.BOOT] == 'disk' and
+            self.environment[
+                ohostedcons.CoreEnv.IS_ADDITIONAL_HOST
+            ] is False
+        ),
+    )
+    def _late_setup(self):
+        path = self.environment[ohostedcons.VMEnv.OVF]
+        ohostedutil.register_validation(
+            self.environment,
+            'ovf',
+            path,
+            lambda: self._validate_ovf(path),
+        )
+
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
         after=(
@@ -527,7 +559,11 @@ class Plugin(plugin.PluginBase):
                             ohostedcons.VMEnv.OVF
                         ]),
                     )
-            valid = self._check_ovf(ova_path)
+            valid = ohostedutil.is_validated(
+                self.environment,
+                'ovf',
+                ova_path,
+            ) or self._check_ovf(ova_path)
             if valid:
                 self.environment[ohostedcons.VMEnv.OVF] = ova_path
             else:
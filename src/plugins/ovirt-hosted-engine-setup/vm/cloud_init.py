@@ -23,13 +23,12 @@ VM cloud-init configuration plugin.
 """
 
 
-import ethtool
+import collections
 import gettext
 import netaddr
 import os
 import pwd
 import re
-import shutil
 import socket
 import tempfile
 
@@ -39,7 +38,10 @@ from otopi import plugin
 from otopi import util
 
 
+from ovirt_hosted_engine_setup import cloud_config
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import iso9660
+from ovirt_hosted_engine_setup import netlink
 from ovirt_hosted_engine_setup import util as ohostedutil
 
 
@@ -53,25 +55,17 @@ class Plugin(plugin.PluginBase):
     VM cloud-init configuration plugin.
     """
 
+    FREE_IP_SCAN_BATCH = 32
+    # TODO: find a way to properly get this at runtime
+    # see: https://bugzilla.redhat.com/1228215
+    INTERFACE_NAME = 'eth0'
+
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
         self._enable = False
-        self._directory_name = None
-
-    # TODO: Fix to support also IPv6
-    _INET_ADDRESS_RE = re.compile(
-        flags=re.VERBOSE,
-        pattern=r"""
-            \s+
-            inet
-            \s
-            (?P<address>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}/\d{1,2})
-            .+
-            \s+
-            (?P<interface>[a-zA-Z0-9_.]+)
-            $
-    """
-    )
+        self._seed_iso = None
+        self._host_ip = None
+        self._user_data_cache = {}
 
     def _validate_ip_cidr(self, ipcidr):
         try:
@@ -104,10 +98,11 @@ class Plugin(plugin.PluginBase):
         )
 
     def _getMyIPAddress(self):
+        info = netlink.snapshot(self)
         device = (
             self.environment[ohostedcons.NetworkEnv.BRIDGE_NAME]
             if self.environment[ohostedcons.NetworkEnv.BRIDGE_NAME]
-            in ethtool.get_devices()
+            in info.devices()
             else self.environment[ohostedcons.NetworkEnv.BRIDGE_IF]
         )
         self.logger.debug(
@@ -115,19 +110,8 @@ class Plugin(plugin.PluginBase):
                 device=device,
             )
         )
-        rc, stdout, stderr = self.execute(
-            args=(
-                self.command.get('ip'),
-                'addr',
-                'show',
-                device,
-            ),
-        )
-        for line in stdout:
-            addressmatch = self._INET_ADDRESS_RE.match(line)
-            if addressmatch is not None:
-                address = addressmatch.group('address')
-                break
+        addresses = info.device_addresses(device)
+        address = addresses[0] if addresses else None
         self.logger.debug('address: ' + str(address))
 
         if address is None:
@@ -143,12 +127,54 @@ class Plugin(plugin.PluginBase):
         return ipna
 
     def _getFreeIPAddress(self, myip):
-        myipna = netaddr.IPNetwork(myip)
-        for ip in myipna.iter_hosts():
-            if ip != myip.ip:
-                if not ohostedutil.check_is_pingable(self, ip):
-                    return ip
-        return ''
+        """
+        Look for an unused address in the subnet of myip.
+        Addresses already resolved in the neighbour table are in use and
+        are skipped, the others are pinged together a batch at a time.
+        Pinging triggers the link address resolution too, so an address
+        that does not answer but gets resolved is just filtering ICMP.
+        Return the first free address and the confidence on it: 'high' if
+        the link address resolution failed as well, 'low' otherwise.
+        Only IPv4 subnets are scanned: neither the neighbour table nor the
+        ICMP probe cover IPv6.
+        """
+        if myip.version != 4:
+            self.logger.debug(
+                'Not proposing a free address in {subnet}'.format(
+                    subnet=myip.cidr,
+                )
+            )
+            return '', None
+        excluded = set([
+            str(myip.ip),
+            str(self.environment[ohostedcons.NetworkEnv.GATEWAY]),
+        ])
+        hosts = netaddr.IPNetwork(myip).iter_hosts()
+        nl = netlink.Netlink()
+        try:
+            # the table read after pinging a batch also filters the next one
+            neighbours = nl.neighbours()
+            while True:
+                batch = []
+                for ip in hosts:
+                    if (
+                        str(ip) not in excluded and
+                        not neighbours.get(str(ip))
+                    ):
+                        batch.append(ip)
+                        if len(batch) == self.FREE_IP_SCAN_BATCH:
+                            break
+                if not batch:
+                    return '', None
+                pingable = ohostedutil.check_are_pingable(self, batch)
+                neighbours = nl.neighbours()
+                for ip in batch:
+                    if not pingable[ip]:
+                        resolved = neighbours.get(str(ip))
+                        if not resolved:
+                            return ip, 'high' if resolved is False else 'low'
+        finally:
+            nl.close()
 
     def _msg_validate_ip_cidr(self, proposed_cidr):
         if not self._validate_ip_cidr(proposed_cidr):
@@ -233,7 +259,15 @@ class Plugin(plugin.PluginBase):
                 ]
             if static:
                 if interactive:
-                    default_ip = str(self._getFreeIPAddress(my_ip))
+                    default_ip, confidence = self._getFreeIPAddress(my_ip)
+                    self.logger.debug(
+                        'Proposing {ip} as free address, '
+                        'confidence: {confidence}'.format(
+                            ip=default_ip,
+                            confidence=confidence,
+                        )
+                    )
+                    default_ip = str(default_ip)
                     proposed_ip = self.dialog.queryString(
                         name='CLOUDINIT_VM_STATIC_IP_ADDRESS',
                         note=_(
@@ -400,12 +434,6 @@ class Plugin(plugin.PluginBase):
             None
         )
 
-    @plugin.event(
-        stage=plugin.Stages.STAGE_SETUP,
-    )
-    def _setup(self):
-        self.command.detect('genisoimage')
-
     @plugin.event(
         stage=plugin.Stages.STAGE_CUSTOMIZATION,
         after=(
@@ -677,173 +705,199 @@ class Plugin(plugin.PluginBase):
                 default=_('No')
             ) == _('Yes').lower()
 
-    @plugin.event(
-        stage=plugin.Stages.STAGE_MISC,
-        condition=lambda self: self._enable,
-    )
-    def _misc(self):
-        # TODO: find a way to properly get this at runtime
-        # see: https://bugzilla.redhat.com/1228215
-        _interface_name = 'eth0'
-
-        self._directory_name = tempfile.mkdtemp()
-        user_data = (
-            '#cloud-config\n'
-            '# vim: syntax=yaml\n'
+    def _get_host_ip(self):
+        # the address moves from the nic to the bridge while the seed may
+        # be written, read it once
+        if self._host_ip is None:
+            self._host_ip = str(self._getMyIPAddress().ip)
+        return self._host_ip
+
+    def _user_data_key(self):
+        key = tuple(
+            self.environment[k] for k in (
+                ohostedcons.CloudInit.ROOTPWD,
+                ohostedcons.CloudInit.VM_ETC_HOSTS,
+                ohostedcons.CloudInit.VM_STATIC_CIDR,
+                ohostedcons.CloudInit.INSTANCE_HOSTNAME,
+                ohostedcons.CloudInit.INSTANCE_DOMAINNAME,
+                ohostedcons.CloudInit.VM_DNS,
+                ohostedcons.CloudInit.EXECUTE_ESETUP,
+                ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN,
+                ohostedcons.EngineEnv.ADMIN_PASSWORD,
+            )
         )
-        f_user_data = os.path.join(self._directory_name, 'user-data')
+        if self.environment[ohostedcons.CloudInit.VM_ETC_HOSTS]:
+            key += (self._get_host_ip(), socket.gethostname())
+        return key
+
+    def _build_user_data(self):
+        config = cloud_config.CloudConfig()
         if self.environment[ohostedcons.CloudInit.ROOTPWD]:
             # TODO: use salted hashed password
-            user_data += (
-                'ssh_pwauth: True\n'
-                'chpasswd:\n'
-                '  list: |\n'
-                '    root:{password}\n'
-                '  expire: False\n'
-            ).format(
-                password=self.environment[
-                    ohostedcons.CloudInit.ROOTPWD
-                ],
+            config.set('ssh_pwauth', True)
+            config.set(
+                'chpasswd',
+                collections.OrderedDict((
+                    (
+                        'list',
+                        'root:{password}\n'.format(
+                            password=self.environment[
+                                ohostedcons.CloudInit.ROOTPWD
+                            ],
+                        ),
+                    ),
+                    ('expire', False),
+                )),
             )
 
-        if (
-            self.environment[
-                ohostedcons.CloudInit.VM_ETC_HOSTS
-            ] or
-            self.environment[
-                ohostedcons.CloudInit.VM_STATIC_CIDR
-            ]
-        ):
-            user_data += (
-                'bootcmd:\n'
+        if self.environment[ohostedcons.CloudInit.VM_ETC_HOSTS]:
+            config.bootcmd(
+                'echo "{myip} {myfqdn}" >> /etc/hosts'.format(
+                    myip=self._get_host_ip(),
+                    # TODO: manage the hostname in the environment
+                    myfqdn=socket.gethostname(),
+                )
             )
-
             if self.environment[
-                ohostedcons.CloudInit.VM_ETC_HOSTS
+                ohostedcons.CloudInit.VM_STATIC_CIDR
+            ] and self.environment[
+                ohostedcons.CloudInit.INSTANCE_HOSTNAME
             ]:
-                user_data += (
-                    ' - echo "{myip} {myfqdn}" >> /etc/hosts\n'
-                ).format(
-                    myip=self._getMyIPAddress().ip,
-                    # TODO: manage the hostname in the environment
-                    myfqdn=socket.gethostname(),
+                ip = netaddr.IPNetwork(
+                    self.environment[ohostedcons.CloudInit.VM_STATIC_CIDR]
                 )
-                if self.environment[
-                    ohostedcons.CloudInit.VM_STATIC_CIDR
-                ] and self.environment[
-                    ohostedcons.CloudInit.INSTANCE_HOSTNAME
-                ]:
-                    ip = netaddr.IPNetwork(
-                        self.environment[ohostedcons.CloudInit.VM_STATIC_CIDR]
-                    )
-                    user_data += (
-                        ' - echo "{ip} {fqdn}" >> /etc/hosts\n'
-                    ).format(
+                config.bootcmd(
+                    'echo "{ip} {fqdn}" >> /etc/hosts'.format(
                         ip=ip.ip,
                         fqdn=self.environment[
                             ohostedcons.CloudInit.INSTANCE_HOSTNAME
                         ],
                     )
+                )
 
-            # Due to a cloud-init bug
-            # (https://bugs.launchpad.net/cloud-init/+bug/1225922)
-            # we have to deactivate and reactive the interface just after
-            # the boot on static IP configurations
-            if self.environment[
-                ohostedcons.CloudInit.VM_STATIC_CIDR
-            ]:
-
-                if self.environment[ohostedcons.CloudInit.VM_DNS]:
-                    fname = (
-                        '/etc/sysconfig/network-scripts/ifcfg-{iname}'.format(
-                            iname=_interface_name
-                        )
-                    )
-                    dnslist = [
-                        d.strip()
-                        for d
-                        in self.environment[
-                            ohostedcons.CloudInit.VM_DNS
-                        ].split(',')
-                    ]
-                    dn = 1
-                    for dns in dnslist:
-                        user_data += ' - echo "DNS{dn}={dns}" >> {f}\n'.format(
+        # Due to a cloud-init bug
+        # (https://bugs.launchpad.net/cloud-init/+bug/1225922)
+        # we have to deactivate and reactive the interface just after
+        # the boot on static IP configurations
+        if self.environment[ohostedcons.CloudInit.VM_STATIC_CIDR]:
+            fname = '/etc/sysconfig/network-scripts/ifcfg-{iname}'.format(
+                iname=self.INTERFACE_NAME,
+            )
+            if self.environment[ohostedcons.CloudInit.VM_DNS]:
+                dnslist = [
+                    d.strip()
+                    for d
+                    in self.environment[
+                        ohostedcons.CloudInit.VM_DNS
+                    ].split(',')
+                ]
+                for dn, dns in enumerate(dnslist, 1):
+                    config.bootcmd(
+                        'echo "DNS{dn}={dns}" >> {f}'.format(
                             dn=dn,
                             dns=dns,
                             f=fname,
                         )
-                        dn += 1
-                    if self.environment[
-                        ohostedcons.CloudInit.INSTANCE_DOMAINNAME
-                    ]:
-                        user_data += ' - echo "DOMAIN={d}" >> {f}\n'.format(
+                    )
+                if self.environment[
+                    ohostedcons.CloudInit.INSTANCE_DOMAINNAME
+                ]:
+                    config.bootcmd(
+                        'echo "DOMAIN={d}" >> {f}'.format(
                             d=self.environment[
                                 ohostedcons.CloudInit.INSTANCE_DOMAINNAME
                             ],
                             f=fname,
                         )
-                user_data += (
-                    ' - ifdown {iname}\n'
-                    ' - ifup {iname}\n'
-                ).format(iname=_interface_name)
+                    )
+            config.bootcmd('ifdown {iname}'.format(iname=self.INTERFACE_NAME))
+            config.bootcmd('ifup {iname}'.format(iname=self.INTERFACE_NAME))
 
         if self.environment[ohostedcons.CloudInit.EXECUTE_ESETUP]:
-            org = 'Test'
-            if '.' in self.environment[
+            fqdn = self.environment[
                 ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
-            ]:
-                org = self.environment[
-                    ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
-                ].split('.', 1)[1]
-
-            user_data += (
-                'write_files:\n'
-                ' - content: |\n'
-                '     [environment:default]\n'
-                '     OVESETUP_CONFIG/adminPassword=str:{password}\n'
-                '     OVESETUP_CONFIG/fqdn=str:{fqdn}\n'
-                '     OVESETUP_PKI/organization=str:{org}\n'
-                '   path: {heanswers}\n'
-                '   owner: root:root\n'
-                '   permissions: \'0640\'\n'
-                'runcmd:\n'
-                ' - /usr/bin/engine-setup --offline'
+            ]
+            org = fqdn.split('.', 1)[1] if '.' in fqdn else 'Test'
+            port = (
+                ohostedcons.Const.VIRTIO_PORTS_PATH +
+                ohostedcons.Const.OVIRT_HE_CHANNEL_NAME
+            )
+            config.write_file(
+                path=ohostedcons.Const.CLOUD_INIT_HEANSWERS,
+                content=(
+                    '[environment:default]\n'
+                    'OVESETUP_CONFIG/adminPassword=str:{password}\n'
+                    'OVESETUP_CONFIG/fqdn=str:{fqdn}\n'
+                    'OVESETUP_PKI/organization=str:{org}\n'
+                ).format(
+                    password=self.environment[
+                        ohostedcons.EngineEnv.ADMIN_PASSWORD
+                    ],
+                    fqdn=fqdn,
+                    org=org,
+                ),
+                owner='root:root',
+                permissions='0640',
+            )
+            config.runcmd(
+                '/usr/bin/engine-setup --offline'
                 ' --config-append={applianceanswers}'
                 ' --config-append={heanswers}'
                 ' 1>{port}'
-                ' 2>&1\n'
-                ' - if [ $? -eq 0 ];'
+                ' 2>&1'.format(
+                    applianceanswers=(
+                        ohostedcons.Const.CLOUD_INIT_APPLIANCEANSWERS
+                    ),
+                    heanswers=ohostedcons.Const.CLOUD_INIT_HEANSWERS,
+                    port=port,
+                )
+            )
+            config.runcmd(
+                'if [ $? -eq 0 ];'
                 ' then echo "{success_string}" >{port};'
                 ' else echo "{fail_string}" >{port};'
-                ' fi\n'
-                ' - rm {heanswers}\n'
-            ).format(
-                fqdn=self.environment[
-                    ohostedcons.NetworkEnv.OVIRT_HOSTED_ENGINE_FQDN
-                ],
-                org=org,
-                password=self.environment[
-                    ohostedcons.EngineEnv.ADMIN_PASSWORD
-                ],
-                applianceanswers=ohostedcons.Const.CLOUD_INIT_APPLIANCEANSWERS,
-                heanswers=ohostedcons.Const.CLOUD_INIT_HEANSWERS,
-                port=(
-                    ohostedcons.Const.VIRTIO_PORTS_PATH +
-                    ohostedcons.Const.OVIRT_HE_CHANNEL_NAME
-                ),
-                success_string=ohostedcons.Const.E_SETUP_SUCCESS_STRING,
-                fail_string=ohostedcons.Const.E_SETUP_FAIL_STRING,
+                ' fi'.format(
+                    success_string=ohostedcons.Const.E_SETUP_SUCCESS_STRING,
+                    fail_string=ohostedcons.Const.E_SETUP_FAIL_STRING,
+                    port=port,
+                )
             )
+            config.runcmd(
+                'rm {heanswers}'.format(
+                    heanswers=ohostedcons.Const.CLOUD_INIT_HEANSWERS,
+                )
+            )
+        return config.render()
+
+    def _user_data(self):
+        """
+        Return the rendered user-data, built again only if the answers
+        it depends on changed.
+        """
+        key = self._user_data_key()
+        if key not in self._user_data_cache:
+            self._user_data_cache = {key: self._build_user_data()}
+        return self._user_data_cache[key]
 
-        f = open(f_user_data, 'w')
-        f.write(user_data)
-        f.close()
-
+    @plugin.event(
+        stage=plugin.Stages.STAGE_VALIDATION,
+        condition=lambda self: self._enable,
+    )
+    def _validation(self):
+        self._user_data()
+        # the seed does not need the network, write it while the
+        # management bridge is being configured
+        tasks = self.environment[ohostedcons.NetworkEnv.BRIDGE_SETUP_TASKS]
+        if self._write_seed not in tasks:
+            tasks.append(self._write_seed)
+
+    def _write_seed(self):
+        if self._seed_iso is not None:
+            return
+        user_data = self._user_data()
         meta_data = 'instance-id: {instance}\n'.format(
             instance=self.environment[ohostedcons.VMEnv.VM_UUID],
         )
-        f_meta_data = os.path.join(self._directory_name, 'meta-data')
         if self.environment[ohostedcons.CloudInit.INSTANCE_HOSTNAME]:
             meta_data += (
                 'local-hostname: {hostname}\n'
@@ -877,53 +931,51 @@ class Plugin(plugin.PluginBase):
                 gateway=self.environment[
                     ohostedcons.NetworkEnv.GATEWAY
                 ],
-                iname=_interface_name,
+                iname=self.INTERFACE_NAME,
             )
 
-        f = open(f_meta_data, 'w')
-        f.write(meta_data)
-        f.close()
-
-        f_cloud_init_iso = os.path.join(self._directory_name, 'seed.iso')
-        rc, stdout, stderr = self.execute(
-            (
-                self.command.get('genisoimage'),
-                '-output',
-                f_cloud_init_iso,
-                '-volid',
-                'cidata',
-                '-joliet',
-                '-rock',
-                '-input-charset',
-                'utf-8',
-                f_meta_data,
-                f_user_data,
-            )
-        )
-        if rc != 0:
-            raise RuntimeError(_('Error generating cloud-init ISO image'))
-        os.unlink(f_meta_data)
-        os.unlink(f_user_data)
-        self.environment[ohostedcons.VMEnv.CDROM] = f_cloud_init_iso
-        os.chown(
-            self._directory_name,
-            pwd.getpwnam('qemu').pw_uid,
-            pwd.getpwnam('qemu').pw_uid,
+        fd, self._seed_iso = tempfile.mkstemp(
+            prefix='seed',
+            suffix='.iso',
         )
-        os.chmod(f_cloud_init_iso, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(
+                iso9660.build(
+                    {
+                        'meta-data': meta_data,
+                        'user-data': user_data,
+                    },
+                    'cidata',
+                )
+            )
         os.chown(
-            f_cloud_init_iso,
+            self._seed_iso,
             pwd.getpwnam('qemu').pw_uid,
             pwd.getpwnam('qemu').pw_uid,
         )
+        self.environment[ohostedcons.VMEnv.CDROM] = self._seed_iso
+
+    @plugin.event(
+        stage=plugin.Stages.STAGE_MISC,
+        condition=lambda self: self._enable,
+        after=(
+            ohostedcons.Stages.BRIDGE_AVAILABLE,
+        ),
+        before=(
+            ohostedcons.Stages.VM_CONFIGURED,
+        ),
+    )
+    def _misc(self):
+        # already written if the bridge has been configured
+        self._write_seed()
 
     @plugin.event(
         stage=plugin.Stages.STAGE_CLEANUP,
         condition=lambda self: self._enable,
     )
     def _cleanup(self):
-        if self._directory_name is not None:
-            shutil.rmtree(self._directory_name)
+        if self._seed_iso is not None and os.path.exists(self._seed_iso):
+            os.unlink(self._seed_iso)
         self.environment[ohostedcons.VMEnv.CDROM] = None
 
 
@@ -31,6 +31,7 @@ from otopi import util
 
 
 from ovirt_hosted_engine_setup import constants as ohostedcons
+from ovirt_hosted_engine_setup import vds_info
 
 
 def _(m):
@@ -47,11 +48,7 @@ class Plugin(plugin.PluginBase):
         super(Plugin, self).__init__(context=context)
 
     def _getMaxVCpus(self):
-        cli = self.environment[ohostedcons.VDSMEnv.VDS_CLI]
-        caps = cli.getVdsCapabilities()
-        if caps['status']['code'] != 0:
-            raise RuntimeError(caps['status']['message'])
-        return caps['info']['cpuCores']
+        return vds_info.snapshot(self).caps['cpuCores']
 
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
@@ -32,8 +32,8 @@ from otopi import util
 
 
 from ovirt_hosted_engine_ha.lib import heconflib
+from ovirt_hosted_engine_setup import capacity as ohostedcapacity
 from ovirt_hosted_engine_setup import constants as ohostedcons
-from ovirt_hosted_engine_setup import domains as ohosteddomains
 
 
 def _(m):
@@ -49,6 +49,16 @@ class Plugin(plugin.PluginBase):
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
 
+    def _plan(self):
+        return ohostedcapacity.Plan(
+            domain_type=self.environment[
+                ohostedcons.StorageEnv.DOMAIN_TYPE
+            ],
+            conf_image_size_gb=self.environment[
+                ohostedcons.StorageEnv.CONF_IMAGE_SIZE_GB
+            ],
+        )
+
     @plugin.event(
         stage=plugin.Stages.STAGE_INIT,
     )
@@ -90,14 +100,15 @@ class Plugin(plugin.PluginBase):
 
         estimate_gb = None
         if self.environment[
-            ohostedcons.StorageEnv.BDEVICE_SIZE_GB
+            ohostedcons.StorageEnv.AVAILABLE_SPACE_MB
         ] is not None:
-            # Conservative estimate, the exact value could be gathered from
-            # vginfo but at this point the VG has still has to be created.
-            # Later on it will be checked against the real value
-            estimate_gb = int(self.environment[
-                ohostedcons.StorageEnv.BDEVICE_SIZE_GB
-            ]) - ohostedcons.Const.STORAGE_DOMAIN_OVERHEAD_GIB
+            # Conservative estimate, the storage domain has still to be
+            # created. Later on it will be checked against the real value
+            estimate_gb = self._plan().max_image_size_gb(
+                int(self.environment[
+                    ohostedcons.StorageEnv.AVAILABLE_SPACE_MB
+                ]) * ohostedcapacity.MiB
+            )
 
         valid = False
         while not valid:
@@ -197,37 +208,6 @@ class Plugin(plugin.PluginBase):
         volUUID = self.environment[ohostedcons.StorageEnv.VOL_UUID]
         cli = self.environment[ohostedcons.VDSMEnv.VDS_CLI]
 
-        if self.environment[ohostedcons.StorageEnv.DOMAIN_TYPE] in (
-            ohostedcons.DomainTypes.ISCSI,
-            ohostedcons.DomainTypes.FC,
-        ):
-            # Checking the available space on VG where
-            # we have to preallocate the image
-            vginfo = cli.getVGInfo(
-                self.environment[ohostedcons.StorageEnv.VG_UUID]
-            )
-            self.logger.debug(vginfo)
-            if vginfo['status']['code'] != 0:
-                raise RuntimeError(vginfo['status']['message'])
-            vgfree = int(vginfo['info']['vgfree'])
-            available_gb = vgfree / pow(2, 30)
-            required_size = int(self.environment[
-                ohostedcons.StorageEnv.IMAGE_SIZE_GB
-            ]) + int(self.environment[
-                ohostedcons.StorageEnv.CONF_IMAGE_SIZE_GB
-            ])
-            if required_size > available_gb:
-                raise ohosteddomains.InsufficientSpaceError(
-                    _(
-                        'Error: the VG on block device has capacity of only '
-                        '{available_gb} GiB while '
-                        '{required_size} GiB is required for the image'
-                    ).format(
-                        available_gb=available_gb,
-                        required_size=required_size,
-                    )
-                )
-
         self.logger.info(_('Creating VM Image'))
         self.logger.debug('createVolume')
         volFormat = ohostedcons.VolumeFormat.RAW_FORMAT
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""
+Startup benchmark: time spent importing every setup plugin module, as
+otopi does before the first prompt, and the time each of the SDKs the
+plugins import lazily would add to it.
+Fails if loading the plugins imports any of those SDKs.
+Run from the source tree:
+
+    PYTHONPATH=src python tests/startup_benchmark.py
+"""
+
+
+import imp
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+PLUGINS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'src',
+    'plugins',
+    'ovirt-hosted-engine-setup',
+)
+LAZY_MODULES = (
+    'ovirtsdk.api',
+    'paramiko',
+    'M2Crypto',
+    'libxml2',
+)
+PLUGINS = 'plugins'
+REPEAT = 5
+
+
+def load_plugins():
+    index = 0
+    for dirpath, dirnames, filenames in sorted(os.walk(PLUGINS_DIR)):
+        for filename in sorted(filenames):
+            if filename.endswith('.py') and filename != '__init__.py':
+                imp.load_source(
+                    '_startup_benchmark_%d' % index,
+                    os.path.join(dirpath, filename),
+                )
+                index += 1
+
+
+def child(target):
+    """
+    Import target in this fresh interpreter and report how long it took
+    and which of the lazily imported modules got loaded.
+    """
+    start = time.time()
+    if target == PLUGINS:
+        load_plugins()
+    else:
+        __import__(target)
+    elapsed = time.time() - start
+    json.dump(
+        {
+            'elapsed': elapsed,
+            'loaded': [m for m in LAZY_MODULES if m in sys.modules],
+        },
+        sys.stdout,
+    )
+
+
+def measure(target):
+    """
+    Return the best import time of target out of REPEAT fresh
+    interpreters and the lazily imported modules it loaded.
+    Raise RuntimeError with the error of the child if it cannot be
+    imported.
+    """
+    best = None
+    for i in range(REPEAT):
+        p = subprocess.Popen(
+            (sys.executable, os.path.abspath(__file__), target),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr = p.communicate()
+        if p.returncode != 0:
+            raise RuntimeError(stderr.decode('utf-8').strip())
+        result = json.loads(stdout.decode('utf-8'))
+        if best is None or result['elapsed'] < best['elapsed']:
+            best = result
+    return best
+
+
+def main():
+    try:
+        plugins = measure(PLUGINS)
+    except RuntimeError as e:
+        sys.exit('Cannot load the plugins:\n%s' % e)
+    print(
+        '{name:16} {msec:8.1f} msec'.format(
+            name=PLUGINS,
+            msec=plugins['elapsed'] * 1000,
+        )
+    )
+    for module in LAZY_MODULES:
+        try:
+            msec = '%8.1f msec' % (measure(module)['elapsed'] * 1000)
+        except RuntimeError:
+            msec = 'not available'
+        print('{name:16} {msec}'.format(name=module, msec=msec))
+    if plugins['loaded']:
+        sys.exit(
+            'Loading the plugins imports: %s' % ', '.join(plugins['loaded'])
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        child(sys.argv[1])
+    else:
+        main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
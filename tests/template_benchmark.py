@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#
+# ovirt-hosted-engine-setup -- ovirt hosted engine setup
+# Copyright (C) 2016 Red Hat, Inc.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+
+
+"""
+Micro-benchmark of the template rendering against the per placeholder
+str.replace() implementation it replaced.
+Run from the source tree:
+
+    PYTHONPATH=src python tests/template_benchmark.py
+"""
+
+
+import os
+import re
+import sys
+import timeit
+
+
+from ovirt_hosted_engine_setup import template
+
+
+TEMPLATES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'templates',
+)
+TEMPLATES = (
+    'vm.conf.in',
+    'hosted-engine.conf.in',
+)
+NUMBER = 10000
+
+
+def legacy_process_template(path, subst):
+    content = ''
+    with open(path, 'r') as f:
+        content = f.read()
+    for k, v in subst.items():
+        content = content.replace(str(k), str(v))
+    return content
+
+
+def main():
+    for name in TEMPLATES:
+        path = os.path.join(TEMPLATES_DIR, name)
+        with open(path, 'r') as f:
+            subst = dict(
+                (placeholder, placeholder.strip('@').lower())
+                for placeholder in re.findall(r'@[A-Za-z0-9_]+@', f.read())
+            )
+        if (
+            template.load(path).render(subst) !=
+            legacy_process_template(path, subst)
+        ):
+            sys.exit('%s: rendering differs' % name)
+        for label, func in (
+            ('str.replace', legacy_process_template),
+            ('compiled', lambda p, s: template.load(p).render(s)),
+        ):
+            elapsed = min(
+                timeit.repeat(
+                    lambda: func(path, subst),
+                    number=NUMBER,
+                    repeat=3,
+                )
+            )
+            print(
+                '{name:24} {placeholders:3} placeholders {label:12} '
+                '{usec:8.2f} usec/render'.format(
+                    name=name,
+                    placeholders=len(subst),
+                    label=label,
+                    usec=elapsed * 1000000 / NUMBER,
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4